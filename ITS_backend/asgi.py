@@ -13,4 +13,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ITS_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from core.websockets import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # WebSockets (ws/bookings/<id>/) are served outside Django's HTTP stack
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
+
+# Persist live vehicle locations and position history write-behind
+# while the server is running
+from core.history import history_buffer  # noqa: E402
+from core.live_state import live_store  # noqa: E402
+from core.roads import eta_engine  # noqa: E402
+
+live_store.start_flusher()
+history_buffer.start_flusher()
+
+# Load the road graph (if configured) and build its ETA tables now rather
+# than on the first request
+eta_engine.warm()
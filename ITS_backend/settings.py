@@ -130,6 +130,136 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id",
 }
 
+# Authenticated users cached per process (core/user_cache.py); TTL 0 disables
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", 1024))
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", 60))
+# Answer role permission checks from the token's role claim (core/authentication.py).
+# Saves the user query, but a user demoted or deleted through another worker
+# keeps their role there until the access token expires (ACCESS_TOKEN_LIFETIME),
+# so it is opt-in.
+AUTH_TRUST_ROLE_CLAIM = os.getenv("AUTH_TRUST_ROLE_CLAIM", "False") == "True"
+# Verified access tokens kept per process (core/token_cache.py); 0 disables
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 4096))
+# Password hashing threads and how many more hashes may wait (core/hashing.py); 0 workers hashes inline
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", 2))
+AUTH_HASH_QUEUE_SIZE = int(os.getenv("AUTH_HASH_QUEUE_SIZE", 32))
+AUTH_HASH_RETRY_AFTER = int(os.getenv("AUTH_HASH_RETRY_AFTER", 1))  # seconds
+
+# One-time passwords (core/otp_store.py). The in-memory store is per process;
+# use core.otp_store.SQLiteOTPStore when running several workers.
+OTP_STORE_BACKEND = os.getenv("OTP_STORE_BACKEND", "core.otp_store.InMemoryOTPStore")
+OTP_STORE_PATH = os.getenv("OTP_STORE_PATH", str(BASE_DIR / "otp_store.sqlite3"))
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", 600))
+OTP_SWEEP_SECONDS = int(os.getenv("OTP_SWEEP_SECONDS", 60))
+
+# --------------------------------------------------
+# GPS Ingestion
+# --------------------------------------------------
+GPS_BATCH_MAX_FIXES = int(os.getenv("GPS_BATCH_MAX_FIXES", 500))
+
+# Live vehicle state is persisted write-behind: at most this many seconds
+# (or this many pending vehicles) of fixes can be lost on a crash.
+GPS_LIVE_STATE_FLUSH_INTERVAL = float(os.getenv("GPS_LIVE_STATE_FLUSH_INTERVAL", 5))
+GPS_LIVE_STATE_MAX_DIRTY = int(os.getenv("GPS_LIVE_STATE_MAX_DIRTY", 500))
+
+# Recently applied (imei, timestamp, seq) keys remembered to drop retransmits
+GPS_DEDUPE_WINDOW = int(os.getenv("GPS_DEDUPE_WINDOW", 50000))
+# Fixes stamped further than this ahead of server time are rejected (seconds)
+GPS_MAX_FUTURE_SKEW = int(os.getenv("GPS_MAX_FUTURE_SKEW", 300))
+
+# Optional bounded queue between device endpoints and the DB (202 + workers)
+GPS_INGEST_ASYNC = os.getenv("GPS_INGEST_ASYNC", "False") == "True"
+GPS_INGEST_QUEUE_SIZE = int(os.getenv("GPS_INGEST_QUEUE_SIZE", 10000))   # fixes/scans, not requests
+# Each IMEI always goes to the same worker; more than one only helps on a
+# DB with concurrent writers (not SQLite)
+GPS_INGEST_WORKERS = int(os.getenv("GPS_INGEST_WORKERS", 1))
+GPS_INGEST_BATCH_SIZE = int(os.getenv("GPS_INGEST_BATCH_SIZE", 200))
+GPS_INGEST_OVERFLOW = os.getenv("GPS_INGEST_OVERFLOW", "reject")   # reject | drop_oldest
+GPS_INGEST_RETRY_AFTER = int(os.getenv("GPS_INGEST_RETRY_AFTER", 1))  # seconds
+# Failed batches: retries with exponential backoff, then the dead-letter list
+GPS_INGEST_MAX_RETRIES = int(os.getenv("GPS_INGEST_MAX_RETRIES", 3))
+GPS_INGEST_RETRY_BACKOFF = float(os.getenv("GPS_INGEST_RETRY_BACKOFF", 0.5))  # seconds
+GPS_INGEST_DEAD_LETTERS = int(os.getenv("GPS_INGEST_DEAD_LETTERS", 100))     # batches kept
+
+# Position history (PositionFix) rows are inserted in batches
+GPS_HISTORY_FLUSH_INTERVAL = float(os.getenv("GPS_HISTORY_FLUSH_INTERVAL", 2))
+GPS_HISTORY_BATCH_SIZE = int(os.getenv("GPS_HISTORY_BATCH_SIZE", 1000))
+GPS_HISTORY_MAX_PENDING = int(os.getenv("GPS_HISTORY_MAX_PENDING", 100000))  # rows kept while the DB is down
+
+# Overspeed episodes: one Offence per stretch of speeding
+GPS_OVERSPEED_MIN_DURATION = float(os.getenv("GPS_OVERSPEED_MIN_DURATION", 5))        # seconds
+GPS_OVERSPEED_EXIT_HYSTERESIS = float(os.getenv("GPS_OVERSPEED_EXIT_HYSTERESIS", 5))  # km/h below limit
+GPS_OVERSPEED_MAX_GAP = float(os.getenv("GPS_OVERSPEED_MAX_GAP", 120))                # seconds
+
+# Socket listeners (manage.py gps_tcp_server / gps_udp_server) batch fixes
+# before applying them
+GPS_SOCKET_BATCH_SIZE = int(os.getenv("GPS_SOCKET_BATCH_SIZE", 200))
+GPS_SOCKET_FLUSH_INTERVAL = float(os.getenv("GPS_SOCKET_FLUSH_INTERVAL", 1))
+GPS_TCP_PORT = int(os.getenv("GPS_TCP_PORT", 5023))
+GPS_TCP_IDLE_TIMEOUT = float(os.getenv("GPS_TCP_IDLE_TIMEOUT", 600))
+GPS_TCP_MAX_PENDING = int(os.getenv("GPS_TCP_MAX_PENDING", 10000))   # stop reading sockets past this
+GPS_UDP_PORT = int(os.getenv("GPS_UDP_PORT", 5024))
+GPS_UDP_MAX_PENDING = int(os.getenv("GPS_UDP_MAX_PENDING", 10000))
+GPS_UDP_DEDUPE_WINDOW = int(os.getenv("GPS_UDP_DEDUPE_WINDOW", 50000))
+
+# Live position stream (public/buses/stream/, needs ASGI). Streams are closed
+# after GPS_STREAM_MAX_SECONDS; EventSource clients reconnect on their own.
+GPS_STREAM_KEEPALIVE = float(os.getenv("GPS_STREAM_KEEPALIVE", 15))       # seconds
+GPS_STREAM_MAX_SECONDS = float(os.getenv("GPS_STREAM_MAX_SECONDS", 300))
+
+# Pub/sub behind the SSE stream and the booking WebSocket. The in-memory
+# backend only reaches subscribers in the same process; use
+# core.pubsub.RedisBackend when ingestion and ASGI run as separate processes.
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "core.pubsub.InMemoryBackend")
+PUBSUB_REDIS_URL = os.getenv("PUBSUB_REDIS_URL", "redis://localhost:6379/0")
+
+# Pre-serialized public/buses/ snapshot; rebuilt on every change seen by this
+# process, and at least this often (seconds) to pick up what other processes
+# have persisted (their fixes reach the DB every GPS_LIVE_STATE_FLUSH_INTERVAL)
+PUBLIC_SNAPSHOT_TTL = float(os.getenv("PUBLIC_SNAPSHOT_TTL", 2))
+# ?since=<version> delta sync: changed vehicle ids remembered per snapshot
+PUBLIC_DELTA_RETENTION = int(os.getenv("PUBLIC_DELTA_RETENTION", 10000))
+
+# Grid cell size of the nearest-vehicle index (0.01 deg ~ 1.1 km)
+GPS_SPATIAL_CELL_DEG = float(os.getenv("GPS_SPATIAL_CELL_DEG", 0.01))
+# ...and how often (seconds) it reloads positions persisted by other processes
+GPS_SPATIAL_RESEED_SECONDS = float(os.getenv("GPS_SPATIAL_RESEED_SECONDS", 5))
+
+# --------------------------------------------------
+# Road-network ETAs (core/roads.py)
+# --------------------------------------------------
+# GeoJSON road graph; leave empty for straight-line ETAs
+ROAD_GRAPH_PATH = os.getenv("ROAD_GRAPH_PATH", "")
+ROAD_SNAP_MAX_KM = float(os.getenv("ROAD_SNAP_MAX_KM", 0.3))
+# Graphs up to this many nodes get all-pairs tables, bigger ones use landmarks
+ROAD_GRAPH_APSP_MAX_NODES = int(os.getenv("ROAD_GRAPH_APSP_MAX_NODES", 1500))
+ROAD_GRAPH_LANDMARKS = int(os.getenv("ROAD_GRAPH_LANDMARKS", 8))
+# Per-segment, per-hour-of-week speeds from manage.py build_speed_profiles
+ROAD_SPEED_PROFILE_PATH = os.getenv("ROAD_SPEED_PROFILE_PATH", str(BASE_DIR / "speed_profiles.bin"))
+ROAD_PROFILE_MIN_SAMPLES = int(os.getenv("ROAD_PROFILE_MIN_SAMPLES", 3))
+ROAD_PROFILE_TABLE_CACHE = int(os.getenv("ROAD_PROFILE_TABLE_CACHE", 8))
+# How often running servers look for a rebuilt profile file
+ROAD_PROFILE_RELOAD_SECONDS = int(os.getenv("ROAD_PROFILE_RELOAD_SECONDS", 300))
+
+# --------------------------------------------------
+# Bus stop arrival predictions (core/arrivals.py)
+# --------------------------------------------------
+# A bus this close to a stop counts as having reached it
+BUS_STOP_RADIUS_KM = float(os.getenv("BUS_STOP_RADIUS_KM", 0.05))
+BUS_STOP_DWELL_SECONDS = int(os.getenv("BUS_STOP_DWELL_SECONDS", 20))
+# Drop a bus's predictions when its last fix is older than this
+ARRIVAL_PREDICTION_MAX_AGE = int(os.getenv("ARRIVAL_PREDICTION_MAX_AGE", 300))
+# Stop lists are cached per process; edits elsewhere show up within this time
+ARRIVAL_ROUTE_CACHE_SECONDS = int(os.getenv("ARRIVAL_ROUTE_CACHE_SECONDS", 300))
+
+# --------------------------------------------------
+# Speed-limit zones (core/geofences.py)
+# --------------------------------------------------
+# Grid cell size of the zone index (0.002 deg ~ 220 m)
+GEOFENCE_CELL_DEG = float(os.getenv("GEOFENCE_CELL_DEG", 0.002))
+# Zone edits made through another worker show up within this time
+GEOFENCE_CACHE_SECONDS = int(os.getenv("GEOFENCE_CACHE_SECONDS", 300))
+
 # --------------------------------------------------
 # CORS Configuration
 # --------------------------------------------------
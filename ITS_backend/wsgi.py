@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ITS_backend.settings')
 
 application = get_wsgi_application()
+
+# Persist live vehicle locations and position history write-behind
+# while the server is running
+from core.history import history_buffer  # noqa: E402
+from core.live_state import live_store  # noqa: E402
+from core.roads import eta_engine  # noqa: E402
+
+live_store.start_flusher()
+history_buffer.start_flusher()
+
+# Load the road graph (if configured) and build its ETA tables now rather
+# than on the first request
+eta_engine.warm()
@@ -0,0 +1,237 @@
+# core/arrivals.py
+"""
+Precomputed bus arrival times per stop.
+
+Every fix of a bus with a ``Vehicle.route`` moves the bus along the route's
+ordered stop list (a stop counts as passed once the bus is within
+``BUS_STOP_RADIUS_KM`` of it, or somewhere between it and the following
+stop) and recomputes its arrival time at every stop still ahead: the
+ETA engine from the bus to the next stop, then cached stop-to-stop legs plus
+``BUS_STOP_DWELL_SECONDS`` per stop. ``public/stops/<id>/arrivals/`` then only
+reads the stored predictions.
+
+Predictions are absolute times, so the minutes shown keep counting down
+between fixes; a bus silent for ``ARRIVAL_PREDICTION_MAX_AGE`` drops out.
+Like ``core.live_state``, each process predicts from the fixes it applies.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .roads import eta_engine
+from .speed_profiles import hour_of_week
+from .utils import calculate_distance
+
+LEG_DETOUR = 1.25   # how far off the straight stop-to-stop line a bus between them can be
+
+
+class ArrivalPredictor:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._routes = {}      # route id -> route dict (stops, leg cache, loaded_at)
+        self._stops = {}       # stop id -> {id, name, lat, lng}
+        self._progress = {}    # vehicle id -> (route id, index of the next stop)
+        self._arrivals = {}    # stop id -> {vehicle id: prediction}
+        self._by_vehicle = {}  # vehicle id -> stop ids it has predictions at
+
+    # ─── Routes ─────────────────────────────────────────
+
+    def _route(self, route_id):
+        key = str(route_id)
+        route = self._routes.get(key)
+        if route is not None and time.monotonic() - route['loaded_at'] < settings.ARRIVAL_ROUTE_CACHE_SECONDS:
+            return route
+        from .models import BusRoute, RouteStop
+
+        meta = BusRoute.objects.filter(id=route_id).values('name', 'is_loop').first()
+        if meta is None:
+            self._routes.pop(key, None)
+            return None
+        rows = RouteStop.objects.filter(route_id=route_id).order_by('sequence').values_list(
+            'stop_id', 'stop__name', 'stop__lat', 'stop__lng'
+        )
+        stops = [
+            {'id': str(stop_id), 'name': name, 'lat': lat, 'lng': lng}
+            for stop_id, name, lat, lng in rows
+        ]
+        route = {
+            'id': key, 'name': meta['name'], 'is_loop': meta['is_loop'], 'stops': stops,
+            'legs': {}, 'loaded_at': time.monotonic(),
+        }
+        with self._lock:
+            self._routes[key] = route
+            self._stops.update((stop['id'], stop) for stop in stops)
+        return route
+
+    def route_changed(self, route_id=None):
+        """Drop cached stop lists (all of them when ``route_id`` is None)."""
+        with self._lock:
+            if route_id is None:
+                self._routes.clear()
+                self._stops.clear()
+            else:
+                self._routes.pop(str(route_id), None)
+
+    def _legs(self, route, speed, hour):
+        """Minutes from each stop to the next one (the last wraps to the first)."""
+        legs = route['legs'].get((speed, hour))
+        if legs is None:
+            stops = route['stops']
+            when = self._hour_start(hour)
+            legs = [
+                eta_engine.estimate(a['lat'], a['lng'], b['lat'], b['lng'], speed, at=when)
+                for a, b in zip(stops, stops[1:] + stops[:1])
+            ]
+            route['legs'][(speed, hour)] = legs
+        return legs
+
+    @staticmethod
+    def _hour_start(hour):
+        # any datetime falling in that hour of the week will do for the ETA engine
+        now = timezone.localtime()
+        monday = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        return monday + timedelta(hours=hour)
+
+    # ─── Progress along the route ───────────────────────
+
+    def _done(self, stops, index, lat, lng, is_loop):
+        stop = stops[index]
+        if calculate_distance(lat, lng, stop['lat'], stop['lng']) <= settings.BUS_STOP_RADIUS_KM:
+            return True
+        if index + 1 < len(stops):
+            after = stops[index + 1]
+        elif is_loop:
+            after = stops[0]
+        else:
+            return False
+        # past it if already on the way to the following stop
+        gap = calculate_distance(stop['lat'], stop['lng'], after['lat'], after['lng'])
+        via = (calculate_distance(lat, lng, stop['lat'], stop['lng'])
+               + calculate_distance(lat, lng, after['lat'], after['lng']))
+        return via <= gap * LEG_DETOUR
+
+    def _next_stop(self, key, route, lat, lng):
+        stops = route['stops']
+        state = self._progress.get(key)
+        if state is not None and state[0] == route['id']:
+            index = state[1]
+        else:
+            # first fix on this route: start from the closest stop
+            index = min(
+                range(len(stops)),
+                key=lambda i: calculate_distance(lat, lng, stops[i]['lat'], stops[i]['lng'])
+            )
+        for _ in range(len(stops)):
+            if index >= len(stops):
+                if not route['is_loop']:
+                    break
+                index = 0
+            if not self._done(stops, index, lat, lng, route['is_loop']):
+                break
+            index += 1
+        if index >= len(stops) and route['is_loop']:
+            index = 0
+        self._progress[key] = (route['id'], index)
+        return index
+
+    # ─── Writes ─────────────────────────────────────────
+
+    def observe(self, vehicle, fix, speed_kmh):
+        """Recompute the bus's arrival at every stop ahead of it."""
+        route = self._route(vehicle.route_id) if vehicle.route_id else None
+        key = str(vehicle.id)
+        if route is None or not route['stops']:
+            self.remove(key)
+            return
+
+        with self._lock:
+            stops = route['stops']
+            index = self._next_stop(key, route, fix['lat'], fix['lng'])
+            ahead = len(stops) if route['is_loop'] else len(stops) - index
+            recorded_at = fix['recorded_at']
+            legs = self._legs(route, speed_kmh, hour_of_week(recorded_at))
+            dwell = settings.BUS_STOP_DWELL_SECONDS / 60
+
+            self._clear(key)
+            if not ahead:
+                return   # past the last stop
+            first = stops[index % len(stops)]
+            minutes = eta_engine.estimate(
+                fix['lat'], fix['lng'], first['lat'], first['lng'], speed_kmh, at=recorded_at
+            )
+            stop_ids = set()
+            for step in range(ahead):
+                i = (index + step) % len(stops)
+                if step:
+                    minutes += dwell + legs[i - 1]
+                stop_id = stops[i]['id']
+                if stop_id in stop_ids:
+                    break
+                stop_ids.add(stop_id)
+                self._arrivals.setdefault(stop_id, {})[key] = {
+                    'vehicle_id': key,
+                    'vehicle_number': vehicle.vehicle_number,
+                    'route_id': route['id'],
+                    'route_name': route['name'],
+                    'stops_away': step,
+                    'arrives_at': recorded_at + timedelta(minutes=minutes),
+                    'fix_at': recorded_at,
+                }
+            self._by_vehicle[key] = stop_ids
+
+    def _clear(self, key):
+        for stop_id in self._by_vehicle.pop(key, ()):
+            predictions = self._arrivals.get(stop_id)
+            if predictions is not None:
+                predictions.pop(key, None)
+                if not predictions:
+                    del self._arrivals[stop_id]
+
+    def remove(self, vehicle_id):
+        """Forget a bus (trip ended, route changed, vehicle deleted)."""
+        key = str(vehicle_id)
+        with self._lock:
+            self._clear(key)
+            self._progress.pop(key, None)
+
+    # ─── Reads ──────────────────────────────────────────
+
+    def stop(self, stop_id):
+        return self._stops.get(str(stop_id))
+
+    def arrivals(self, stop_id, now=None):
+        """Upcoming buses at a stop, soonest first."""
+        now = now or timezone.now()
+        oldest = now - timedelta(seconds=settings.ARRIVAL_PREDICTION_MAX_AGE)
+        with self._lock:
+            predictions = list(self._arrivals.get(str(stop_id), {}).values())
+        upcoming = []
+        for prediction in predictions:
+            if prediction['fix_at'] < oldest:
+                continue
+            minutes = (prediction['arrives_at'] - now).total_seconds() / 60
+            upcoming.append((prediction['arrives_at'], {
+                'vehicle_id': prediction['vehicle_id'],
+                'vehicle_number': prediction['vehicle_number'],
+                'route_id': prediction['route_id'],
+                'route_name': prediction['route_name'],
+                'stops_away': prediction['stops_away'],
+                'eta_minutes': round(max(minutes, 0), 1),
+                'arrives_at': prediction['arrives_at'].isoformat(),
+            }))
+        upcoming.sort(key=lambda item: item[0])
+        return [arrival for _, arrival in upcoming]
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._stops.clear()
+            self._progress.clear()
+            self._arrivals.clear()
+            self._by_vehicle.clear()
+
+
+arrival_predictor = ArrivalPredictor()
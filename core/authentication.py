@@ -1,31 +1,85 @@
 # core/authentication.py  ── FINAL VERSION
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.settings import api_settings
 from rest_framework.exceptions import AuthenticationFailed
 from uuid import UUID
 from core.models import User  # import your User model directly
+from core.token_cache import token_cache
+from core.user_cache import user_cache
 
-class UUIDJWTAuthentication(JWTAuthentication):
-    def get_user(self, validated_token):
-        user_id_claim = api_settings.USER_ID_CLAIM
-        user_id_str = validated_token.get(user_id_claim)
 
-        if not user_id_str:
-            raise AuthenticationFailed("Invalid token - no user_id claim")
+class LazyUser(SimpleLazyObject):
+    """
+    ``request.user`` whose ``id`` / ``pk`` / ``role`` come straight from the
+    verified token claims, so the role permissions in core/permissions.py
+    and ``filter(driver_id=request.user.id)`` style lookups need no query.
+    Touching any other attribute (or passing it to the ORM as a model
+    instance) loads the real ``User`` through the user cache.
+    """
+    def __init__(self, user_id, role, load):
+        super().__init__(load)
+        self.__dict__.update(
+            id=UUID(user_id), pk=UUID(user_id), role=role,
+            is_authenticated=True, is_anonymous=False,
+        )
+
+    def __bool__(self):
+        return True
+
+
+def _user_id(validated_token):
+    user_id_claim = api_settings.USER_ID_CLAIM
+    user_id_str = validated_token.get(user_id_claim)
+
+    if not user_id_str:
+        raise AuthenticationFailed("Invalid token - no user_id claim")
+
+    # Keep as STRING — do NOT convert to UUID object
+    # Django UUIDField can query with string values perfectly
+
+    try:
+        # Optional: validate it's a valid UUID format
+        UUID(user_id_str)
+    except ValueError:
+        raise AuthenticationFailed("Invalid user ID format in token")
 
-        # Keep as STRING — do NOT convert to UUID object
-        # Django UUIDField can query with string values perfectly
+    return user_id_str
 
-        try:
-            # Optional: validate it's a valid UUID format
-            UUID(user_id_str)
-        except ValueError:
-            raise AuthenticationFailed("Invalid user ID format in token")
 
-        try:
-            # Query with STRING value
-            user = User.objects.get(id=user_id_str)
-        except User.DoesNotExist:
-            raise AuthenticationFailed("User not found")
+def load_user(user_id_str):
+    # users are cached per process, see core/user_cache.py
+    user = user_cache.get(user_id_str)
+    if user is not None:
+        return user
+
+    generation = user_cache.generation()
+    try:
+        # Query with STRING value
+        user = User.objects.get(id=user_id_str)
+    except User.DoesNotExist:
+        raise AuthenticationFailed("User not found")
+
+    user_cache.put(user, generation)
+    return user
+
+
+class UUIDJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        # repeat tokens skip decoding + signature check, see core/token_cache.py
+        return token_cache.get_or_verify(raw_token, super().get_validated_token)
+
+    def get_user(self, validated_token):
+        user_id_str = _user_id(validated_token)
+
+        # With AUTH_TRUST_ROLE_CLAIM the role claim is trusted until the token
+        # expires, unless this process saw the user change (role, deactivation,
+        # deletion) after the token was issued. Changes made through another
+        # worker are not seen here, hence off by default.
+        role = validated_token.get('role')
+        if (role and settings.AUTH_TRUST_ROLE_CLAIM
+                and not user_cache.changed_since(user_id_str, validated_token.get('iat'))):
+            return LazyUser(user_id_str, role, lambda: load_user(user_id_str))
 
-        return user
\ No newline at end of file
+        return load_user(user_id_str)
@@ -0,0 +1,105 @@
+# core/batching.py
+"""
+Batching of fixes received by the socket listeners (TCP, UDP).
+
+Fixes are buffered on the event loop and handed to a sink on a single worker
+thread, either when ``batch_size`` fixes are waiting or every
+``flush_interval`` seconds. The default sink puts them on ``core.ingest_queue``
+so a batch the DB rejects is retried and finally dead-lettered like an HTTP
+one: TCP fixes have been acknowledged and UDP ones deduped by then, so the
+device will not send them again.
+
+A listener that can push back on its peers (TCP) awaits ``wait_for_room``
+before reading more, so at most about ``max_pending`` fixes are buffered
+or in flight however slow the database gets.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .ingest_queue import GPS, QueueFull, ingest_queue
+
+
+def enqueue_fix_batch(fixes):
+    """
+    Default sink: queue the fixes for the ingest workers. Blocks while the
+    queue is full, which holds the listener back instead of losing fixes.
+    """
+    step = settings.GPS_INGEST_BATCH_SIZE
+    for start in range(0, len(fixes), step):
+        while True:
+            try:
+                ingest_queue.submit(GPS, fixes[start:start + step])
+                break
+            except QueueFull:
+                time.sleep(settings.GPS_INGEST_RETRY_AFTER)
+    if settings.GPS_INGEST_WORKERS <= 0:
+        # no worker threads: apply here, still with the queue's retries
+        try:
+            ingest_queue.drain()
+        finally:
+            close_old_connections()
+
+
+class AsyncFixBatcher:
+    def __init__(self, sink, batch_size, flush_interval, thread_name="gps-db", max_pending=None):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._in_flight = 0
+        self._room = asyncio.Event()
+        self._tasks = set()
+        self._flush_task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=thread_name)
+
+    def __len__(self):
+        """Fixes not yet applied: buffered plus handed to the DB thread."""
+        return len(self._pending) + self._in_flight
+
+    def full(self):
+        return self.max_pending is not None and len(self) >= self.max_pending
+
+    async def wait_for_room(self):
+        """Return once fewer than ``max_pending`` fixes are outstanding."""
+        while self.full():
+            self._room.clear()
+            await self._room.wait()
+
+    def start(self):
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def add(self, fix):
+        self._pending.append(fix)
+        if len(self._pending) >= self.batch_size:
+            task = asyncio.create_task(self.flush())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if batch:
+            loop = asyncio.get_running_loop()
+            self._in_flight += len(batch)
+            try:
+                await loop.run_in_executor(self._executor, self.sink, batch)
+            finally:
+                self._in_flight -= len(batch)
+                self._room.set()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -0,0 +1,195 @@
+# core/geofences.py
+"""
+Speed-limit zones (``Geofence`` polygons) resolved per fix.
+
+Active zones are loaded into a uniform grid of ``GEOFENCE_CELL_DEG`` cells;
+every cell lists, in precedence order (higher ``priority`` first, then the
+smaller zone), the zones whose bounding box overlaps it. Resolving a fix is
+a dict lookup plus a point-in-polygon test on the few candidates of one
+cell, so it stays in the microseconds with hundreds of zones
+(``manage.py benchmark_geofences``).
+
+``observe()`` also remembers which zone each vehicle is in and returns
+``enter`` / ``exit`` events when that changes. Zone state is per process, so
+a restart reports a fresh ``enter`` for vehicles already inside a zone.
+``apply_fixes`` restores it from a ``checkpoint`` when its batch fails, so
+the events are reported again on retry.
+
+The index is rebuilt on ``reload()`` (called by the admin views) and at most
+``GEOFENCE_CACHE_SECONDS`` after a change made by another process.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+MAX_CELLS_PER_ZONE = 10_000   # bigger zones are checked on every lookup instead
+
+
+class Zone:
+    __slots__ = ('id', 'name', 'speed_limit', 'priority', 'lats', 'lngs', 'bbox', 'area')
+
+    def __init__(self, id, name, speed_limit, priority, polygon):
+        points = [(float(lat), float(lng)) for lat, lng in polygon]
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        if len(points) < 3:
+            raise ValueError(f"Zone {name} needs at least 3 points")
+        self.id = str(id)
+        self.name = name
+        self.speed_limit = speed_limit
+        self.priority = priority
+        self.lats = [lat for lat, _ in points]
+        self.lngs = [lng for _, lng in points]
+        self.bbox = (min(self.lats), min(self.lngs), max(self.lats), max(self.lngs))
+        # shoelace in degrees^2; only used to rank overlapping zones
+        self.area = abs(sum(
+            self.lngs[i - 1] * self.lats[i] - self.lngs[i] * self.lats[i - 1]
+            for i in range(len(points))
+        )) / 2
+
+    def contains(self, lat, lng):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+        # even-odd ray casting along the longitude axis
+        lats, lngs = self.lats, self.lngs
+        inside = False
+        j = len(lats) - 1
+        for i in range(len(lats)):
+            if (lats[i] > lat) != (lats[j] > lat):
+                cross = lngs[i] + (lat - lats[i]) * (lngs[j] - lngs[i]) / (lats[j] - lats[i])
+                if lng < cross:
+                    inside = not inside
+            j = i
+        return inside
+
+
+class GeofenceIndex:
+    def __init__(self, zones, cell_deg):
+        self.cell_deg = cell_deg
+        self.zones = {zone.id: zone for zone in zones}
+        self._cells = {}
+        self._everywhere = []
+        for zone in sorted(zones, key=lambda z: (-z.priority, z.area)):
+            row_lo, col_lo = self._cell(zone.bbox[0], zone.bbox[1])
+            row_hi, col_hi = self._cell(zone.bbox[2], zone.bbox[3])
+            if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > MAX_CELLS_PER_ZONE:
+                self._everywhere.append(zone)
+                continue
+            for row in range(row_lo, row_hi + 1):
+                for col in range(col_lo, col_hi + 1):
+                    self._cells.setdefault((row, col), []).append(zone)
+        if self._everywhere:
+            # huge zones still have to respect precedence inside every cell
+            for cell, candidates in self._cells.items():
+                candidates.extend(self._everywhere)
+                candidates.sort(key=lambda z: (-z.priority, z.area))
+        self._cells = {cell: tuple(candidates) for cell, candidates in self._cells.items()}
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def zone_at(self, lat, lng):
+        """The zone whose limit applies at (lat, lng), or None."""
+        candidates = self._cells.get(self._cell(lat, lng))
+        if candidates is None:
+            candidates = self._everywhere
+        for zone in candidates:
+            if zone.contains(lat, lng):
+                return zone
+        return None
+
+
+class GeofenceEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = 0.0
+        self._inside = {}   # vehicle id -> Zone it was last seen in
+
+    @property
+    def index(self):
+        index = self._index
+        if index is None or time.monotonic() - self._loaded_at >= settings.GEOFENCE_CACHE_SECONDS:
+            with self._lock:
+                if self._index is index:
+                    self._index = self._load()
+                    self._loaded_at = time.monotonic()
+                index = self._index
+        return index
+
+    @staticmethod
+    def _load():
+        from .models import Geofence
+
+        zones = []
+        rows = Geofence.objects.filter(is_active=True).values_list(
+            'id', 'name', 'speed_limit', 'priority', 'polygon'
+        )
+        for zone_id, name, speed_limit, priority, polygon in rows:
+            try:
+                zones.append(Zone(zone_id, name, speed_limit, priority, polygon))
+            except (TypeError, ValueError):
+                # bad rows are rejected by the serializer; skip anything older
+                continue
+        return GeofenceIndex(zones, settings.GEOFENCE_CELL_DEG)
+
+    def reload(self):
+        """Rebuild from the DB on next use (zones were added/changed/removed)."""
+        with self._lock:
+            self._index = None
+
+    def zone_at(self, lat, lng):
+        return self.index.zone_at(lat, lng)
+
+    def observe(self, vehicle_id, lat, lng):
+        """
+        Resolve the zone of a vehicle's fix (feed fixes in time order).
+        Returns ``(zone or None, events)`` where events are ``('exit', zone)``
+        / ``('enter', zone)`` pairs for a zone change.
+        """
+        zone = self.index.zone_at(lat, lng)
+        key = str(vehicle_id)
+        with self._lock:
+            was_in = self._inside.get(key)
+            if (was_in and was_in.id) == (zone and zone.id):
+                return zone, []
+            if zone is None:
+                del self._inside[key]
+            else:
+                self._inside[key] = zone
+        events = []
+        if was_in is not None:
+            events.append(('exit', was_in))
+        if zone is not None:
+            events.append(('enter', zone))
+        return zone, events
+
+    def checkpoint(self, vehicle_ids):
+        """The zones ``vehicle_ids`` are in now, for ``restore``."""
+        with self._lock:
+            return {str(vehicle_id): self._inside.get(str(vehicle_id)) for vehicle_id in vehicle_ids}
+
+    def restore(self, checkpoint):
+        """Put back zone state saved by ``checkpoint`` (its batch was rolled back)."""
+        with self._lock:
+            for key, zone in checkpoint.items():
+                if zone is None:
+                    self._inside.pop(key, None)
+                else:
+                    self._inside[key] = zone
+
+    def forget(self, vehicle_id):
+        with self._lock:
+            self._inside.pop(str(vehicle_id), None)
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+            self._loaded_at = 0.0
+            self._inside.clear()
+
+
+geofences = GeofenceEngine()
@@ -0,0 +1,209 @@
+# core/gt06.py
+"""
+GT06 binary tracker protocol (GT06 / GT06N and most cheap clones).
+
+Frame layout::
+
+    0x78 0x78 | len (1) | protocol (1) | content | serial (2) | crc (2) | 0x0D 0x0A
+
+``len`` counts protocol + content + serial + crc. Long frames start with
+0x79 0x79 and carry a 2 byte length. The CRC is CRC-ITU (CRC-16/X-25) over
+everything from the length byte up to and including the serial number.
+"""
+import asyncio
+import struct
+from datetime import datetime, timezone
+
+START_SHORT = b'\x78\x78'
+START_LONG = b'\x79\x79'
+STOP = b'\x0d\x0a'
+
+PROTO_LOGIN = 0x01
+PROTO_LOCATION = 0x12
+PROTO_HEARTBEAT = 0x13
+PROTO_LOCATION_GT06N = 0x22
+LOCATION_PROTOCOLS = (PROTO_LOCATION, PROTO_LOCATION_GT06N)
+
+COORD_DIVISOR = 30000.0 * 60   # raw value = degrees * 60 * 30000
+
+MAX_FRAME_LENGTH = 1024
+
+
+class FrameError(ValueError):
+    """Raised for packet contents that cannot be decoded."""
+
+
+def crc_itu(data):
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+    return crc ^ 0xFFFF
+
+
+def decode_frames(buffer):
+    """
+    Pull every complete frame out of ``buffer`` (a bytearray, consumed in
+    place). Returns ``(frames, malformed)`` where frames are
+    ``(protocol, content, serial)`` tuples and ``malformed`` counts frames
+    dropped for bad length, stop bits or CRC. Incomplete trailing bytes stay
+    in the buffer for the next read.
+    """
+    frames = []
+    malformed = 0
+    while True:
+        start = _find_start(buffer)
+        if start < 0:
+            # keep a possible half start marker
+            del buffer[:max(len(buffer) - 1, 0)]
+            return frames, malformed
+        del buffer[:start]
+
+        if buffer[:2] == START_SHORT:
+            if len(buffer) < 3:
+                return frames, malformed
+            length, header = buffer[2], 3
+        else:
+            if len(buffer) < 4:
+                return frames, malformed
+            length, header = struct.unpack('>H', buffer[2:4])[0], 4
+
+        if length < 5 or length > MAX_FRAME_LENGTH:
+            del buffer[:2]
+            malformed += 1
+            continue
+
+        total = header + length + 2
+        if len(buffer) < total:
+            return frames, malformed
+
+        frame = bytes(buffer[:total])
+        body = frame[2:total - 4]
+        (crc,) = struct.unpack('>H', frame[total - 4:total - 2])
+        if frame[-2:] != STOP or crc_itu(body) != crc:
+            # resync on the next start marker rather than trusting the length
+            del buffer[:2]
+            malformed += 1
+            continue
+        del buffer[:total]
+
+        payload = body[header - 2:]
+        protocol = payload[0]
+        content = payload[1:-2]
+        (serial,) = struct.unpack('>H', payload[-2:])
+        frames.append((protocol, content, serial))
+
+
+def _find_start(buffer):
+    short = buffer.find(START_SHORT)
+    long_ = buffer.find(START_LONG)
+    candidates = [i for i in (short, long_) if i >= 0]
+    return min(candidates) if candidates else -1
+
+
+def encode_frame(protocol, content, serial):
+    body = bytes([len(content) + 5, protocol]) + content + struct.pack('>H', serial)
+    return START_SHORT + body + struct.pack('>H', crc_itu(body)) + STOP
+
+
+def build_ack(protocol, serial):
+    return encode_frame(protocol, b'', serial)
+
+
+# ─── Content codecs ─────────────────────────────────────
+
+def parse_login(content):
+    """Terminal ID is the IMEI as 8 BCD bytes with a leading zero nibble."""
+    if len(content) < 8:
+        raise FrameError("Login packet too short")
+    digits = content[:8].hex()
+    return digits[1:] if digits.startswith('0') else digits
+
+
+def parse_location(content):
+    """Return ``(timestamp, lat, lng, speed_kmh, positioned)`` from a location packet."""
+    if len(content) < 18:
+        raise FrameError("Location packet too short")
+    year, month, day, hour, minute, second = content[:6]
+    lat_raw, lng_raw = struct.unpack('>II', content[7:15])
+    speed = content[15]
+    (course_status,) = struct.unpack('>H', content[16:18])
+
+    lat = lat_raw / COORD_DIVISOR
+    lng = lng_raw / COORD_DIVISOR
+    if not course_status & 0x0400:    # bit 10 clear → south latitude
+        lat = -lat
+    if course_status & 0x0800:        # bit 11 set → west longitude
+        lng = -lng
+    positioned = bool(course_status & 0x1000)
+
+    try:
+        timestamp = datetime(2000 + year, month, day, hour, minute, second, tzinfo=timezone.utc)
+    except ValueError:
+        raise FrameError("Invalid date in location packet")
+    return timestamp, lat, lng, float(speed), positioned
+
+
+def build_login(imei):
+    return bytes.fromhex(str(imei).rjust(16, '0'))
+
+
+def build_location(timestamp, lat, lng, speed, course=0, satellites=8):
+    status = (course & 0x03FF) | 0x1000
+    if lat >= 0:
+        status |= 0x0400
+    if lng < 0:
+        status |= 0x0800
+    return (
+        bytes([
+            timestamp.year - 2000, timestamp.month, timestamp.day,
+            timestamp.hour, timestamp.minute, timestamp.second,
+            0xC0 | (satellites & 0x0F),
+        ])
+        + struct.pack('>II', round(abs(lat) * COORD_DIVISOR), round(abs(lng) * COORD_DIVISOR))
+        + bytes([max(0, min(255, round(speed)))])
+        + struct.pack('>H', status)
+        + b'\x01\x94\x00\x00\x00\x00\x00\x00'   # LBS: MCC 404 (India), no cell info
+    )
+
+
+class FakeGT06Device:
+    """Minimal device emulator for local testing of the TCP listener."""
+
+    def __init__(self, imei, host='127.0.0.1', port=5023):
+        self.imei = imei
+        self.host = host
+        self.port = port
+        self.serial = 0
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return await self.send(PROTO_LOGIN, build_login(self.imei))
+
+    async def send_location(self, lat, lng, speed, timestamp=None):
+        timestamp = timestamp or datetime.now(timezone.utc)
+        return await self.send(PROTO_LOCATION, build_location(timestamp, lat, lng, speed))
+
+    async def send(self, protocol, content):
+        """Send one frame and return the decoded ack ``(protocol, serial)``."""
+        self.serial = (self.serial + 1) & 0xFFFF
+        self.writer.write(encode_frame(protocol, content, self.serial))
+        await self.writer.drain()
+        buffer = bytearray()
+        while True:
+            chunk = await self.reader.read(64)
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            buffer.extend(chunk)
+            frames, _ = decode_frames(buffer)
+            if frames:
+                ack_protocol, _, ack_serial = frames[0]
+                return ack_protocol, ack_serial
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
@@ -0,0 +1,143 @@
+# core/hashing.py
+"""
+Bounded pool for password hashing (login, signup, password reset).
+
+A PBKDF2 hash is hundreds of milliseconds of CPU. Run on the request
+worker, a burst of logins holds every worker thread and GPS ingestion
+queues up behind it. Under ASGI it is worse: sync views all share one
+thread, so every request waits. Hashing here goes through at most
+``AUTH_HASH_WORKERS`` threads. hashlib's PBKDF2, bcrypt and argon2 all
+release the GIL while they hash, so threads are enough and we don't need a
+process pool.
+
+At most ``AUTH_HASH_QUEUE_SIZE`` more hashes wait for a free thread. Past
+that, ``HashingBusy`` is raised and the views answer 503 with a
+``Retry-After``.
+
+* The sync views block on ``hash_password`` / ``verify_password``.
+* The async auth views (``auth/async/...``) await ``ahash_password`` /
+  ``averify_password``, which frees the event loop while a hash runs.
+
+``AUTH_HASH_WORKERS = 0`` hashes inline, as before.
+
+admin/metrics/ shows these gauges:
+
+* ``auth.hash.queue_depth``: hashes waiting for a thread.
+* ``auth.hash.in_flight``: hashes running now.
+
+It also shows these counters:
+
+* ``auth.hash.completed``
+* ``auth.hash.rejected``
+* ``auth.hash.wait_us``: total time spent queued.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from .metrics import metrics
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0   # submitted and not finished (queued + running)
+        self._running = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=settings.AUTH_HASH_WORKERS, thread_name_prefix='password-hash'
+                    )
+        return self._executor
+
+    def submit(self, fn, *args):
+        """Run ``fn(*args)`` on the pool; a ``concurrent.futures.Future``."""
+        with self._lock:
+            if self._pending >= settings.AUTH_HASH_WORKERS + settings.AUTH_HASH_QUEUE_SIZE:
+                metrics.incr('auth.hash.rejected')
+                raise HashingBusy()
+            self._pending += 1
+            self._publish()
+        try:
+            future = self.executor.submit(self._run, fn, args, time.monotonic())
+        except BaseException:
+            self._finished()
+            raise
+        # also fires when a waiting async view is cancelled before the hash starts
+        future.add_done_callback(lambda _: self._finished())
+        return future
+
+    def _run(self, fn, args, submitted_at):
+        metrics.incr('auth.hash.wait_us', round((time.monotonic() - submitted_at) * 1e6))
+        with self._lock:
+            self._running += 1
+            self._publish()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+            metrics.incr('auth.hash.completed')
+
+    def _finished(self):
+        with self._lock:
+            self._pending -= 1
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('auth.hash.in_flight', self._running)
+        metrics.set_gauge('auth.hash.queue_depth', self._pending - self._running)
+
+    # ─── Sync / async entry points ──────────────────────
+
+    def call(self, fn, *args):
+        if settings.AUTH_HASH_WORKERS <= 0:
+            return fn(*args)
+        return self.submit(fn, *args).result()
+
+    async def acall(self, fn, *args):
+        if settings.AUTH_HASH_WORKERS <= 0:
+            return fn(*args)
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def pending(self):
+        return self._pending
+
+    def reset(self):
+        """Start a fresh pool on next use (tests change the settings)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+hashing_pool = HashingPool()
+
+
+def hash_password(raw_password):
+    return hashing_pool.call(make_password, raw_password)
+
+
+def verify_password(raw_password, encoded):
+    return hashing_pool.call(check_password, raw_password, encoded)
+
+
+async def ahash_password(raw_password):
+    return await hashing_pool.acall(make_password, raw_password)
+
+
+async def averify_password(raw_password, encoded):
+    return await hashing_pool.acall(check_password, raw_password, encoded)
@@ -0,0 +1,178 @@
+# core/history.py
+"""
+Buffered writer for the append-only ``PositionFix`` track.
+
+Ingestion only appends rows to an in-memory buffer; they are inserted with
+one ``bulk_create`` once ``GPS_HISTORY_BATCH_SIZE`` rows are waiting or the
+oldest row is ``GPS_HISTORY_FLUSH_INTERVAL`` seconds old. Trips are linked at
+flush time with one query for the whole batch (the trip whose time window
+contains the fix), so the request path never looks them up.
+
+Rows of a vehicle deleted while they were buffered are dropped: the delete
+view calls ``discard_vehicle``, and a batch rejected by the DB (a vehicle
+deleted through another process) is retried without the rows whose vehicle
+is gone. At most ``GPS_HISTORY_MAX_PENDING`` rows are kept while the DB is
+unavailable; the oldest are dropped beyond that (``history.dropped``).
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PositionHistoryBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = []
+        self._oldest_at = None
+        self._flusher = None
+        self._deleted = set()   # vehicle ids (str) deleted by this process
+
+    @property
+    def flush_interval(self):
+        return settings.GPS_HISTORY_FLUSH_INTERVAL
+
+    @property
+    def batch_size(self):
+        return settings.GPS_HISTORY_BATCH_SIZE
+
+    def add(self, rows):
+        if not rows:
+            return
+        with self._lock:
+            if self._deleted:
+                rows = [row for row in rows if str(row.vehicle_id) not in self._deleted]
+            self._rows.extend(rows)
+            self._trim()
+            if self._oldest_at is None and self._rows:
+                self._oldest_at = time.monotonic()
+        self.maybe_flush()
+
+    def _trim(self):
+        excess = len(self._rows) - settings.GPS_HISTORY_MAX_PENDING
+        if excess > 0:
+            del self._rows[:excess]
+            metrics.incr('history.dropped', excess)
+
+    def discard_vehicle(self, vehicle_id):
+        """Drop buffered rows of a vehicle that is being deleted, and any added later."""
+        key = str(vehicle_id)
+        with self._lock:
+            self._deleted.add(key)
+            self._rows = [row for row in self._rows if str(row.vehicle_id) != key]
+            if not self._rows:
+                self._oldest_at = None
+
+    def pending(self):
+        return len(self._rows)
+
+    def maybe_flush(self):
+        with self._lock:
+            if not self._rows:
+                return 0
+            age = time.monotonic() - self._oldest_at
+            due = age >= self.flush_interval or len(self._rows) >= self.batch_size
+        return self.flush() if due else 0
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._oldest_at = None
+        if not rows:
+            return 0
+
+        try:
+            self._write(rows)
+        except Exception:
+            # usually rows of a vehicle deleted by another process (FK violation);
+            # retrying them would block the whole buffer for good
+            try:
+                rows = _existing_vehicles_only(rows)
+                self._write(rows)
+            except Exception:
+                logger.exception("Position history flush failed, will retry")
+                with self._lock:
+                    self._rows[:0] = rows
+                    self._trim()
+                    if self._oldest_at is None and self._rows:
+                        self._oldest_at = time.monotonic()
+                return 0
+        return len(rows)
+
+    def _write(self, rows):
+        from .models import PositionFix
+
+        if rows:
+            _link_trips(rows)
+            PositionFix.objects.bulk_create(rows, batch_size=self.batch_size)
+
+    def start_flusher(self):
+        """Run the periodic flush on a daemon thread (server processes only)."""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="position-history-flusher", daemon=True
+            )
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(max(self.flush_interval, 0.1))
+            try:
+                self.maybe_flush()
+            finally:
+                close_old_connections()
+
+    def reset(self):
+        with self._lock:
+            self._rows.clear()
+            self._oldest_at = None
+            self._deleted.clear()
+
+
+def _existing_vehicles_only(rows):
+    from .models import Vehicle
+
+    vehicle_ids = {row.vehicle_id for row in rows}
+    existing = set(Vehicle.objects.filter(id__in=vehicle_ids).values_list('id', flat=True))
+    kept = [row for row in rows if row.vehicle_id in existing]
+    if len(kept) < len(rows):
+        metrics.incr('history.orphaned', len(rows) - len(kept))
+        logger.warning("Dropped %d history rows of deleted vehicles", len(rows) - len(kept))
+    return kept
+
+
+def _link_trips(rows):
+    from .models import Trip
+
+    vehicle_ids = {row.vehicle_id for row in rows}
+    earliest = min(row.timestamp for row in rows)
+    latest = max(row.timestamp for row in rows)
+
+    trips_by_vehicle = {}
+    trips = Trip.objects.filter(
+        vehicle_id__in=vehicle_ids, start_time__lte=latest
+    ).filter(
+        Q(end_time__isnull=True) | Q(end_time__gte=earliest)
+    ).values_list('vehicle_id', 'id', 'start_time', 'end_time')
+    for vehicle_id, trip_id, start_time, end_time in trips:
+        trips_by_vehicle.setdefault(vehicle_id, []).append((start_time, end_time, trip_id))
+
+    for row in rows:
+        for start_time, end_time, trip_id in trips_by_vehicle.get(row.vehicle_id, ()):
+            if start_time <= row.timestamp and (end_time is None or row.timestamp <= end_time):
+                row.trip_id = trip_id
+                break
+
+
+history_buffer = PositionHistoryBuffer()
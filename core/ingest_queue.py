@@ -0,0 +1,216 @@
+# core/ingest_queue.py
+"""
+Bounded in-process queue between the device endpoints and the DB.
+
+With ``GPS_INGEST_ASYNC`` enabled, ``ReceiveGPSView``, ``ReceiveGPSBatchView``
+and ``ReceiveRFIDScanView`` only validate and enqueue, answering 202. A pool
+of ``GPS_INGEST_WORKERS`` threads drains the queue in batches of up to
+``GPS_INGEST_BATCH_SIZE`` items through ``apply_fixes`` / ``apply_rfid_scans``.
+
+Every IMEI (RFID device) is routed to one fixed worker, so its fixes are
+applied in the order they arrived - watermarks, overspeed episodes and
+geofence enter/exit state depend on that - and two workers never write
+the same vehicle at once.
+
+The queue holds at most ``GPS_INGEST_QUEUE_SIZE`` fixes/scans (not
+requests: one batch request can carry hundreds). When it is full,
+``GPS_INGEST_OVERFLOW`` decides what happens:
+
+* ``reject``      - ``QueueFull`` is raised; the views answer 429 with a
+  ``Retry-After`` of ``GPS_INGEST_RETRY_AFTER`` seconds.
+* ``drop_oldest`` - the oldest queued requests are discarded to make room.
+
+A batch that fails is retried ``GPS_INGEST_MAX_RETRIES`` times with
+exponential backoff from ``GPS_INGEST_RETRY_BACKOFF`` seconds, on the same
+worker so later fixes of those vehicles wait behind it. ``apply_fixes``
+puts back the overspeed episodes and zone state of a batch that failed, so
+a retry records the same offences and zone events as a first attempt.
+After the last retry the batch is logged and kept in ``dead_letters()``
+(the last ``GPS_INGEST_DEAD_LETTERS`` batches).
+
+Queue depth, processing lag, retried, dead-lettered, dropped and rejected
+items are reported through ``core.metrics``.
+"""
+import atexit
+import logging
+import threading
+import time
+import zlib
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .ingestion import apply_fixes, apply_rfid_scans
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GPS, RFID = 'gps', 'rfid'
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _route_key(kind, item):
+    return item['imei'] if kind == GPS else item['rfid_device_id']
+
+
+class IngestQueue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shards = None    # per worker: deque of (kind, items, enqueued at)
+        self._ready = None     # per worker: Condition on self._lock
+        self._depth = 0        # items queued across all shards
+        self._workers = []
+        self._dead_letters = deque()
+
+    def _setup(self):
+        # called with the lock held
+        if self._shards is None:
+            count = max(settings.GPS_INGEST_WORKERS, 1)
+            self._shards = [deque() for _ in range(count)]
+            self._ready = [threading.Condition(self._lock) for _ in range(count)]
+
+    def depth(self):
+        return self._depth
+
+    def submit(self, kind, items):
+        """Enqueue a list of parsed fixes (``GPS``) or scans (``RFID``)."""
+        enqueued_at = time.monotonic()
+        capacity = settings.GPS_INGEST_QUEUE_SIZE
+        with self._lock:
+            self._setup()
+            if self._depth + len(items) > capacity:
+                if settings.GPS_INGEST_OVERFLOW != 'drop_oldest' or len(items) > capacity:
+                    metrics.incr('ingest.rejected', len(items))
+                    raise QueueFull()
+                self._drop_oldest(self._depth + len(items) - capacity)
+
+            by_shard = {}
+            for item in items:
+                shard = zlib.crc32(str(_route_key(kind, item)).encode()) % len(self._shards)
+                by_shard.setdefault(shard, []).append(item)
+            for shard, shard_items in by_shard.items():
+                self._shards[shard].append((kind, shard_items, enqueued_at))
+                self._ready[shard].notify()
+            self._depth += len(items)
+            depth = self._depth
+        metrics.incr('ingest.enqueued', len(items))
+        metrics.set_gauge('ingest.queue_depth', depth)
+        self._ensure_workers()
+
+    def _drop_oldest(self, count):
+        # called with the lock held
+        while count > 0:
+            shards = [entries for entries in self._shards if entries]
+            if not shards:
+                return
+            _, items, _ = min(shards, key=lambda entries: entries[0][2]).popleft()
+            self._depth -= len(items)
+            count -= len(items)
+            metrics.incr('ingest.dropped', len(items))
+
+    def _take(self, shard):
+        # called with the lock held: up to GPS_INGEST_BATCH_SIZE items of one shard
+        entries = self._shards[shard]
+        batch = [entries.popleft()]
+        size = len(batch[0][1])
+        while entries and size + len(entries[0][1]) <= settings.GPS_INGEST_BATCH_SIZE:
+            batch.append(entries.popleft())
+            size += len(batch[-1][1])
+        self._depth -= size
+        return batch
+
+    # ─── Workers ────────────────────────────────────────
+
+    def _ensure_workers(self):
+        if len(self._workers) >= settings.GPS_INGEST_WORKERS:
+            return
+        with self._lock:
+            if not self._workers:
+                atexit.register(self.drain)
+            while len(self._workers) < min(settings.GPS_INGEST_WORKERS, len(self._shards)):
+                shard = len(self._workers)
+                worker = threading.Thread(
+                    target=self._run_worker, args=(shard,), name=f"ingest-worker-{shard}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _run_worker(self, shard):
+        shards, ready = self._shards, self._ready
+        while True:
+            with self._lock:
+                while not shards[shard]:
+                    ready[shard].wait()
+                batch = self._take(shard)
+            try:
+                self._process(batch)
+            finally:
+                close_old_connections()
+
+    def drain(self):
+        """Process everything queued on the calling thread (tests, shutdown)."""
+        processed = 0
+        while True:
+            with self._lock:
+                shard = next((i for i, entries in enumerate(self._shards or ()) if entries), None)
+                if shard is None:
+                    return processed
+                batch = self._take(shard)
+            self._process(batch)
+            processed += sum(len(items) for _, items, _ in batch)
+
+    def _process(self, batch):
+        fixes, scans = [], []
+        for kind, items, _ in batch:
+            (fixes if kind == GPS else scans).extend(items)
+
+        oldest = min(enqueued_at for _, _, enqueued_at in batch)
+        metrics.set_gauge('ingest.lag_ms', round((time.monotonic() - oldest) * 1000, 1))
+        if fixes:
+            self._apply(GPS, fixes)
+        if scans:
+            self._apply(RFID, scans)
+        metrics.set_gauge('ingest.queue_depth', self.depth())
+
+    def _apply(self, kind, items):
+        apply = apply_fixes if kind == GPS else apply_rfid_scans
+        retries = settings.GPS_INGEST_MAX_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                apply(items)
+                metrics.incr('ingest.processed', len(items))
+                return
+            except Exception:
+                if attempt < retries:
+                    logger.warning("Applying %d queued items failed, retrying", len(items), exc_info=True)
+                    metrics.incr('ingest.retried', len(items))
+                    close_old_connections()
+                    time.sleep(settings.GPS_INGEST_RETRY_BACKOFF * 2 ** attempt)
+                    continue
+                logger.exception("Failed to apply %d queued ingestion items, dead-lettered", len(items))
+        metrics.incr('ingest.failed', len(items))
+        with self._lock:
+            self._dead_letters.append((kind, items))
+            while len(self._dead_letters) > settings.GPS_INGEST_DEAD_LETTERS:
+                self._dead_letters.popleft()
+            metrics.set_gauge('ingest.dead_letters', len(self._dead_letters))
+
+    def dead_letters(self):
+        """``(kind, items)`` of batches that failed every retry, oldest first."""
+        with self._lock:
+            return list(self._dead_letters)
+
+    def reset(self):
+        with self._lock:
+            self._shards = None
+            self._ready = None
+            self._depth = 0
+            self._workers = []
+            self._dead_letters.clear()
+
+
+ingest_queue = IngestQueue()
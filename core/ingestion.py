@@ -0,0 +1,431 @@
+# core/ingestion.py
+"""
+Shared GPS ingestion pipeline.
+
+Every transport (single HTTP fix, HTTP batch, ...) turns its payload into
+normalized fix dicts with ``parse_fix`` and hands them to ``apply_fixes``, so
+vehicle locations, zone entry/exit events, overspeed offences (against the
+zone's speed limit, see ``core.geofences``), ambulance ETAs and bus stop
+arrivals are updated the same way no matter how the fix arrived. RFID speed
+scans go through ``parse_rfid_scan`` / ``apply_rfid_scans`` the same way.
+"""
+import logging
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .arrivals import arrival_predictor
+from .geofences import geofences
+from .history import history_buffer
+from .live_state import live_store
+from .models import User, Vehicle, Booking, Offence, PositionFix, RFIDDevice, Geofence, GeofenceEvent
+from .overspeed import overspeed_detector
+from .pubsub import BUS_POSITIONS, booking_topic, hub, sse_event, ws_message
+from .snapshots import vehicle_changed
+from .spatial import spatial_index
+from .watermarks import watermarks
+from .roads import eta_engine
+
+logger = logging.getLogger(__name__)
+
+BUS_SPEED_LIMIT = 40      # CAMPUS_SPEED_LIMIT (km/h), outside any Geofence
+STUDENT_SPEED_LIMIT = 40  # CAMPUS_SPEED_LIMIT (km/h), gates without a Geofence
+AMBULANCE_SPEED = 60      # assumed ambulance speed for ETA (km/h)
+
+ACTIVE_BOOKING_STATUSES = ['accepted', 'in_progress']
+
+
+class InvalidFix(ValueError):
+    """Raised when a device payload cannot be turned into a fix."""
+
+
+def _parse_timestamp(value):
+    if value in (None, ''):
+        return timezone.now()
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        parsed = parse_datetime(str(value))
+    except (ValueError, OverflowError, OSError):
+        # well-formed but impossible dates, epochs out of range, NaN
+        parsed = None
+    if parsed is None:
+        raise InvalidFix("timestamp must be ISO 8601 or unix seconds")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _check_not_future(recorded_at):
+    # GT06 units in particular report garbage dates before GPS lock
+    if recorded_at > timezone.now() + timedelta(seconds=settings.GPS_MAX_FUTURE_SKEW):
+        raise InvalidFix("timestamp is in the future")
+    return recorded_at
+
+
+def parse_fix(data):
+    """
+    Validate one raw device payload (imei, latitude, longitude, speed,
+    optional timestamp and sequence number) and return a normalized fix dict.
+    """
+    imei = data.get('imei')
+    latitude = data.get('latitude')
+    longitude = data.get('longitude')
+    speed = data.get('speed')
+    timestamp = data.get('timestamp')
+    seq = data.get('seq')
+
+    if any(value in (None, '') for value in (imei, latitude, longitude, speed)):
+        raise InvalidFix("Missing required fields")
+
+    try:
+        lat, lng, spd = float(latitude), float(longitude), float(speed)
+        seq = int(seq) if seq not in (None, '') else None
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidFix("latitude, longitude, speed and seq must be numbers")
+    if not all(math.isfinite(value) for value in (lat, lng, spd)):
+        raise InvalidFix("latitude, longitude and speed must be finite")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise InvalidFix("latitude or longitude out of range")
+
+    return {
+        'imei': str(imei),
+        'lat': lat,
+        'lng': lng,
+        'speed': spd,
+        'timestamp': timestamp or timezone.now().isoformat(),
+        'recorded_at': _check_not_future(_parse_timestamp(timestamp)),
+        'seq': seq,
+    }
+
+
+def fix_location(fix):
+    """The shape stored in ``Vehicle.current_location``."""
+    return {
+        "lat": fix['lat'],
+        "lng": fix['lng'],
+        "speed": fix['speed'],
+        "timestamp": fix['timestamp'],
+    }
+
+
+def _fix_order(fix):
+    return (fix['recorded_at'], -1 if fix['seq'] is None else fix['seq'])
+
+
+def apply_fixes(fixes):
+    """
+    Apply a batch of parsed fixes (any mix of IMEIs) in one transaction.
+
+    Duplicates are dropped before any DB work and all IMEIs are resolved
+    with a single query. Fixes newer than the vehicle's watermark drive live
+    state (newest one only, persisted write-behind), overspeed episodes and
+    booking ETAs; late fixes only go to the buffered position history.
+    """
+    result = {
+        'applied': 0, 'vehicles': {}, 'unknown_imeis': [], 'offences': 0,
+        'duplicates': 0, 'late': 0, 'zone_events': 0,
+    }
+    fixes, result['duplicates'] = watermarks.drop_duplicates(fixes)
+    if not fixes:
+        return result
+
+    by_imei = {}
+    for fix in fixes:
+        by_imei.setdefault(fix['imei'], []).append(fix)
+
+    vehicles = {
+        v.gps_imei: v
+        for v in Vehicle.objects.filter(gps_imei__in=list(by_imei))
+    }
+    result['unknown_imeis'] = sorted(imei for imei in by_imei if imei not in vehicles)
+
+    latest_by_vehicle = {}
+    history = []
+    offences = {}
+    zone_events = []
+    latest_ambulance_fix = {}
+    eta_updates = []
+    classified = []
+    new_offences = []
+
+    vehicle_ids = [vehicle.id for vehicle in vehicles.values()]
+    episodes = overspeed_detector.checkpoint(vehicle_ids)
+    zones = geofences.checkpoint(vehicle_ids)
+    try:
+        for imei, vehicle in vehicles.items():
+            new, late, duplicates = watermarks.classify(
+                vehicle, sorted(by_imei[imei], key=_fix_order)
+            )
+            result['duplicates'] += duplicates
+            result['late'] += len(late)
+            if not new and not late:
+                continue
+            classified.append((imei, new, late))
+
+            history.extend(PositionFix.from_fix(vehicle.id, fix) for fix in late + new)
+            result['vehicles'][imei] = vehicle
+            result['applied'] += len(new) + len(late)
+            if not new:
+                continue
+
+            latest = new[-1]
+            latest_by_vehicle[imei] = latest
+
+            for fix in new:
+                zone, events = geofences.observe(vehicle.id, fix['lat'], fix['lng'])
+                zone_events.extend(_zone_event(vehicle, fix, kind, z) for kind, z in events)
+
+                # Overspeed check (bus only) - one offence per episode
+                if vehicle.vehicle_type == 'bus':
+                    limit = zone.speed_limit if zone is not None else BUS_SPEED_LIMIT
+                    offence = overspeed_detector.observe(vehicle, fix, fix_location(fix), limit)
+                    if offence is not None:
+                        offences[id(offence)] = offence
+
+            if vehicle.vehicle_type == 'ambulance':
+                latest_ambulance_fix[vehicle.id] = latest
+
+        with transaction.atomic():
+            new_offences = [o for o in offences.values() if o._state.adding]
+            changed_offences = [o for o in offences.values() if not o._state.adding]
+            if new_offences:
+                # another worker may have inserted the same episode already
+                Offence.objects.bulk_create(new_offences, ignore_conflicts=True)
+                adopted = _adopt_existing_offences(new_offences)
+                changed_offences += adopted
+                result['offences'] = len(new_offences) - len(adopted)
+            if changed_offences:
+                Offence.objects.bulk_update(
+                    changed_offences, ['speed', 'duration_seconds', 'end_location', 'ended_at']
+                )
+
+            if zone_events:
+                _save_zone_events(zone_events)
+                result['zone_events'] = len(zone_events)
+
+            # If ambulance → update active booking ETA
+            if latest_ambulance_fix:
+                eta_updates = _update_booking_etas(latest_ambulance_fix)
+    except Exception:
+        # a retry or retransmit of this batch must find episodes and zones as they were
+        overspeed_detector.restore(episodes)
+        geofences.restore(zones)
+        for offence in new_offences:
+            offence._state.adding = True
+        raise
+
+    # only now: a batch that failed above must not make its retransmits look duplicate/late
+    for imei, new, late in classified:
+        watermarks.advance(imei, new, late)
+
+    for imei, fix in latest_by_vehicle.items():
+        vehicle = vehicles[imei]
+        vehicle.current_location = fix_location(fix)
+        live_store.update(
+            vehicle.id, imei, vehicle.current_location,
+            recorded_at=fix['recorded_at'], seq=fix['seq']
+        )
+        spatial_index.update(
+            vehicle.id, vehicle.vehicle_type, vehicle.vehicle_number, fix['lat'], fix['lng'], fix['recorded_at']
+        )
+        if vehicle.vehicle_type == 'bus' and vehicle.route_id:
+            arrival_predictor.observe(vehicle, fix, BUS_SPEED_LIMIT)
+    history_buffer.add(history)
+    vehicle_changed(*(vehicles[imei] for imei in latest_by_vehicle))
+    _publish_bus_positions(vehicles[imei] for imei in latest_by_vehicle)
+    _publish_eta_updates(eta_updates)
+
+    return result
+
+
+def _adopt_existing_offences(offences):
+    """
+    Point offences whose episode row another worker inserted first at that
+    row; returns them, as they still need their stats written.
+    """
+    rows = Offence.objects.filter(
+        offence_type='bus_overspeed',
+        vehicle_id__in={o.vehicle_id for o in offences},
+        timestamp__in={o.timestamp for o in offences},
+    ).values_list('vehicle_id', 'timestamp', 'id')
+    existing = {(vehicle_id, timestamp): pk for vehicle_id, timestamp, pk in rows}
+    adopted = []
+    for offence in offences:
+        pk = existing.get((offence.vehicle_id, offence.timestamp))
+        if pk is not None and pk != offence.pk:
+            offence.pk = pk
+            adopted.append(offence)
+    return adopted
+
+
+def _zone_event(vehicle, fix, kind, zone):
+    return GeofenceEvent(
+        vehicle=vehicle,
+        vehicle_number=vehicle.vehicle_number,
+        geofence_id=zone.id,
+        geofence_name=zone.name,
+        event=kind,
+        location=fix_location(fix),
+        timestamp=fix['recorded_at'],
+    )
+
+
+def _save_zone_events(events):
+    # a zone deleted since this process loaded it keeps only its name
+    zone_ids = {event.geofence_id for event in events}
+    existing = {str(pk) for pk in Geofence.objects.filter(id__in=zone_ids).values_list('id', flat=True)}
+    for event in events:
+        if event.geofence_id not in existing:
+            event.geofence_id = None
+    GeofenceEvent.objects.bulk_create(events)
+
+
+def _publish_bus_positions(vehicles):
+    """Push new bus locations to ``public/buses/stream/`` subscribers."""
+    if not hub.has_subscribers(BUS_POSITIONS):
+        return
+    for vehicle in vehicles:
+        if vehicle.vehicle_type != 'bus':
+            continue
+        payload = sse_event('position', {
+            'vehicle_id': str(vehicle.id),
+            'vehicle_number': vehicle.vehicle_number,
+            'location': vehicle.current_location,
+        })
+        hub.publish(BUS_POSITIONS, str(vehicle.id), payload)
+
+
+def _update_booking_etas(latest_fix_by_vehicle):
+    """Recompute ETAs of the vehicles' active bookings; returns ``[(booking, fix)]``."""
+    bookings = Booking.objects.filter(
+        vehicle_id__in=list(latest_fix_by_vehicle),
+        status__in=ACTIVE_BOOKING_STATUSES
+    ).order_by('created_at')
+
+    to_update = []
+    updates = []
+    seen = set()
+    for booking in bookings:
+        if booking.vehicle_id in seen:
+            continue
+        seen.add(booking.vehicle_id)
+        fix = latest_fix_by_vehicle[booking.vehicle_id]
+        # position still goes out to the student even without an ETA
+        updates.append((booking, fix))
+        if not booking.user_location:
+            continue
+        u_loc = booking.user_location
+        eta = eta_engine.estimate(
+            fix['lat'], fix['lng'],
+            u_loc.get('lat', 0), u_loc.get('lng', 0),
+            AMBULANCE_SPEED, at=fix['recorded_at']
+        )
+        booking.eta_minutes = round(eta, 1)
+        to_update.append(booking)
+
+    if to_update:
+        Booking.objects.bulk_update(to_update, ['eta_minutes'])
+    return updates
+
+
+def _publish_eta_updates(updates):
+    """Push ETA / ambulance position to the booking's WebSocket subscribers."""
+    for booking, fix in updates:
+        topic = booking_topic(booking.id)
+        if not hub.has_subscribers(topic):
+            continue
+        hub.publish(topic, 'eta', ws_message('eta_update', {
+            'booking_id': str(booking.id),
+            'status': booking.status,
+            'eta_minutes': booking.eta_minutes,
+            'vehicle_location': fix_location(fix),
+        }))
+
+
+def parse_rfid_scan(data):
+    """Validate one RFID gate scan and return a normalized scan dict."""
+    rfid_device_id = data.get('rfid_device_id')
+    student_registration_id = data.get('student_registration_id')
+    speed = data.get('speed')
+
+    if any(value in (None, '') for value in (rfid_device_id, student_registration_id, speed)):
+        raise InvalidFix("Missing required fields")
+
+    try:
+        spd = float(speed)
+    except (TypeError, ValueError):
+        raise InvalidFix("speed must be a number")
+    if not math.isfinite(spd):
+        raise InvalidFix("speed must be finite")
+
+    return {
+        'rfid_device_id': str(rfid_device_id),
+        'student_registration_id': str(student_registration_id),
+        'student_name': data.get('student_name'),
+        'speed': spd,
+        'recorded_at': _parse_timestamp(data.get('timestamp')),
+    }
+
+
+def _gate_limit(device):
+    zone = device.geofence
+    if zone is not None and zone.is_active:
+        return zone.speed_limit
+    return STUDENT_SPEED_LIMIT
+
+
+def apply_rfid_scans(scans):
+    """Record student speed violations for a batch of scans with bulk queries."""
+    result = {'devices': {}, 'unknown_devices': [], 'violations': 0}
+    if not scans:
+        return result
+
+    devices = {
+        d.rfid_id: d
+        for d in RFIDDevice.objects.filter(
+            rfid_id__in={s['rfid_device_id'] for s in scans}
+        ).select_related('geofence')
+    }
+    result['devices'] = devices
+    result['unknown_devices'] = sorted(
+        {s['rfid_device_id'] for s in scans if s['rfid_device_id'] not in devices}
+    )
+
+    speeding = [
+        s for s in scans
+        if s['rfid_device_id'] in devices and s['speed'] > _gate_limit(devices[s['rfid_device_id']])
+    ]
+    if not speeding:
+        return result
+
+    students = {
+        u.registration_id: u
+        for u in User.objects.filter(
+            registration_id__in={s['student_registration_id'] for s in speeding}
+        )
+    }
+    offences = []
+    for scan in speeding:
+        device = devices[scan['rfid_device_id']]
+        offences.append(Offence(
+            offence_type='student_speed',
+            student=students.get(scan['student_registration_id']),
+            student_name=scan['student_name'],
+            student_registration_id=scan['student_registration_id'],
+            speed=scan['speed'],
+            speed_limit=_gate_limit(device),
+            location={"name": device.location_name},
+            rfid_number=scan['rfid_device_id'],
+            timestamp=scan['recorded_at'],
+            is_paid=False
+        ))
+        logger.warning(f"Student speed violation: {scan['student_name']} @ {scan['speed']} km/h")
+
+    Offence.objects.bulk_create(offences)
+    result['violations'] = len(offences)
+    return result
@@ -0,0 +1,175 @@
+# core/live_state.py
+"""
+Process-level store of the latest fix per vehicle.
+
+Ingestion writes here instead of rewriting the ``Vehicle`` row on every fix,
+and read paths (active buses, bus ETA, booking acceptance) are served from
+memory. Dirty locations (with the fix watermark, see ``core.watermarks``)
+are persisted to ``Vehicle.current_location`` / ``last_fix_*`` on a
+write-behind schedule:
+
+* ``GPS_LIVE_STATE_FLUSH_INTERVAL`` - seconds a location may stay unflushed
+  (the durability bound; ``0`` makes the store write-through).
+* ``GPS_LIVE_STATE_MAX_DIRTY`` - flush early once this many vehicles are
+  pending, so a burst never holds an unbounded amount of unsaved state.
+
+Each worker process has its own store. Reads compare the device time of
+this process's location with the persisted ``Vehicle.last_fix_at`` and
+return the persisted ``current_location`` when the row is as new or newer:
+another worker or the socket servers may have applied a later fix, and a
+process that has not seen a fix for a vehicle has nothing better anyway.
+
+``discard`` waits for a flush that is already writing, so a location taken
+out of the dirty set just before a trip ended cannot be written back over
+the row the caller clears afterwards.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class LiveVehicleStore:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()   # held while a flush writes; see discard
+        self._locations = {}      # vehicle_id -> location dict
+        self._recorded_at = {}    # vehicle_id -> device time of that location
+        self._imei_index = {}     # imei -> vehicle_id
+        self._dirty = {}          # vehicle_id -> (location, recorded_at, seq) waiting to be persisted
+        self._dirty_since = None  # monotonic time of the oldest unflushed update
+        self._flusher = None
+
+    @staticmethod
+    def _key(vehicle_id):
+        return str(vehicle_id)
+
+    @property
+    def flush_interval(self):
+        return settings.GPS_LIVE_STATE_FLUSH_INTERVAL
+
+    @property
+    def max_dirty(self):
+        return settings.GPS_LIVE_STATE_MAX_DIRTY
+
+    # ─── Writes ─────────────────────────────────────────
+
+    def update(self, vehicle_id, imei, location, recorded_at=None, seq=None):
+        key = self._key(vehicle_id)
+        with self._lock:
+            self._locations[key] = location
+            self._recorded_at[key] = recorded_at
+            self._imei_index[imei] = key
+            self._dirty[key] = (location, recorded_at, seq)
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+        self.maybe_flush()
+
+    def discard(self, vehicle_id):
+        """Forget a vehicle's live location (e.g. its trip ended)."""
+        key = self._key(vehicle_id)
+        with self._flush_lock, self._lock:
+            self._locations.pop(key, None)
+            self._recorded_at.pop(key, None)
+            self._dirty.pop(key, None)
+
+    # ─── Reads ──────────────────────────────────────────
+
+    def get(self, vehicle_id):
+        return self._locations.get(self._key(vehicle_id))
+
+    def get_by_imei(self, imei):
+        key = self._imei_index.get(imei)
+        return self._locations.get(key) if key else None
+
+    def newest(self, vehicle_id, persisted_location, persisted_at):
+        """This process's location, unless the persisted one is at least as new."""
+        key = self._key(vehicle_id)
+        location = self._locations.get(key)
+        if location is None:
+            return persisted_location
+        recorded_at = self._recorded_at.get(key)
+        if persisted_at is not None and (recorded_at is None or persisted_at >= recorded_at):
+            return persisted_location
+        return location
+
+    def location_for(self, vehicle):
+        """Latest known location of a ``Vehicle`` row, see ``newest``."""
+        return self.newest(vehicle.id, vehicle.current_location, vehicle.last_fix_at)
+
+    # ─── Write-behind ───────────────────────────────────
+
+    def pending(self):
+        return len(self._dirty)
+
+    def maybe_flush(self):
+        with self._lock:
+            if not self._dirty:
+                return 0
+            age = time.monotonic() - self._dirty_since
+            due = age >= self.flush_interval or len(self._dirty) >= self.max_dirty
+        return self.flush() if due else 0
+
+    def flush(self):
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        from .models import Vehicle
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._dirty_since = None
+        if not dirty:
+            return 0
+
+        vehicles = [
+            Vehicle(id=key, current_location=loc, last_fix_at=recorded_at, last_fix_seq=seq)
+            for key, (loc, recorded_at, seq) in dirty.items()
+        ]
+        try:
+            Vehicle.objects.bulk_update(vehicles, ['current_location', 'last_fix_at', 'last_fix_seq'])
+        except Exception:
+            logger.exception("Live state flush failed, will retry")
+            with self._lock:
+                for key, entry in dirty.items():
+                    self._dirty.setdefault(key, entry)
+                if self._dirty_since is None:
+                    self._dirty_since = time.monotonic()
+            return 0
+        return len(vehicles)
+
+    def start_flusher(self):
+        """Run the write-behind flush on a daemon thread (server processes only)."""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="live-state-flusher", daemon=True
+            )
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(max(self.flush_interval, 0.1))
+            try:
+                self.maybe_flush()
+            finally:
+                close_old_connections()
+
+    def reset(self):
+        with self._lock:
+            self._locations.clear()
+            self._recorded_at.clear()
+            self._imei_index.clear()
+            self._dirty.clear()
+            self._dirty_since = None
+
+
+live_store = LiveVehicleStore()
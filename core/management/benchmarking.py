@@ -0,0 +1,13 @@
+# core/management/benchmarking.py
+"""Helpers shared by the ``benchmark_*`` management commands."""
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back, leaving no benchmark rows."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
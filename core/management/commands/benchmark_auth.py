@@ -0,0 +1,49 @@
+# core/management/commands/benchmark_auth.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from core.authentication import UUIDJWTAuthentication
+from core.management.benchmarking import rolled_back
+from core.models import User
+from core.token_cache import token_cache
+from core.user_cache import user_cache
+from core.utils import create_access_token
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark of authentication overhead per request, with and without the auth caches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self._run(options['requests'])
+
+    def _run(self, count):
+        driver = User.objects.create(name="Benchmark Driver", phone="bench-auth-0002", role="driver")
+        request = APIRequestFactory().get('/api/driver/pending-bookings/',
+                                          HTTP_AUTHORIZATION=f"Bearer {create_access_token(driver)}")
+        auth = UUIDJWTAuthentication()
+        modes = [
+            ("no caches", dict(AUTH_TOKEN_CACHE_SIZE=0, AUTH_USER_CACHE_TTL=0, AUTH_TRUST_ROLE_CLAIM=False)),
+            ("user cache", dict(AUTH_TOKEN_CACHE_SIZE=0, AUTH_TRUST_ROLE_CLAIM=False)),
+            ("user + token cache", dict(AUTH_TRUST_ROLE_CLAIM=False)),
+            ("token cache + claims", dict(AUTH_TRUST_ROLE_CLAIM=True)),
+        ]
+
+        self.stdout.write(f"{'mode':<22} {'us/request':>11}")
+        for label, overrides in modes:
+            token_cache.reset()
+            user_cache.reset()
+            with override_settings(**overrides):
+                auth.authenticate(request)   # warm up
+                start = time.perf_counter()
+                for _ in range(count):
+                    user, _token = auth.authenticate(request)
+                    user.role
+                elapsed = time.perf_counter() - start
+            self.stdout.write(f"{label:<22} {elapsed / count * 1e6:>11.1f}")
@@ -0,0 +1,53 @@
+# core/management/commands/benchmark_auth_queries.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from core.management.benchmarking import rolled_back
+from core.models import Trip, User, Vehicle
+from core.user_cache import user_cache
+from core.utils import create_access_token
+from core.views import ActiveTripView, PendingBookingsView
+
+
+class Command(BaseCommand):
+    help = (
+        "Count queries per request for driver polling endpoints with the user "
+        "loaded eagerly (old behaviour) vs. the claims-backed lazy user"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self._run(options['requests'])
+
+    def _run(self, count):
+        driver = User.objects.create(name="Benchmark Driver", phone="bench-auth-0001", role="driver")
+        vehicle = Vehicle.objects.create(vehicle_number="BENCH-AUTH-1", gps_imei="bench-auth-1", vehicle_type="bus")
+        Trip.objects.create(vehicle=vehicle, driver=driver, vehicle_number=vehicle.vehicle_number,
+                            driver_name=driver.name, vehicle_type="bus")
+        header = f"Bearer {create_access_token(driver)}"
+        factory = APIRequestFactory()
+        endpoints = [
+            ("driver/pending-bookings/", PendingBookingsView.as_view()),
+            ("driver/active-trip/", ActiveTripView.as_view()),
+        ]
+        modes = [
+            ("eager user, no cache", dict(AUTH_TRUST_ROLE_CLAIM=False, AUTH_USER_CACHE_TTL=0)),
+            # user cache off here too, so only the lazy user is measured
+            ("claims + lazy user", dict(AUTH_TRUST_ROLE_CLAIM=True, AUTH_USER_CACHE_TTL=0)),
+        ]
+
+        self.stdout.write(f"{'endpoint':<26} {'mode':<22} {'queries/request':>16}")
+        for path, view in endpoints:
+            for label, overrides in modes:
+                user_cache.reset()
+                with override_settings(**overrides), CaptureQueriesContext(connection) as queries:
+                    for _ in range(count):
+                        response = view(factory.get(f'/api/{path}', HTTP_AUTHORIZATION=header))
+                        if response.status_code != 200:
+                            raise CommandError(f"{path} answered {response.status_code}: {response.data}")
+                self.stdout.write(f"{path:<26} {label:<22} {len(queries) / count:>16.2f}")
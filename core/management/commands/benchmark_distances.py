@@ -0,0 +1,48 @@
+# core/management/commands/benchmark_distances.py
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import utils
+
+
+class Command(BaseCommand):
+    help = "Compare per-pair calculate_distance with the batched calculate_distances"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1_000, 100_000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if utils.np is None:
+            raise CommandError("NumPy is not installed; the batched helpers are running the scalar fallback")
+
+        rng = random.Random(options['seed'])
+        origin = (20.2961, 85.8245)
+        self.stdout.write(f"{'points':>8} {'scalar ms':>11} {'batched ms':>11} {'speedup':>8} {'max diff km':>12}")
+        for size in options['sizes']:
+            lats = [origin[0] + rng.uniform(-0.5, 0.5) for _ in range(size)]
+            lngs = [origin[1] + rng.uniform(-0.5, 0.5) for _ in range(size)]
+
+            scalar, scalar_ms = self._time(options['repeat'], lambda: [
+                utils.calculate_distance(origin[0], origin[1], la, ln) for la, ln in zip(lats, lngs)
+            ])
+            batched, batched_ms = self._time(options['repeat'], lambda: utils.calculate_distances(
+                origin[0], origin[1], lats, lngs
+            ))
+            max_diff = max(abs(a - b) for a, b in zip(scalar, batched))
+            self.stdout.write(
+                f"{size:>8} {scalar_ms:>11.3f} {batched_ms:>11.3f} "
+                f"{scalar_ms / batched_ms:>7.1f}x {max_diff:>12.2e}"
+            )
+
+    @staticmethod
+    def _time(repeat, fn):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+        return result, best * 1000
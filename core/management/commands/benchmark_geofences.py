@@ -0,0 +1,65 @@
+# core/management/commands/benchmark_geofences.py
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.geofences import GeofenceIndex, Zone
+
+
+class Command(BaseCommand):
+    help = "Time zone lookups on synthetic polygons: grid index vs. checking every zone"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zones', type=int, default=300)
+        parser.add_argument('--vertices', type=int, default=12, help="Points per polygon")
+        parser.add_argument('--fixes', type=int, default=100_000)
+        parser.add_argument('--cell-deg', type=float, default=settings.GEOFENCE_CELL_DEG)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        origin = (20.2961, 85.8245)
+        # zones of 50-400 m scattered over a ~10 km campus, some overlapping
+        zones = []
+        for i in range(options['zones']):
+            lat = origin[0] + rng.uniform(-0.05, 0.05)
+            lng = origin[1] + rng.uniform(-0.05, 0.05)
+            radius = rng.uniform(0.0005, 0.004)
+            polygon = [
+                (lat + radius * rng.uniform(0.6, 1) * math.sin(a), lng + radius * rng.uniform(0.6, 1) * math.cos(a))
+                for a in (2 * math.pi * k / options['vertices'] for k in range(options['vertices']))
+            ]
+            zones.append(Zone(i, f"zone-{i}", rng.choice([10, 20, 30]), rng.randint(0, 2), polygon))
+        fixes = [
+            (origin[0] + rng.uniform(-0.055, 0.055), origin[1] + rng.uniform(-0.055, 0.055))
+            for _ in range(options['fixes'])
+        ]
+
+        start = time.perf_counter()
+        index = GeofenceIndex(zones, options['cell_deg'])
+        build_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        indexed = [index.zone_at(lat, lng) for lat, lng in fixes]
+        indexed_s = time.perf_counter() - start
+
+        ordered = sorted(zones, key=lambda z: (-z.priority, z.area))
+        start = time.perf_counter()
+        scanned = [next((z for z in ordered if z.contains(lat, lng)), None) for lat, lng in fixes]
+        scanned_s = time.perf_counter() - start
+
+        mismatches = sum(1 for a, b in zip(indexed, scanned) if a is not b)
+        inside = sum(1 for zone in indexed if zone is not None)
+        self.stdout.write(
+            f"{len(zones)} zones x {options['vertices']} points, {len(fixes)} fixes "
+            f"({inside / len(fixes):.0%} inside a zone), index built in {build_ms:.1f} ms"
+        )
+        for label, seconds in (("grid index", indexed_s), ("full scan", scanned_s)):
+            self.stdout.write(
+                f"  {label:<10} {len(fixes) / seconds:>12,.0f} fixes/s {seconds / len(fixes) * 1e6:>8.2f} us/fix"
+            )
+        if mismatches:
+            self.stderr.write(f"{mismatches} lookups disagree with the full scan")
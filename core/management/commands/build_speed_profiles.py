@@ -0,0 +1,51 @@
+# core/management/commands/build_speed_profiles.py
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import PositionFix
+from core.roads import eta_engine
+from core.speed_profiles import SpeedProfileBuilder
+
+
+class Command(BaseCommand):
+    help = "Aggregate recorded fixes into per-road-segment, per-hour-of-week speed profiles (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=28, help="How much history to aggregate")
+        parser.add_argument('--output', default=settings.ROAD_SPEED_PROFILE_PATH)
+        parser.add_argument('--min-samples', type=int, default=settings.ROAD_PROFILE_MIN_SAMPLES)
+
+    def handle(self, *args, **options):
+        network = eta_engine.network
+        if network is None:
+            raise CommandError("No road graph loaded; set ROAD_GRAPH_PATH")
+        if not options['output']:
+            raise CommandError("No output path; set ROAD_SPEED_PROFILE_PATH or pass --output")
+
+        since = timezone.now() - timedelta(days=options['days'])
+        fixes = PositionFix.objects.filter(timestamp__gte=since).values_list(
+            'lat_e7', 'lng_e7', 'speed_dkmh', 'timestamp'
+        )
+        builder = SpeedProfileBuilder(network)
+        for lat_e7, lng_e7, speed, timestamp in fixes.iterator(chunk_size=5000):
+            builder.add(
+                lat_e7 / PositionFix.COORD_SCALE,
+                lng_e7 / PositionFix.COORD_SCALE,
+                speed / PositionFix.SPEED_SCALE,
+                timestamp,
+            )
+
+        profile = builder.build(options['min_samples'])
+        # write-then-rename so servers never load a half written file
+        tmp_path = f"{options['output']}.tmp"
+        profile.save(tmp_path)
+        os.replace(tmp_path, options['output'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {builder.snapped} fixes on {len(network.segments)} segments "
+            f"({builder.skipped} parked/off-road skipped), {profile.covered():.1%} of segment-hours covered"
+        ))
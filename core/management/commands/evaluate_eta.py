@@ -0,0 +1,77 @@
+# core/management/commands/evaluate_eta.py
+import bisect
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.ingestion import AMBULANCE_SPEED, BUS_SPEED_LIMIT
+from core.models import PositionFix, Trip
+from core.roads import eta_engine
+from core.utils import calculate_distance, calculate_eta
+
+
+def _summary(errors):
+    if not errors:
+        return "n=0"
+    ordered = sorted(abs(e) for e in errors)
+    mae = sum(ordered) / len(ordered)
+    bias = sum(errors) / len(errors)
+    p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+    return f"n={len(errors)} MAE={mae:.2f} bias={bias:+.2f} p90={p90:.2f}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay recorded trips and report ETA error (minutes) of the ETA engine "
+        "against the straight-line estimate"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--vehicle-type', choices=['bus', 'ambulance'], default='bus')
+        parser.add_argument('--horizons', type=float, nargs='+', default=[5, 10, 20],
+                            help="Minutes ahead to predict")
+        parser.add_argument('--stride', type=int, default=10, help="Use every Nth fix as a start point")
+
+    def handle(self, *args, **options):
+        speed = BUS_SPEED_LIMIT if options['vehicle_type'] == 'bus' else AMBULANCE_SPEED
+        since = timezone.now() - timedelta(days=options['days'])
+        trips = Trip.objects.filter(
+            vehicle_type=options['vehicle_type'], start_time__gte=since
+        ).values_list('id', flat=True)
+
+        errors = {h: {'engine': [], 'straight': []} for h in options['horizons']}
+        trip_count = 0
+        for trip_id in trips.iterator():
+            track = [
+                (lat_e7 / PositionFix.COORD_SCALE, lng_e7 / PositionFix.COORD_SCALE, ts)
+                for lat_e7, lng_e7, ts in PositionFix.objects.filter(trip_id=trip_id)
+                .order_by('timestamp').values_list('lat_e7', 'lng_e7', 'timestamp')
+            ]
+            if len(track) < 2:
+                continue
+            trip_count += 1
+            times = [ts for _, _, ts in track]
+            for i in range(0, len(track), options['stride']):
+                lat, lng, start = track[i]
+                for horizon in options['horizons']:
+                    j = bisect.bisect_left(times, start + timedelta(minutes=horizon), lo=i + 1)
+                    if j >= len(track):
+                        break
+                    to_lat, to_lng, arrived = track[j]
+                    actual = (arrived - start).total_seconds() / 60
+                    engine = eta_engine.estimate(lat, lng, to_lat, to_lng, speed, at=start)
+                    straight = calculate_eta(calculate_distance(lat, lng, to_lat, to_lng), speed)
+                    errors[horizon]['engine'].append(engine - actual)
+                    errors[horizon]['straight'].append(straight - actual)
+
+        network = eta_engine.network
+        model = "straight line only (no road graph)" if network is None else (
+            "road graph + speed profile" if network.profile else "road graph, fixed speeds"
+        )
+        self.stdout.write(f"{trip_count} {options['vehicle_type']} trips, engine: {model}")
+        for horizon, by_model in errors.items():
+            self.stdout.write(f"  {horizon:g} min ahead")
+            self.stdout.write(f"    engine   {_summary(by_model['engine'])}")
+            self.stdout.write(f"    straight {_summary(by_model['straight'])}")
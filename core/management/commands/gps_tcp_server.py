@@ -0,0 +1,35 @@
+# core/management/commands/gps_tcp_server.py
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.history import history_buffer
+from core.live_state import live_store
+from core.tcp_ingest import GPSTCPServer
+
+
+class Command(BaseCommand):
+    help = "Run the asyncio TCP listener for GT06 binary GPS trackers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=settings.GPS_TCP_PORT)
+
+    def handle(self, *args, **options):
+        live_store.start_flusher()
+        history_buffer.start_flusher()
+        try:
+            asyncio.run(self._serve(options['host'], options['port']))
+        except KeyboardInterrupt:
+            self.stdout.write("GPS TCP listener stopped")
+
+    async def _serve(self, host, port):
+        server = GPSTCPServer()
+        listener = await server.start(host, port)
+        self.stdout.write(self.style.SUCCESS(f"GPS TCP listener on {host}:{port}"))
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            await server.close()
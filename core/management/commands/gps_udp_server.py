@@ -0,0 +1,45 @@
+# core/management/commands/gps_udp_server.py
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.history import history_buffer
+from core.live_state import live_store
+from core.udp_ingest import GPSUDPIngestor
+
+
+class Command(BaseCommand):
+    help = "Run the UDP datagram listener for GPS fixes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=settings.GPS_UDP_PORT)
+        parser.add_argument(
+            '--stats-interval', type=float, default=60,
+            help="Seconds between counter log lines (0 disables)"
+        )
+
+    def handle(self, *args, **options):
+        live_store.start_flusher()
+        history_buffer.start_flusher()
+        try:
+            asyncio.run(self._serve(options['host'], options['port'], options['stats_interval']))
+        except KeyboardInterrupt:
+            self.stdout.write("GPS UDP listener stopped")
+
+    async def _serve(self, host, port, stats_interval):
+        ingestor = GPSUDPIngestor()
+        await ingestor.start(host, port)
+        self.stdout.write(self.style.SUCCESS(f"GPS UDP listener on {host}:{port}"))
+        try:
+            while True:
+                await asyncio.sleep(stats_interval or 3600)
+                if stats_interval:
+                    stats = ingestor.stats
+                    self.stdout.write(
+                        "received={received} accepted={accepted} duplicates={duplicates} "
+                        "malformed={malformed} dropped={dropped}".format(**stats)
+                    )
+        finally:
+            await ingestor.close()
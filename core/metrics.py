@@ -0,0 +1,48 @@
+# core/metrics.py
+"""
+Process-local counters and gauges, exposed to admins via admin/metrics/.
+
+Rates are registered once as a numerator/denominator pair of counters and
+computed on read, e.g. ``metrics.register_rate('gps.dedupe_rate',
+'gps.fixes.duplicate', 'gps.fixes.received')``.
+"""
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._rates = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name, value):
+        self._gauges[name] = value
+
+    def register_rate(self, name, numerator, denominator):
+        self._rates[name] = (numerator, denominator)
+
+    def get(self, name):
+        return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        rates = {}
+        for name, (numerator, denominator) in self._rates.items():
+            total = counters.get(denominator, 0)
+            rates[name] = round(counters.get(numerator, 0) / total, 4) if total else 0.0
+        return {"counters": counters, "gauges": dict(self._gauges), "rates": rates}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+
+
+metrics = Metrics()
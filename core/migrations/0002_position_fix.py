@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PositionFix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('lat_e7', models.IntegerField()),
+                ('lng_e7', models.IntegerField()),
+                ('speed_dkmh', models.PositiveIntegerField(default=0)),
+                ('trip', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='position_fixes', to='core.trip')),
+                ('vehicle', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='position_fixes', to='core.vehicle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vehicle', 'timestamp'], name='positionfix_vehicle_ts'), models.Index(fields=['trip', 'timestamp'], name='positionfix_trip_ts')],
+            },
+        ),
+    ]
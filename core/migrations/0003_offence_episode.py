@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_position_fix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offence',
+            name='duration_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='offence',
+            name='end_location',
+            field=models.JSONField(blank=True, default=dict, null=True),
+        ),
+        migrations.AddField(
+            model_name='offence',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
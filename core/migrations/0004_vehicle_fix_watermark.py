@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_offence_episode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='last_fix_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='last_fix_seq',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_bus_routes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Geofence',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('polygon', models.JSONField()),
+                ('speed_limit', models.FloatField()),
+                ('priority', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='rfiddevice',
+            name='geofence',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rfid_devices', to='core.geofence'),
+        ),
+        migrations.CreateModel(
+            name='GeofenceEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('vehicle_number', models.CharField(max_length=50)),
+                ('geofence_name', models.CharField(max_length=100)),
+                ('event', models.CharField(choices=[('enter', 'Enter'), ('exit', 'Exit')], max_length=10)),
+                ('location', models.JSONField(blank=True, default=dict)),
+                ('timestamp', models.DateTimeField()),
+                ('geofence', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.geofence')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geofence_events', to='core.vehicle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vehicle', 'timestamp'], name='core_geofen_vehicle_1e09ef_idx'), models.Index(fields=['timestamp'], name='core_geofen_timesta_16c56c_idx')],
+            },
+        ),
+    ]
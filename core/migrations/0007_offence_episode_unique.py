@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_geofences'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='offence',
+            constraint=models.UniqueConstraint(condition=models.Q(('offence_type', 'bus_overspeed')), fields=('vehicle', 'timestamp'), name='offence_overspeed_episode'),
+        ),
+    ]
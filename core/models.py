@@ -113,6 +113,12 @@ class Vehicle(BaseModel):
     assigned_driver_name = models.CharField(max_length=255, blank=True, null=True)
     is_out_of_station = models.BooleanField(default=False)
     current_location = models.JSONField(default=dict, blank=True, null=True)
+    # high watermark of the newest applied fix (device time + sequence)
+    last_fix_at = models.DateTimeField(null=True, blank=True)
+    last_fix_seq = models.PositiveIntegerField(null=True, blank=True)
+    route = models.ForeignKey(
+        'BusRoute', on_delete=models.SET_NULL, null=True, blank=True, related_name='buses'
+    )
 
     def __str__(self):
         return f"{self.vehicle_number} ({self.vehicle_type})"
@@ -135,6 +141,55 @@ class Trip(BaseModel):
         ]
 
 
+class PositionFix(models.Model):
+    """
+    Append-only GPS track. Coordinates and speed are stored as scaled
+    integers instead of JSON so millions of rows stay compact.
+    """
+    COORD_SCALE = 10_000_000   # degrees * 1e7 (~1 cm)
+    SPEED_SCALE = 10           # km/h * 10
+
+    vehicle = models.ForeignKey(
+        Vehicle, on_delete=models.CASCADE, related_name='position_fixes', db_index=False
+    )
+    trip = models.ForeignKey(
+        Trip, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='position_fixes', db_index=False
+    )
+    timestamp = models.DateTimeField()
+    lat_e7 = models.IntegerField()
+    lng_e7 = models.IntegerField()
+    speed_dkmh = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vehicle', 'timestamp'], name='positionfix_vehicle_ts'),
+            models.Index(fields=['trip', 'timestamp'], name='positionfix_trip_ts'),
+        ]
+
+    @property
+    def lat(self):
+        return self.lat_e7 / self.COORD_SCALE
+
+    @property
+    def lng(self):
+        return self.lng_e7 / self.COORD_SCALE
+
+    @property
+    def speed(self):
+        return self.speed_dkmh / self.SPEED_SCALE
+
+    @classmethod
+    def from_fix(cls, vehicle_id, fix):
+        return cls(
+            vehicle_id=vehicle_id,
+            timestamp=fix['recorded_at'],
+            lat_e7=round(fix['lat'] * cls.COORD_SCALE),
+            lng_e7=round(fix['lng'] * cls.COORD_SCALE),
+            speed_dkmh=max(0, round(fix['speed'] * cls.SPEED_SCALE)),
+        )
+
+
 class Booking(BaseModel):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -179,9 +234,12 @@ class Offence(BaseModel):
     student_registration_id = models.CharField(max_length=50, blank=True, null=True)
     vehicle = models.ForeignKey(Vehicle, on_delete=models.SET_NULL, null=True, blank=True)
     vehicle_number = models.CharField(max_length=50, blank=True, null=True)
-    speed = models.FloatField()
+    speed = models.FloatField()                 # max speed over the episode
     speed_limit = models.FloatField()
-    location = models.JSONField(default=dict, blank=True, null=True)
+    location = models.JSONField(default=dict, blank=True, null=True)       # where it started
+    end_location = models.JSONField(default=dict, blank=True, null=True)
+    duration_seconds = models.FloatField(default=0)
+    ended_at = models.DateTimeField(null=True, blank=True)
     rfid_number = models.CharField(max_length=100, blank=True, null=True)
     is_paid = models.BooleanField(default=False)
     timestamp = models.DateTimeField(default=timezone.now)
@@ -191,11 +249,88 @@ class Offence(BaseModel):
             models.Index(fields=['offence_type', 'is_paid']),
             models.Index(fields=['timestamp']),
         ]
+        constraints = [
+            # an overspeed episode is keyed by vehicle + start time: two ingest
+            # workers that both detect it still record one offence
+            models.UniqueConstraint(
+                fields=['vehicle', 'timestamp'], condition=models.Q(offence_type='bus_overspeed'),
+                name='offence_overspeed_episode',
+            ),
+        ]
 
 
 class RFIDDevice(BaseModel):
     rfid_id = models.CharField(max_length=100, unique=True)
     location_name = models.CharField(max_length=255)
+    # zone whose speed limit applies to scans at this gate
+    geofence = models.ForeignKey(
+        'Geofence', on_delete=models.SET_NULL, null=True, blank=True, related_name='rfid_devices'
+    )
+
+    def __str__(self):
+        return f"{self.rfid_id} @ {self.location_name}"
+
+
+class BusStop(BaseModel):
+    name = models.CharField(max_length=255)
+    lat = models.FloatField()
+    lng = models.FloatField()
+
+    def __str__(self):
+        return self.name
+
+
+class BusRoute(BaseModel):
+    name = models.CharField(max_length=100, unique=True)
+    # after the last stop the bus starts over at the first one
+    is_loop = models.BooleanField(default=False)
+    stops = models.ManyToManyField(BusStop, through='RouteStop', related_name='routes')
+
+    def __str__(self):
+        return self.name
+
+
+class RouteStop(models.Model):
+    """Position of a stop on a route (a stop can be on several routes)."""
+    route = models.ForeignKey(BusRoute, on_delete=models.CASCADE, related_name='route_stops')
+    stop = models.ForeignKey(BusStop, on_delete=models.CASCADE, related_name='route_stops')
+    sequence = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['route', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'sequence'], name='routestop_route_sequence'),
+        ]
+
+
+class Geofence(BaseModel):
+    name = models.CharField(max_length=100, unique=True)
+    polygon = models.JSONField()          # [[lat, lng], ...] outer ring
+    speed_limit = models.FloatField()     # km/h inside the zone
+    # where zones overlap the higher priority wins, then the smaller zone
+    priority = models.IntegerField(default=0)
+    is_active = models.BooleanField(default=True)
 
     def __str__(self):
-        return f"{self.rfid_id} @ {self.location_name}"
\ No newline at end of file
+        return f"{self.name} ({self.speed_limit:g} km/h)"
+
+
+class GeofenceEvent(BaseModel):
+    EVENT_CHOICES = (
+        ('enter', 'Enter'),
+        ('exit', 'Exit'),
+    )
+
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='geofence_events')
+    vehicle_number = models.CharField(max_length=50)      # denormalized
+    geofence = models.ForeignKey(Geofence, on_delete=models.SET_NULL, null=True, blank=True)
+    geofence_name = models.CharField(max_length=100)      # denormalized
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    location = models.JSONField(default=dict, blank=True)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vehicle', 'timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
@@ -0,0 +1,176 @@
+# core/otp_store.py
+"""
+Where one-time passwords (password reset, ambulance pickup) live until they
+are used or expire after ``OTP_TTL_SECONDS``.
+
+``OTP_STORE_BACKEND`` picks the implementation:
+
+* ``core.otp_store.InMemoryOTPStore`` (default) - a dict in this process.
+  Fine for ``runserver`` and tests, but an OTP sent through one worker
+  cannot be verified on another.
+* ``core.otp_store.SQLiteOTPStore`` - a SQLite file at ``OTP_STORE_PATH``
+  shared by every worker process on the host.
+
+Either way an OTP verifies at most once: ``consume`` checks and deletes it
+atomically. Expired codes are refused on lookup and are also swept out at
+most every ``OTP_SWEEP_SECONDS``, so codes nobody verifies don't pile up.
+"""
+import hmac
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class OTPStore(ABC):
+    """Interface of the OTP backends."""
+
+    @abstractmethod
+    def put(self, key, code, ttl=None):
+        """Store ``code`` for ``key`` (a phone number), replacing any previous one."""
+
+    @abstractmethod
+    def consume(self, key, code):
+        """True, and forget the code, if ``code`` is the unexpired one for ``key``."""
+
+    @abstractmethod
+    def sweep(self):
+        """Drop expired codes; returns how many."""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every code."""
+
+    def _ttl(self, ttl):
+        return settings.OTP_TTL_SECONDS if ttl is None else ttl
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._swept_at >= settings.OTP_SWEEP_SECONDS:
+            self._swept_at = now
+            self.sweep()
+
+
+class InMemoryOTPStore(OTPStore):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {}   # key -> (code, expires at as time.time())
+        self._swept_at = time.monotonic()
+
+    def put(self, key, code, ttl=None):
+        self._maybe_sweep()
+        with self._lock:
+            self._codes[str(key)] = (str(code), time.time() + self._ttl(ttl))
+
+    def consume(self, key, code):
+        self._maybe_sweep()
+        key = str(key)
+        with self._lock:
+            entry = self._codes.get(key)
+            if entry is None:
+                return False
+            if entry[1] <= time.time():
+                del self._codes[key]
+                return False
+            if not hmac.compare_digest(entry[0], str(code)):
+                return False
+            del self._codes[key]
+            return True
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires) in self._codes.items() if expires <= now]
+            for key in expired:
+                del self._codes[key]
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._codes.clear()
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class SQLiteOTPStore(OTPStore):
+    def __init__(self, path=None):
+        self.path = str(path or settings.OTP_STORE_PATH)
+        self._local = threading.local()
+        self._swept_at = time.monotonic()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS otp ("
+            " key TEXT PRIMARY KEY, code TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # one connection per thread; never reuse one inherited across a fork
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def put(self, key, code, ttl=None):
+        self._maybe_sweep()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO otp (key, code, expires) VALUES (?, ?, ?)",
+            (str(key), str(code), time.time() + self._ttl(ttl)),
+        )
+
+    def consume(self, key, code):
+        self._maybe_sweep()
+        # a single DELETE is atomic: of two concurrent verifications only one gets the row
+        deleted = self._connection().execute(
+            "DELETE FROM otp WHERE key = ? AND code = ? AND expires > ?",
+            (str(key), str(code), time.time()),
+        ).rowcount
+        return deleted == 1
+
+    def sweep(self):
+        return self._connection().execute(
+            "DELETE FROM otp WHERE expires <= ?", (time.time(),)
+        ).rowcount
+
+    def clear(self):
+        self._connection().execute("DELETE FROM otp")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM otp").fetchone()[0]
+
+
+class OTPStores:
+    """Lazily builds the configured backend, shared by the whole process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = import_string(settings.OTP_STORE_BACKEND)()
+        return self._backend
+
+    def put(self, key, code, ttl=None):
+        self.backend.put(key, code, ttl)
+
+    def consume(self, key, code):
+        return self.backend.consume(key, code)
+
+    def reset(self):
+        """Forget stored codes and rebuild the backend on next use (tests)."""
+        with self._lock:
+            backend, self._backend = self._backend, None
+        if backend is not None:
+            backend.clear()
+
+
+otp_store = OTPStores()
@@ -0,0 +1,152 @@
+# core/overspeed.py
+"""
+Streaming overspeed detection: one ``Offence`` per speeding episode.
+
+Per vehicle, an episode opens when speed goes above the limit and only
+closes once speed drops to ``limit - GPS_OVERSPEED_EXIT_HYSTERESIS`` (or the
+device goes quiet for ``GPS_OVERSPEED_MAX_GAP`` seconds), so hovering around
+the limit does not flap. The offence is only recorded once the episode has
+lasted ``GPS_OVERSPEED_MIN_DURATION`` seconds; after that every fix updates
+its max speed, duration and end location.
+
+State lives in the process; an episode that spans a restart is recorded
+as two offences. Episodes of vehicles that stop reporting are swept out
+once nothing was heard from them for ``GPS_OVERSPEED_MAX_GAP`` seconds.
+The database holds one offence per (vehicle, episode start) - see the
+``offence_overspeed_episode`` constraint - so two workers that detect the
+same episode share one row.
+"""
+import copy
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Offence
+
+logger = logging.getLogger(__name__)
+
+
+class _Episode:
+    __slots__ = ('started_at', 'start_location', 'last_at', 'last_location',
+                 'max_speed', 'limit', 'offence', 'seen')
+
+    def __init__(self, fix, location, limit):
+        self.started_at = self.last_at = fix['recorded_at']
+        self.start_location = self.last_location = location
+        self.max_speed = fix['speed']
+        self.limit = limit
+        self.offence = None
+        self.seen = time.monotonic()
+
+    @property
+    def duration(self):
+        return (self.last_at - self.started_at).total_seconds()
+
+
+class OverspeedDetector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._episodes = {}   # vehicle_id -> _Episode
+        self._swept_at = time.monotonic()
+
+    def observe(self, vehicle, fix, location, limit):
+        """
+        Feed one fix (in time order per vehicle). Returns the episode's
+        ``Offence`` when it was opened or changed by this fix, else ``None``.
+        Unsaved offences (``_state.adding``) still need to be inserted.
+        """
+        with self._lock:
+            self._maybe_sweep()
+            episode = self._episodes.get(vehicle.id)
+
+            if episode is not None and self._has_ended(episode, fix):
+                del self._episodes[vehicle.id]
+                episode = None
+
+            if episode is None:
+                if fix['speed'] <= limit:
+                    return None
+                episode = self._episodes[vehicle.id] = _Episode(fix, location, limit)
+            else:
+                episode.last_at = max(episode.last_at, fix['recorded_at'])
+                episode.last_location = location
+                episode.max_speed = max(episode.max_speed, fix['speed'])
+                episode.seen = time.monotonic()
+
+            if episode.offence is None:
+                if episode.duration < settings.GPS_OVERSPEED_MIN_DURATION:
+                    return None
+                episode.offence = Offence(
+                    offence_type='bus_overspeed',
+                    driver_id=vehicle.assigned_to_id,
+                    driver_name=vehicle.assigned_driver_name,
+                    vehicle=vehicle,
+                    vehicle_number=vehicle.vehicle_number,
+                    speed_limit=episode.limit,
+                    location=episode.start_location,
+                    timestamp=episode.started_at,
+                    is_paid=False
+                )
+                logger.warning(f"Overspeed: {vehicle.vehicle_number} @ {fix['speed']} km/h")
+
+            offence = episode.offence
+            offence.speed = episode.max_speed
+            offence.duration_seconds = episode.duration
+            offence.end_location = episode.last_location
+            offence.ended_at = episode.last_at
+            return offence
+
+    def checkpoint(self, vehicle_ids):
+        """The episodes of ``vehicle_ids`` as they are now, for ``restore``."""
+        with self._lock:
+            return {vehicle_id: copy.copy(self._episodes.get(vehicle_id)) for vehicle_id in vehicle_ids}
+
+    def restore(self, checkpoint):
+        """Put back episodes saved by ``checkpoint`` (their batch was rolled back)."""
+        with self._lock:
+            for vehicle_id, episode in checkpoint.items():
+                if episode is None:
+                    self._episodes.pop(vehicle_id, None)
+                else:
+                    self._episodes[vehicle_id] = episode
+
+    @staticmethod
+    def _has_ended(episode, fix):
+        gap = (fix['recorded_at'] - episode.last_at).total_seconds()
+        if gap > settings.GPS_OVERSPEED_MAX_GAP:
+            return True
+        return fix['speed'] <= episode.limit - settings.GPS_OVERSPEED_EXIT_HYSTERESIS
+
+    def _maybe_sweep(self):
+        # called with the lock held
+        now = time.monotonic()
+        if now - self._swept_at >= settings.GPS_OVERSPEED_MAX_GAP:
+            self._swept_at = now
+            self._sweep(now)
+
+    def _sweep(self, now):
+        idle = [
+            vehicle_id for vehicle_id, episode in self._episodes.items()
+            if now - episode.seen > settings.GPS_OVERSPEED_MAX_GAP
+        ]
+        for vehicle_id in idle:
+            del self._episodes[vehicle_id]
+        return len(idle)
+
+    def sweep(self):
+        """Forget episodes of vehicles that went quiet; returns how many."""
+        with self._lock:
+            return self._sweep(time.monotonic())
+
+    def __len__(self):
+        return len(self._episodes)
+
+    def reset(self):
+        with self._lock:
+            self._episodes.clear()
+            self._swept_at = time.monotonic()
+
+
+overspeed_detector = OverspeedDetector()
@@ -1,21 +1,25 @@
 # core/permissions.py
 from rest_framework.permissions import BasePermission, IsAuthenticated
 
+
+def _has_role(request, *roles):
+    # request.user is usually a LazyUser (core/authentication.py): is_authenticated
+    # and role come from the token claims, so this never loads the User row
+    user = request.user
+    return bool(user is not None and user.is_authenticated and getattr(user, 'role', None) in roles)
+
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
-        return bool(request.user and request.user.is_authenticated and request.user.role == 'admin')
+        return _has_role(request, 'admin')
 
 class IsDriver(BasePermission):
     def has_permission(self, request, view):
-        return bool(request.user and request.user.is_authenticated and request.user.role == 'driver')
+        return _has_role(request, 'driver')
 
 class IsStudent(BasePermission):
     def has_permission(self, request, view):
-        return bool(request.user and request.user.is_authenticated and request.user.role == 'student')
+        return _has_role(request, 'student')
 
 class IsDriverOrAdmin(BasePermission):
     def has_permission(self, request, view):
-        return bool(
-            request.user and request.user.is_authenticated and
-            request.user.role in ['driver', 'admin']
-        )
\ No newline at end of file
+        return _has_role(request, 'driver', 'admin')
@@ -0,0 +1,194 @@
+# core/pubsub.py
+"""
+Fan-out of live updates to streaming clients (SSE, WebSockets).
+
+Publishers (ingestion, usually on a worker thread) serialize an update once
+and offer the same bytes to every subscriber of a topic. Each subscriber has
+a latest-value-wins mailbox keyed by e.g. vehicle id: a slow client that has
+not read yet just gets its pending entry overwritten, so its memory is
+bounded by the number of keys (the fleet size), never by the update rate.
+
+How a publish reaches the subscribers is up to ``PUBSUB_BACKEND``:
+
+* ``core.pubsub.InMemoryBackend`` (default) - same process only; enough for
+  a single ASGI server and for tests.
+* ``core.pubsub.RedisBackend`` - relays through Redis pub/sub
+  (``PUBSUB_REDIS_URL``) so updates ingested by any worker reach
+  subscribers on every ASGI process. Needs the optional ``redis`` package.
+  The listener reconnects with backoff when the connection drops.
+
+Live updates are best effort: a publish that fails is logged and counted
+(``pubsub.publish_failed``), never raised into the ingestion pipeline.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BUS_POSITIONS = 'bus_positions'
+MAX_RECONNECT_BACKOFF = 30   # seconds
+
+
+def booking_topic(booking_id):
+    return f'booking:{booking_id}'
+
+
+def _dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def sse_event(event, data):
+    """Encode one Server-Sent Events message (done once per update, not per client)."""
+    return f"event: {event}\ndata: {_dumps(data)}\n\n".encode()
+
+
+def ws_message(message_type, data):
+    """Encode one WebSocket text message as UTF-8 JSON bytes."""
+    return _dumps({'type': message_type, **data}).encode()
+
+
+class Subscription:
+    def __init__(self, loop):
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._event = asyncio.Event()
+        self.closed = False
+
+    def offer(self, key, payload):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = payload
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # the subscriber's event loop is gone
+            self.closed = True
+
+    async def get(self):
+        """Wait for and return every pending payload, oldest first."""
+        await self._event.wait()
+        with self._lock:
+            payloads = list(self._pending.values())
+            self._pending.clear()
+            self._event.clear()
+        return payloads
+
+    def pending(self):
+        return len(self._pending)
+
+
+class InMemoryBackend:
+    local = True
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, topic, key, payload):
+        return self.hub.deliver(topic, key, payload)
+
+
+class RedisBackend:
+    local = False
+    channel = 'gps-pubsub'
+
+    def __init__(self, hub):
+        import redis
+
+        self.hub = hub
+        self.client = redis.Redis.from_url(settings.PUBSUB_REDIS_URL)
+        self._listener = threading.Thread(target=self._listen, name="pubsub-redis", daemon=True)
+        self._listener.start()
+
+    def publish(self, topic, key, payload):
+        return self.client.publish(self.channel, json.dumps([topic, key, payload.decode()]))
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1
+                for message in pubsub.listen():
+                    self._deliver(message)
+            except Exception:
+                logger.warning("Redis pub/sub connection lost, reconnecting in %ss", backoff, exc_info=True)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RECONNECT_BACKOFF)
+
+    def _deliver(self, message):
+        try:
+            topic, key, payload = json.loads(message['data'])
+            self.hub.deliver(topic, key, payload.encode())
+        except Exception:
+            logger.exception("Bad pub/sub message")
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = {}
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = import_string(settings.PUBSUB_BACKEND)(self)
+        return self._backend
+
+    def subscribe(self, topic):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, topic, subscription):
+        with self._lock:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def has_subscribers(self, topic):
+        """False only when nobody can be listening, so publishers may skip serializing."""
+        return not self.backend.local or bool(self._topics.get(topic))
+
+    def publish(self, topic, key, payload):
+        try:
+            return self.backend.publish(topic, key, payload)
+        except Exception:
+            # e.g. Redis is down: the fix is applied already, only the push is lost
+            logger.warning("Publishing to %s failed", topic, exc_info=True)
+            metrics.incr('pubsub.publish_failed')
+            return 0
+
+    def deliver(self, topic, key, payload):
+        """Hand a published payload to this process's subscribers."""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.offer(key, payload)
+            if subscription.closed:
+                self.unsubscribe(topic, subscription)
+        return len(subscribers)
+
+    def reset(self):
+        with self._lock:
+            self._topics.clear()
+
+
+hub = Hub()
@@ -0,0 +1,496 @@
+# core/roads.py
+"""
+Road-network ETAs over a local campus graph.
+
+``ROAD_GRAPH_PATH`` points at a GeoJSON FeatureCollection of road
+``LineString`` / ``MultiLineString`` features (an OSM extract exported as
+GeoJSON works). Optional feature properties:
+
+* ``maxspeed`` - km/h cap for that road (number or "30 km/h" style string)
+* ``oneway``   - ``true`` / ``"yes"`` to only allow travel in drawing order
+
+Positions are snapped to the closest road segment (through a grid over the
+segments), and travel time between two snapped positions comes from tables
+precomputed per vehicle speed:
+
+* all-pairs node-to-node minutes when the graph has at most
+  ``ROAD_GRAPH_APSP_MAX_NODES`` nodes (a campus graph usually does), so a
+  query is a handful of table lookups;
+* otherwise landmark (ALT) distance tables that steer an A* search.
+
+When a historical speed profile (``core.speed_profiles``,
+``ROAD_SPEED_PROFILE_PATH``) is available, each segment's travel time uses
+the speed recorded on it at that hour of the week instead of the fixed
+vehicle speed; tables are then per (speed, hour) and the most recently used
+``ROAD_PROFILE_TABLE_CACHE`` of them are kept.
+
+Tables take seconds to build on a large graph, so the request path never
+builds one: a missing table is queued for a background thread and, until
+it is ready, the query runs its own Dijkstra over the (cached) per-hour edge
+weights - a few milliseconds. The table of the next hour is queued as soon
+as the current one is in use, so it is normally ready before the clock
+gets there.
+
+``eta_engine.estimate()`` is the drop-in for ``calculate_eta(calculate_distance(...))``:
+with no graph configured, or for a point further than ``ROAD_SNAP_MAX_KM``
+from any road, it returns the straight-line estimate as before.
+"""
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+from .speed_profiles import HOURS_PER_WEEK, SpeedProfile, graph_fingerprint, hour_of_week
+from .utils import calculate_distance, calculate_distances, calculate_eta, calculate_etas
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEG_LAT = 111.32
+SNAP_CELL_KM = 0.1
+INF = float('inf')
+
+
+def _parse_speed(value):
+    if value in (None, ''):
+        return None
+    match = re.match(r'\s*(\d+(?:\.\d+)?)', str(value))
+    speed = float(match.group(1)) if match else None
+    return speed if speed else None
+
+
+def _dijkstra(adjacency, source):
+    dist = [INF] * len(adjacency)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for v, w in adjacency[u]:
+            nd = d + w
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def _search(adjacency, sources, targets):
+    """Cheapest (source cost + path + target cost) for one query, without a table."""
+    dist = {}
+    heap = []
+    for node, cost in sources:
+        if cost < dist.get(node, INF):
+            dist[node] = cost
+            heapq.heappush(heap, (cost, node))
+    best = INF
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d >= best:
+            break
+        if d > dist[u]:
+            continue
+        if u in targets:
+            best = min(best, d + targets[u])
+        for v, w in adjacency[u]:
+            nd = d + w
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return best
+
+
+class _AllPairs:
+    """Node-to-node minutes for every pair (float32 rows)."""
+
+    def __init__(self, adjacency):
+        self.rows = [array('f', _dijkstra(adjacency, source)) for source in range(len(adjacency))]
+
+    def minutes(self, u, v):
+        return self.rows[u][v]
+
+
+class _Landmarks:
+    """A* with the ALT (landmark + triangle inequality) lower bound."""
+
+    def __init__(self, adjacency, reverse, count):
+        self.adjacency = adjacency
+        self.to_node = []     # landmark -> node
+        self.from_node = []   # node -> landmark
+        # farthest-first landmark choice
+        landmark = 0
+        nearest = [INF] * len(adjacency)
+        for _ in range(min(count, len(adjacency))):
+            forward = _dijkstra(adjacency, landmark)
+            self.to_node.append(forward)
+            self.from_node.append(_dijkstra(reverse, landmark))
+            nearest = [min(a, b) for a, b in zip(nearest, forward)]
+            reachable = [(d, n) for n, d in enumerate(nearest) if d < INF]
+            landmark = max(reachable)[1] if reachable else landmark
+
+    def _bound(self, v, target):
+        best = 0.0
+        for to_node, from_node in zip(self.to_node, self.from_node):
+            if to_node[target] < INF and to_node[v] < INF:
+                best = max(best, to_node[target] - to_node[v])
+            if from_node[v] < INF and from_node[target] < INF:
+                best = max(best, from_node[v] - from_node[target])
+        return best
+
+    def minutes(self, source, target):
+        if source == target:
+            return 0.0
+        dist = {source: 0.0}
+        heap = [(self._bound(source, target), source)]
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u == target:
+                return dist[u]
+            for v, w in self.adjacency[u]:
+                nd = dist[u] + w
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd + self._bound(v, target), v))
+        return INF
+
+
+class RoadNetwork:
+    def __init__(self, nodes, segments):
+        self.nodes = nodes          # [(lat, lng)]
+        self.segments = segments    # [(a, b, length_km, maxspeed, forward, backward)]
+        lat0 = sum(lat for lat, _ in nodes) / len(nodes)
+        self._kx = KM_PER_DEG_LAT * math.cos(math.radians(lat0))
+        self._ky = KM_PER_DEG_LAT
+        self._xy = [self._project(lat, lng) for lat, lng in nodes]
+        self._grid = {}
+        for index, (a, b, *_rest) in enumerate(segments):
+            (ax, ay), (bx, by) = self._xy[a], self._xy[b]
+            for cx in range(math.floor(min(ax, bx) / SNAP_CELL_KM), math.floor(max(ax, bx) / SNAP_CELL_KM) + 1):
+                for cy in range(math.floor(min(ay, by) / SNAP_CELL_KM), math.floor(max(ay, by) / SNAP_CELL_KM) + 1):
+                    self._grid.setdefault((cx, cy), []).append(index)
+        self._tables = OrderedDict()
+        self._adjacencies = OrderedDict()
+        self._builds = {}          # key -> Future of a table being built
+        self._builder = None
+        self._generation = 0       # bumped when the profile changes
+        self._lock = threading.Lock()
+        self.profile = None
+
+    @classmethod
+    def from_geojson(cls, path):
+        with open(path) as fh:
+            data = json.load(fh)
+
+        node_ids, nodes, segments = {}, [], []
+
+        def node(coord):
+            key = (round(coord[1], 7), round(coord[0], 7))
+            if key not in node_ids:
+                node_ids[key] = len(nodes)
+                nodes.append(key)
+            return node_ids[key]
+
+        for feature in data.get('features', []):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'LineString':
+                lines = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiLineString':
+                lines = geometry['coordinates']
+            else:
+                continue
+            props = feature.get('properties') or {}
+            maxspeed = _parse_speed(props.get('maxspeed'))
+            oneway = str(props.get('oneway', '')).lower() in ('true', 'yes', '1')
+            for line in lines:
+                for start, end in zip(line, line[1:]):
+                    a, b = node(start), node(end)
+                    if a == b:
+                        continue
+                    length = calculate_distance(nodes[a][0], nodes[a][1], nodes[b][0], nodes[b][1])
+                    segments.append((a, b, length, maxspeed, True, not oneway))
+
+        if not segments:
+            raise ValueError(f"No road LineStrings in {path}")
+        return cls(nodes, segments)
+
+    def _project(self, lat, lng):
+        return lng * self._kx, lat * self._ky
+
+    # ─── Snapping ───────────────────────────────────────
+
+    def snap(self, lat, lng, max_km=None):
+        """``(segment index, fraction along it, off-road km)`` of the closest road, or None."""
+        max_km = settings.ROAD_SNAP_MAX_KM if max_km is None else max_km
+        px, py = self._project(lat, lng)
+        cx, cy = math.floor(px / SNAP_CELL_KM), math.floor(py / SNAP_CELL_KM)
+        reach = math.ceil(max_km / SNAP_CELL_KM)
+        best = None
+        seen = set()
+        for r in range(reach + 1):
+            # anything outside the first r rings is at least (r - 1) cells away
+            if best is not None and best[2] <= (r - 1) * SNAP_CELL_KM:
+                break
+            for gx in range(cx - r, cx + r + 1):
+                for gy in range(cy - r, cy + r + 1):
+                    if max(abs(gx - cx), abs(gy - cy)) != r:
+                        continue
+                    for index in self._grid.get((gx, gy), ()):
+                        if index in seen:
+                            continue
+                        seen.add(index)
+                        t, off = self._project_on(index, px, py)
+                        if best is None or off < best[2]:
+                            best = (index, t, off)
+        return best if best is not None and best[2] <= max_km else None
+
+    def _project_on(self, index, px, py):
+        a, b = self.segments[index][:2]
+        (ax, ay), (bx, by) = self._xy[a], self._xy[b]
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        t = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+        return t, math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+    # ─── Travel times ───────────────────────────────────
+
+    def _edge_minutes(self, index, speed, hour=None):
+        _, _, length, maxspeed, _, _ = self.segments[index]
+        observed = self.profile.speed(index, hour) if self.profile and hour is not None else None
+        if observed:
+            # recorded speeds already reflect the limit and the usual traffic
+            return length / min(observed, speed) * 60
+        return length / (min(speed, maxspeed) if maxspeed else speed) * 60
+
+    def _adjacency(self, speed, reverse=False, hour=None):
+        adjacency = [[] for _ in self.nodes]
+        for index, (a, b, _length, _maxspeed, forward, backward) in enumerate(self.segments):
+            w = self._edge_minutes(index, speed, hour)
+            if forward:
+                adjacency[b if reverse else a].append((a if reverse else b, w))
+            if backward:
+                adjacency[a if reverse else b].append((b if reverse else a, w))
+        return adjacency
+
+    def use_profile(self, profile):
+        if profile is not None and profile.fingerprint != graph_fingerprint(self):
+            raise ValueError("Speed profile was built for a different road graph")
+        with self._lock:
+            self.profile = profile
+            self._generation += 1
+            self._tables.clear()
+            self._adjacencies.clear()
+
+    def _key(self, speed, hour):
+        return (speed, hour if self.profile else None)
+
+    def adjacency(self, key):
+        """Edge weights for one (speed, hour) key; one pass over the segments."""
+        with self._lock:
+            adjacency = self._adjacencies.get(key)
+            if adjacency is not None:
+                self._adjacencies.move_to_end(key)
+                return adjacency
+        adjacency = self._adjacency(key[0], hour=key[1])
+        with self._lock:
+            self._adjacencies[key] = adjacency
+            while len(self._adjacencies) > settings.ROAD_PROFILE_TABLE_CACHE:
+                self._adjacencies.popitem(last=False)
+        return adjacency
+
+    def table(self, speed, hour=None, wait=False):
+        """
+        Precomputed node-to-node table for one vehicle speed (and hour of
+        week). A missing one is built in the background and None returned
+        meanwhile, unless ``wait`` (server warm-up, tests).
+        """
+        key = self._key(speed, hour)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+        if table is None:
+            future = self._build_later(key)
+            if not wait:
+                return None
+            return future.result() if future is not None else self._tables.get(key)
+        if self.profile is not None and hour is not None:
+            self._build_later(self._key(speed, (hour + 1) % HOURS_PER_WEEK))
+        return table
+
+    def _build_later(self, key):
+        with self._lock:
+            future = self._builds.get(key)
+            if future is not None or key in self._tables:
+                return future
+            if self._builder is None:
+                self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='road-tables')
+            future = self._builds[key] = self._builder.submit(self._build, key, self._generation)
+        return future
+
+    def _build(self, key, generation):
+        try:
+            adjacency = self.adjacency(key)
+            if len(self.nodes) <= settings.ROAD_GRAPH_APSP_MAX_NODES:
+                table = _AllPairs(adjacency)
+            else:
+                table = _Landmarks(adjacency, self._adjacency(key[0], reverse=True, hour=key[1]),
+                                   settings.ROAD_GRAPH_LANDMARKS)
+            with self._lock:
+                if generation == self._generation:   # else built for a replaced profile
+                    self._tables[key] = table
+                    while len(self._tables) > settings.ROAD_PROFILE_TABLE_CACHE:
+                        self._tables.popitem(last=False)
+            return table
+        except Exception:
+            logger.exception("Building road table %s failed", key)
+            raise
+        finally:
+            with self._lock:
+                self._builds.pop(key, None)
+
+    def wait_for_tables(self):
+        """Block until every queued table build has finished."""
+        for future in list(self._builds.values()):
+            future.result()
+
+    def travel_minutes(self, from_lat, from_lng, to_lat, to_lng, speed, hour=None):
+        """
+        Minutes by road at ``speed`` km/h (capped by maxspeed, or by the
+        recorded speed for ``hour`` of the week), or None if off the map.
+        """
+        origin = self.snap(from_lat, from_lng)
+        dest = self.snap(to_lat, to_lng)
+        if origin is None or dest is None or speed <= 0:
+            return None
+        table = self.table(speed, hour)
+
+        (i, t1, off1), (j, t2, off2) = origin, dest
+        a1, b1, _, _, fwd1, bwd1 = self.segments[i]
+        a2, b2, _, _, fwd2, bwd2 = self.segments[j]
+        w1 = self._edge_minutes(i, speed, hour)
+        w2 = self._edge_minutes(j, speed, hour)
+
+        exits = ([(b1, (1 - t1) * w1)] if fwd1 else []) + ([(a1, t1 * w1)] if bwd1 else [])
+        entries = ([(a2, t2 * w2)] if fwd2 else []) + ([(b2, (1 - t2) * w2)] if bwd2 else [])
+        if table is not None:
+            best = min(
+                (c1 + table.minutes(u, v) + c2 for u, c1 in exits for v, c2 in entries),
+                default=INF,
+            )
+        else:
+            # table still being built: search for this query alone
+            targets = {}
+            for v, c2 in entries:
+                targets[v] = min(c2, targets.get(v, INF))
+            best = _search(self.adjacency(self._key(speed, hour)), exits, targets)
+        if i == j:
+            if fwd1 and t2 >= t1:
+                best = min(best, (t2 - t1) * w1)
+            if bwd1 and t2 <= t1:
+                best = min(best, (t1 - t2) * w1)
+        if best == INF:
+            return None
+        # getting on and off the road network in a straight line
+        return best + (off1 + off2) / speed * 60
+
+
+class ETAEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._network = None
+        self._loaded = False
+        self._profile_mtime = None
+        self._profile_checked = 0.0
+
+    @property
+    def network(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._network = self._load()
+                    self._loaded = True
+        return self._network
+
+    def _load(self):
+        path = settings.ROAD_GRAPH_PATH
+        if not path:
+            return None
+        try:
+            network = RoadNetwork.from_geojson(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.exception("Could not load road graph %s, using straight-line ETAs", path)
+            return None
+        logger.info("Road graph %s: %d nodes, %d segments", path, len(network.nodes), len(network.segments))
+        self._load_profile(network)
+        return network
+
+    def _load_profile(self, network):
+        path = settings.ROAD_SPEED_PROFILE_PATH
+        self._profile_checked = time.monotonic()
+        if not path:
+            return
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime == self._profile_mtime:
+                return
+            network.use_profile(SpeedProfile.load(path, settings.ROAD_PROFILE_MIN_SAMPLES))
+            self._profile_mtime = mtime
+            logger.info("Speed profile %s loaded", path)
+        except FileNotFoundError:
+            logger.info("No speed profile at %s yet, using fixed speeds", path)
+        except (OSError, ValueError, struct.error) as exc:
+            logger.warning("Ignoring speed profile %s: %s", path, exc)
+
+    def _refresh_profile(self):
+        # pick up the nightly build_speed_profiles output without a restart
+        if time.monotonic() - self._profile_checked < settings.ROAD_PROFILE_RELOAD_SECONDS:
+            return
+        with self._lock:
+            if time.monotonic() - self._profile_checked >= settings.ROAD_PROFILE_RELOAD_SECONDS:
+                self._load_profile(self._network)
+
+    def warm(self, speeds=(40, 60)):
+        """Load the graph and build the tables up front (server startup)."""
+        if self.network is not None:
+            hour = hour_of_week(timezone.now())
+            for speed in speeds:
+                self.network.table(speed, hour, wait=True)
+
+    def estimate(self, from_lat, from_lng, to_lat, to_lng, speed_kmh, at=None):
+        """ETA in minutes by road (departing ``at``, default now), falling back to straight-line distance."""
+        if self.network is not None:
+            self._refresh_profile()
+            hour = hour_of_week(at or timezone.now())
+            minutes = self.network.travel_minutes(from_lat, from_lng, to_lat, to_lng, speed_kmh, hour)
+            if minutes is not None:
+                return minutes
+        return calculate_eta(calculate_distance(from_lat, from_lng, to_lat, to_lng), speed_kmh)
+
+    def estimate_many(self, from_lats, from_lngs, to_lat, to_lng, speed_kmh, at=None):
+        """ETAs from many positions to one point (batched when there is no graph)."""
+        if self.network is None:
+            return calculate_etas(calculate_distances(to_lat, to_lng, from_lats, from_lngs), speed_kmh)
+        return [
+            self.estimate(lat, lng, to_lat, to_lng, speed_kmh, at)
+            for lat, lng in zip(from_lats, from_lngs)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._network = None
+            self._loaded = False
+            self._profile_mtime = None
+            self._profile_checked = 0.0
+
+
+eta_engine = ETAEngine()
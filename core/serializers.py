@@ -1,9 +1,10 @@
 # core/serializers.py
 from rest_framework import serializers
 from .models import (
-    User, Vehicle, Trip, Booking, Offence, RFIDDevice
+    User, Vehicle, Trip, Booking, Offence, RFIDDevice, BusStop, BusRoute, RouteStop,
+    Geofence, GeofenceEvent
 )
-from django.contrib.auth.hashers import make_password, check_password
+from .hashing import hash_password
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,7 +26,9 @@ class UserCreateSerializer(serializers.ModelSerializer):
         ]
 
     def create(self, validated_data):
-        validated_data['password'] = make_password(validated_data['password'])
+        # the async signup view hashes first and passes save(password_hash=...)
+        password_hash = validated_data.pop('password_hash', None)
+        validated_data['password'] = password_hash or hash_password(validated_data['password'])
         return super().create(validated_data)
 
 class UserLoginSerializer(serializers.Serializer):
@@ -54,7 +57,7 @@ class VehicleSerializer(serializers.ModelSerializer):
 class VehicleCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vehicle
-        fields = ['vehicle_number', 'gps_imei', 'barcode', 'vehicle_type']
+        fields = ['vehicle_number', 'gps_imei', 'barcode', 'vehicle_type', 'route']
 
 class TripSerializer(serializers.ModelSerializer):
     vehicle = serializers.UUIDField(source='vehicle.id')
@@ -85,4 +88,71 @@ class OffenceSerializer(serializers.ModelSerializer):
 class RFIDDeviceSerializer(serializers.ModelSerializer):
     class Meta:
         model = RFIDDevice
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class BusStopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BusStop
+        fields = ['id', 'name', 'lat', 'lng', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+class BusRouteSerializer(serializers.ModelSerializer):
+    stops = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BusRoute
+        fields = ['id', 'name', 'is_loop', 'stops', 'created_at']
+
+    def get_stops(self, obj):
+        # route_stops is ordered by sequence
+        return BusStopSerializer([rs.stop for rs in obj.route_stops.all()], many=True).data
+
+class BusRouteCreateSerializer(serializers.ModelSerializer):
+    stop_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, write_only=True)
+
+    class Meta:
+        model = BusRoute
+        fields = ['name', 'is_loop', 'stop_ids']
+
+    def validate_stop_ids(self, value):
+        found = set(BusStop.objects.filter(id__in=value).values_list('id', flat=True))
+        missing = [str(stop_id) for stop_id in value if stop_id not in found]
+        if missing:
+            raise serializers.ValidationError(f"Unknown stops: {', '.join(missing)}")
+        return value
+
+    def create(self, validated_data):
+        stop_ids = validated_data.pop('stop_ids')
+        route = super().create(validated_data)
+        RouteStop.objects.bulk_create([
+            RouteStop(route=route, stop_id=stop_id, sequence=i)
+            for i, stop_id in enumerate(stop_ids)
+        ])
+        return route
+
+class GeofenceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Geofence
+        fields = ['id', 'name', 'polygon', 'speed_limit', 'priority', 'is_active', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def validate_polygon(self, value):
+        if not isinstance(value, list) or len(value) < 3:
+            raise serializers.ValidationError("polygon must be a list of at least 3 [lat, lng] points")
+        for point in value:
+            if (not isinstance(point, (list, tuple)) or len(point) != 2
+                    or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in point)):
+                raise serializers.ValidationError("every point must be [lat, lng]")
+            if not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180):
+                raise serializers.ValidationError("point out of range")
+        return value
+
+    def validate_speed_limit(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("speed_limit must be positive")
+        return value
+
+class GeofenceEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GeofenceEvent
+        fields = '__all__'
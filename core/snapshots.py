@@ -0,0 +1,145 @@
+# core/snapshots.py
+"""
+Pre-serialized, versioned snapshots of hot public responses, with a change
+log for delta sync.
+
+Every client sees the same ``public/buses/`` body until a fix or a trip
+change arrives, so the body is built and JSON-encoded once per version and
+served as bytes. Writers call ``bump(*vehicle_ids)`` (usually through
+``vehicle_changed``); the next read rebuilds. Only one thread rebuilds at a
+time (single-flight) - the others keep serving the previous snapshot
+meanwhile, or wait for the first build.
+
+Each snapshot carries a ``version`` token. Clients send it back as
+``?since=<version>`` and get only the vehicles changed or removed after it,
+read from a compact in-memory log of ``(version, vehicle_id)`` entries. The
+log keeps the last ``PUBLIC_DELTA_RETENTION`` entries; a client that is
+further behind (or whose token came from another worker process) gets the
+full snapshot again.
+
+Versions are per process, so a bump in one worker cannot invalidate the
+others: snapshots also expire after ``PUBLIC_SNAPSHOT_TTL`` seconds. The
+rebuild reads locations through ``live_store.newest``, so a fix another
+process has persisted replaces an older one seen here; such a fix shows up
+at most ``PUBLIC_SNAPSHOT_TTL`` plus that process's
+``GPS_LIVE_STATE_FLUSH_INTERVAL`` seconds late. The ETag is a hash of the
+body, so it is stable across workers.
+"""
+import hashlib
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    data: dict
+    body: bytes
+    etag: str
+    built_at: float
+
+
+class SnapshotCache:
+    def __init__(self, name):
+        self.name = name
+        # tokens from another process (or before a restart) never match
+        self.epoch = secrets.token_hex(4)
+        self._version = 0
+        self._version_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._snapshot = None
+        self._changes = deque()   # (version, key), oldest first
+        self._floor = 0           # changes at or before this version were trimmed
+
+    @property
+    def version(self):
+        return self._version
+
+    def token(self, version):
+        return f"{self.epoch}.{version}"
+
+    def bump(self, *keys):
+        """Start a new version; ``keys`` are the items that changed in it."""
+        with self._version_lock:
+            self._version += 1
+            for key in keys:
+                self._changes.append((self._version, str(key)))
+            while len(self._changes) > settings.PUBLIC_DELTA_RETENTION:
+                self._floor = self._changes.popleft()[0]
+            return self._version
+
+    def changed_since(self, token, until):
+        """
+        Keys changed after version ``token`` up to version ``until``, or
+        ``None`` when the client has to resync.
+        """
+        epoch, _, version = (token or '').partition('.')
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        version = int(version)
+        with self._version_lock:
+            if version < self._floor or version > self._version:
+                return None
+            keys = set()
+            for changed_at, key in reversed(self._changes):
+                if changed_at <= version:
+                    break
+                if changed_at <= until:
+                    keys.add(key)
+        return keys
+
+    def _fresh(self, snapshot):
+        return (
+            snapshot is not None
+            and snapshot.version == self._version
+            and time.monotonic() - snapshot.built_at < settings.PUBLIC_SNAPSHOT_TTL
+        )
+
+    def get(self, build):
+        """Return the current snapshot, calling ``build()`` (-> dict) if it is stale."""
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            return snapshot
+
+        if not self._build_lock.acquire(blocking=snapshot is None):
+            # someone else is rebuilding; the previous body is good enough
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                return snapshot
+            # a bump during the build leaves this snapshot stale, as it should
+            version = self._version
+            data = {**build(), "version": self.token(version)}
+            body = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+            self._snapshot = Snapshot(version, data, body, etag, time.monotonic())
+            return self._snapshot
+        finally:
+            self._build_lock.release()
+
+    def reset(self):
+        with self._version_lock:
+            self._version = 0
+            self._snapshot = None
+            self._changes.clear()
+            self._floor = 0
+
+
+bus_snapshot = SnapshotCache('buses')
+ambulance_snapshot = SnapshotCache('ambulances')
+
+
+def vehicle_changed(*vehicles):
+    """Record vehicles whose public representation may have changed."""
+    for cache, vehicle_type in ((bus_snapshot, 'bus'), (ambulance_snapshot, 'ambulance')):
+        ids = [vehicle.id for vehicle in vehicles if vehicle.vehicle_type == vehicle_type]
+        if ids:
+            cache.bump(*ids)
@@ -0,0 +1,213 @@
+# core/spatial.py
+"""
+Uniform-grid spatial index over live vehicle positions.
+
+The campus fleet is small but queried constantly ("nearest free ambulance",
+"buses within 1 km of me"), so instead of loading every ``Vehicle`` and
+calling ``calculate_distance`` on each, positions are bucketed into
+``GPS_SPATIAL_CELL_DEG`` sized lat/lng cells. Ingestion moves a vehicle
+between cells on every fix; queries only look at the cells around the point.
+
+* ``nearest(lat, lng, k)`` - rings of cells are searched outwards until the
+  k-th best distance is closer than anything an unvisited ring could hold.
+* ``within(lat, lng, radius_km)`` - only the cells overlapping the radius.
+
+Each process keeps its own index, kept current by the fixes it applies.
+Query paths call ``ensure_seeded``, which (re)loads the persisted
+``Vehicle.current_location`` at most every ``GPS_SPATIAL_RESEED_SECONDS``, so
+fixes applied by other workers and the socket servers show up too. A
+persisted location only replaces an entry when its ``last_fix_at`` is not
+older than the fix this process saw.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .utils import calculate_distance
+
+KM_PER_DEG_LAT = 111.32
+
+
+class SpatialIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cells = {}      # (row, col) -> set of vehicle ids
+        self._entries = {}    # vehicle id -> entry dict (incl. its cell)
+        self._seeded_at = None   # monotonic time of the last load from the DB
+
+    @property
+    def cell_deg(self):
+        return settings.GPS_SPATIAL_CELL_DEG
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ─── Writes ─────────────────────────────────────────
+
+    def update(self, vehicle_id, vehicle_type, vehicle_number, lat, lng, recorded_at=None):
+        key = str(vehicle_id)
+        cell = self._cell(lat, lng)
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None and old['cell'] != cell:
+                self._discard_from_cell(key, old['cell'])
+            self._entries[key] = {
+                'vehicle_id': key,
+                'vehicle_type': vehicle_type,
+                'vehicle_number': vehicle_number,
+                'lat': lat,
+                'lng': lng,
+                'recorded_at': recorded_at,
+                'cell': cell,
+            }
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, vehicle_id):
+        key = str(vehicle_id)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._discard_from_cell(key, entry['cell'])
+
+    def _discard_from_cell(self, key, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+
+    def _due(self):
+        return self._seeded_at is None or time.monotonic() - self._seeded_at >= settings.GPS_SPATIAL_RESEED_SECONDS
+
+    def ensure_seeded(self):
+        """Load persisted locations if the last load is older than ``GPS_SPATIAL_RESEED_SECONDS``."""
+        if not self._due():
+            return
+        with self._lock:
+            if self._due():
+                self._reseed()
+                self._seeded_at = time.monotonic()
+
+    def _reseed(self):
+        # called with the lock held
+        from .models import Vehicle
+
+        rows = Vehicle.objects.values_list(
+            'id', 'vehicle_type', 'vehicle_number', 'current_location', 'last_fix_at'
+        )
+        persisted = set()
+        for vehicle_id, vehicle_type, vehicle_number, location, last_fix_at in rows:
+            key = str(vehicle_id)
+            persisted.add(key)
+            entry = self._entries.get(key)
+            if entry is not None and entry['recorded_at'] is not None and (
+                    last_fix_at is None or entry['recorded_at'] > last_fix_at):
+                continue   # this process has applied a newer fix than the row holds
+            lat, lng = (location or {}).get('lat'), (location or {}).get('lng')
+            if lat is None or lng is None:
+                self.remove(key)   # e.g. its trip was ended through another worker
+            else:
+                self.update(key, vehicle_type, vehicle_number, lat, lng, last_fix_at)
+        for key in [key for key in self._entries if key not in persisted]:
+            self.remove(key)
+
+    # ─── Queries ────────────────────────────────────────
+
+    def get(self, vehicle_id):
+        return self._entries.get(str(vehicle_id))
+
+    def _ring(self, center, r):
+        row, col = center
+        if r == 0:
+            yield center
+            return
+        for dc in range(-r, r + 1):
+            yield (row - r, col + dc)
+            yield (row + r, col + dc)
+        for dr in range(-r + 1, r):
+            yield (row + dr, col - r)
+            yield (row + dr, col + r)
+
+    def _hit(self, entry, lat, lng):
+        return {
+            **{k: v for k, v in entry.items() if k not in ('cell', 'recorded_at')},
+            'distance_km': calculate_distance(lat, lng, entry['lat'], entry['lng']),
+        }
+
+    def _matches(self, entry, vehicle_type, include):
+        if vehicle_type is not None and entry['vehicle_type'] != vehicle_type:
+            return False
+        return include is None or entry['vehicle_id'] in include
+
+    def nearest(self, lat, lng, k=1, vehicle_type=None, include=None):
+        """
+        The ``k`` closest vehicles to (lat, lng), closest first. ``include``
+        optionally restricts the search to a set of vehicle ids.
+        """
+        # the narrowest a cell gets (longitude shrinks towards the poles)
+        cell_km = self.cell_deg * KM_PER_DEG_LAT * max(math.cos(math.radians(min(abs(lat) + self.cell_deg, 90))), 0.01)
+        center = self._cell(lat, lng)
+        hits, seen, r = [], 0, 0
+        with self._lock:
+            total = len(self._entries)
+            while seen < total:
+                if 8 * r > len(self._cells):
+                    # the ring is larger than the occupied area: just scan everything
+                    hits = [
+                        self._hit(entry, lat, lng) for entry in self._entries.values()
+                        if self._matches(entry, vehicle_type, include)
+                    ]
+                    break
+                for cell in self._ring(center, r):
+                    for key in self._cells.get(cell, ()):
+                        seen += 1
+                        entry = self._entries[key]
+                        if self._matches(entry, vehicle_type, include):
+                            hits.append(self._hit(entry, lat, lng))
+                # anything in ring r+1 is at least r cells away
+                if len(hits) >= k:
+                    hits.sort(key=lambda hit: hit['distance_km'])
+                    if hits[k - 1]['distance_km'] <= r * cell_km:
+                        break
+                r += 1
+        hits.sort(key=lambda hit: hit['distance_km'])
+        return hits[:k]
+
+    def within(self, lat, lng, radius_km, vehicle_type=None, include=None):
+        """Vehicles within ``radius_km`` of (lat, lng), closest first."""
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlng = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(min(abs(lat) + dlat, 90))), 0.01))
+        row_lo, col_lo = self._cell(lat - dlat, lng - dlng)
+        row_hi, col_hi = self._cell(lat + dlat, lng + dlng)
+
+        hits = []
+        with self._lock:
+            if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(self._cells):
+                # huge radius: walking the occupied cells is cheaper
+                cells = [c for c in self._cells if row_lo <= c[0] <= row_hi and col_lo <= c[1] <= col_hi]
+            else:
+                cells = [(row, col) for row in range(row_lo, row_hi + 1) for col in range(col_lo, col_hi + 1)]
+            for cell in cells:
+                for key in self._cells.get(cell, ()):
+                    entry = self._entries[key]
+                    if not self._matches(entry, vehicle_type, include):
+                        continue
+                    hit = self._hit(entry, lat, lng)
+                    if hit['distance_km'] <= radius_km:
+                        hits.append(hit)
+        hits.sort(key=lambda hit: hit['distance_km'])
+        return hits
+
+    def reset(self):
+        with self._lock:
+            self._cells.clear()
+            self._entries.clear()
+            self._seeded_at = None
+
+
+spatial_index = SpatialIndex()
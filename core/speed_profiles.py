@@ -0,0 +1,119 @@
+# core/speed_profiles.py
+"""
+Historical speed per road segment and hour of the week.
+
+``manage.py build_speed_profiles`` (run it from cron, e.g. nightly) snaps
+recorded ``PositionFix`` rows onto the road graph of ``core.roads`` and
+averages the moving speed seen on every segment for each of the 168 hours
+of the week (local time). The result is two flat arrays - float32 mean
+speeds and uint16 sample counts, ``segment * 168 + hour`` - written to
+``ROAD_SPEED_PROFILE_PATH`` and loaded by the ETA engine, so a lookup is a
+single index.
+
+The file carries a fingerprint of the road graph it was built against; a
+profile for a different graph is ignored.
+"""
+import hashlib
+import math
+import struct
+import sys
+from array import array
+
+from django.utils import timezone
+
+HOURS_PER_WEEK = 168
+HEADER = struct.Struct('<4sH20sI')
+MAGIC = b'SPDP'
+VERSION = 1
+MIN_MOVING_SPEED = 2.0   # km/h; slower fixes are parked buses, not traffic
+
+
+def hour_of_week(when):
+    local = timezone.localtime(when) if timezone.is_aware(when) else when
+    return local.weekday() * 24 + local.hour
+
+
+def graph_fingerprint(network):
+    digest = hashlib.sha1()
+    for a, b, *_rest in network.segments:
+        digest.update(struct.pack('<4d', *network.nodes[a], *network.nodes[b]))
+    return digest.digest()
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class SpeedProfile:
+    def __init__(self, fingerprint, segment_count, speeds, counts, min_samples=3):
+        self.fingerprint = fingerprint
+        self.segment_count = segment_count
+        self.speeds = speeds      # array('f'), NaN where nothing was recorded
+        self.counts = counts      # array('H')
+        self.min_samples = min_samples
+
+    def speed(self, segment, hour):
+        """Mean recorded km/h on ``segment`` during ``hour`` of the week, or None."""
+        index = segment * HOURS_PER_WEEK + hour
+        if self.counts[index] < self.min_samples:
+            return None
+        return self.speeds[index]
+
+    def covered(self):
+        """Share of (segment, hour) slots with enough samples."""
+        return sum(1 for c in self.counts if c >= self.min_samples) / max(len(self.counts), 1)
+
+    def save(self, path):
+        with open(path, 'wb') as fh:
+            fh.write(HEADER.pack(MAGIC, VERSION, self.fingerprint, self.segment_count))
+            _little_endian(self.speeds).tofile(fh)
+            _little_endian(self.counts).tofile(fh)
+
+    @classmethod
+    def load(cls, path, min_samples=3):
+        with open(path, 'rb') as fh:
+            magic, version, fingerprint, segment_count = HEADER.unpack(fh.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a speed profile file")
+            slots = segment_count * HOURS_PER_WEEK
+            speeds, counts = array('f'), array('H')
+            speeds.fromfile(fh, slots)
+            counts.fromfile(fh, slots)
+        return cls(fingerprint, segment_count, _little_endian(speeds), _little_endian(counts), min_samples)
+
+
+class SpeedProfileBuilder:
+    def __init__(self, network):
+        self.network = network
+        slots = len(network.segments) * HOURS_PER_WEEK
+        self._sums = array('d', bytes(8 * slots))
+        self._counts = array('L', bytes(array('L').itemsize * slots))
+        self.snapped = 0
+        self.skipped = 0
+
+    def add(self, lat, lng, speed, when):
+        if speed is None or speed < MIN_MOVING_SPEED:
+            self.skipped += 1
+            return False
+        snapped = self.network.snap(lat, lng)
+        if snapped is None:
+            self.skipped += 1
+            return False
+        index = snapped[0] * HOURS_PER_WEEK + hour_of_week(when)
+        self._sums[index] += speed
+        self._counts[index] += 1
+        self.snapped += 1
+        return True
+
+    def build(self, min_samples=3):
+        speeds = array('f', (
+            total / count if count else math.nan
+            for total, count in zip(self._sums, self._counts)
+        ))
+        counts = array('H', (min(count, 0xFFFF) for count in self._counts))
+        return SpeedProfile(
+            graph_fingerprint(self.network), len(self.network.segments), speeds, counts, min_samples
+        )
@@ -0,0 +1,130 @@
+# core/tcp_ingest.py
+"""
+asyncio TCP listener for GT06 binary trackers.
+
+Devices keep one persistent connection each; a connection only costs a
+coroutine and a small read buffer, so one process holds thousands of them.
+After login, frames are acknowledged immediately; anything a connection
+sends before its login packet is counted as ``unauthenticated`` and not
+acknowledged. Location fixes are buffered and queued in batches, from a
+single thread, for the ingest workers (``core.ingest_queue``), which run the
+same ``apply_fixes`` pipeline as ``ReceiveGPSView`` with retries; the event
+loop never blocks on SQLite.
+
+When ``GPS_TCP_MAX_PENDING`` fixes are waiting to be queued (the queue is
+full), connections stop being read until it drains; TCP flow control then slows the
+devices down instead of this process buffering without bound.
+
+The GT06 serial number only acknowledges frames. It restarts at 0 on every
+login and wraps at 65535, so it is not passed on as the fix ``seq``: the
+watermarks order and dedupe GT06 fixes by device time alone.
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+
+from . import gt06
+from .batching import AsyncFixBatcher, enqueue_fix_batch
+from .ingestion import InvalidFix, parse_fix
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTION_BUFFER = 64 * 1024
+
+
+class GPSTCPServer:
+    def __init__(self, sink=enqueue_fix_batch, batch_size=None, flush_interval=None, idle_timeout=None,
+                 max_pending=None):
+        self.batcher = AsyncFixBatcher(
+            sink,
+            batch_size or settings.GPS_SOCKET_BATCH_SIZE,
+            flush_interval or settings.GPS_SOCKET_FLUSH_INTERVAL,
+            thread_name="gps-tcp-db",
+            max_pending=max_pending or settings.GPS_TCP_MAX_PENDING,
+        )
+        self.idle_timeout = idle_timeout or settings.GPS_TCP_IDLE_TIMEOUT
+        self.stats = {
+            'connections': 0,
+            'open_connections': 0,
+            'frames': 0,
+            'fixes': 0,
+            'malformed': 0,
+            'unauthenticated': 0,
+            'paused': 0,
+        }
+        self._server = None
+
+    async def start(self, host, port):
+        self._server = await asyncio.start_server(self._handle, host, port, backlog=1024)
+        self.batcher.start()
+        return self._server
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.close()
+
+    # ─── Connections ────────────────────────────────────
+
+    async def _handle(self, reader, writer):
+        self.stats['connections'] += 1
+        self.stats['open_connections'] += 1
+        imei = None
+        buffer = bytearray()
+        try:
+            while True:
+                if self.batcher.full():
+                    # back-pressure: leave the bytes in the socket until the DB catches up
+                    self.stats['paused'] += 1
+                    await self.batcher.wait_for_room()
+                chunk = await asyncio.wait_for(reader.read(4096), timeout=self.idle_timeout)
+                if not chunk:
+                    break
+                buffer.extend(chunk)
+                if len(buffer) > MAX_CONNECTION_BUFFER:
+                    logger.warning("Dropping GT06 connection %s: buffer overflow", imei)
+                    break
+
+                frames, malformed = gt06.decode_frames(buffer)
+                self.stats['malformed'] += malformed
+                for protocol, content, serial in frames:
+                    self.stats['frames'] += 1
+                    if imei is None and protocol != gt06.PROTO_LOGIN:
+                        # nothing is acknowledged before the login packet
+                        self.stats['unauthenticated'] += 1
+                        continue
+                    try:
+                        imei = self._handle_frame(imei, protocol, content)
+                    except (gt06.FrameError, InvalidFix):
+                        self.stats['malformed'] += 1
+                        continue
+                    writer.write(gt06.build_ack(protocol, serial))
+                await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self.stats['open_connections'] -= 1
+            writer.close()
+
+    def _handle_frame(self, imei, protocol, content):
+        if protocol == gt06.PROTO_LOGIN:
+            return gt06.parse_login(content)
+
+        if protocol in gt06.LOCATION_PROTOCOLS:
+            timestamp, lat, lng, speed, positioned = gt06.parse_location(content)
+            if positioned:
+                self.stats['fixes'] += 1
+                self.batcher.add(parse_fix({
+                    'imei': imei,
+                    'latitude': lat,
+                    'longitude': lng,
+                    'speed': speed,
+                    'timestamp': timestamp.isoformat(),
+                }))
+        return imei
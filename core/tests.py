@@ -1,11 +1,72 @@
 # core/tests.py
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, AsyncClient, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth.hashers import make_password
-from core.models import User, Vehicle, Booking, Trip, Offence, RFIDDevice
+from core.models import (
+    User, Vehicle, Booking, Trip, Offence, RFIDDevice, PositionFix,
+    BusStop, BusRoute, RouteStop, Geofence, GeofenceEvent,
+)
+from core.live_state import live_store
+from core.history import history_buffer
+from core.overspeed import overspeed_detector
+from core.watermarks import watermarks
+from core.metrics import metrics
+from core.ingest_queue import GPS, ingest_queue
+from core import gt06, utils
+from core.batching import enqueue_fix_batch
+from core.tcp_ingest import GPSTCPServer
+from core.udp_ingest import GPSUDPIngestor, encode_datagram
+from core.pubsub import BUS_POSITIONS, RedisBackend, hub
+from core.snapshots import ambulance_snapshot, bus_snapshot
+from core.spatial import SpatialIndex, spatial_index
+from core.arrivals import arrival_predictor
+from core.geofences import GeofenceIndex, Zone, geofences
+from core.user_cache import user_cache
+from core.token_cache import token_cache
+from core.hashing import HashingBusy, hashing_pool
+from core.otp_store import InMemoryOTPStore, OTPStore, SQLiteOTPStore, otp_store
+import multiprocessing
+from django.conf import settings
+from rest_framework_simplejwt.tokens import AccessToken
+import time
+from core.utils import calculate_distance, create_access_token
+from unittest import mock, skipIf
+from core.roads import RoadNetwork, eta_engine
+from core.speed_profiles import SpeedProfile, SpeedProfileBuilder, hour_of_week
+from django.core.management import call_command
+import os
+import io
+import tempfile
+from core.ingestion import apply_fixes, parse_fix
+from core.websockets import websocket_application
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+import asyncio
+import random
+import threading
+from django.utils import timezone
+from django.db import DatabaseError
+from datetime import timedelta
 import json
 
+def reset_ingestion_state():
+    """Process-level ingestion state outlives the per-test DB rollback."""
+    live_store.reset()
+    history_buffer.reset()
+    overspeed_detector.reset()
+    watermarks.reset()
+    hub.reset()
+    bus_snapshot.reset()
+    ambulance_snapshot.reset()
+    spatial_index.reset()
+    arrival_predictor.reset()
+    geofences.reset()
+    user_cache.reset()
+    token_cache.reset()
+    otp_store.reset()
+
+
 class CoreAPITests(TestCase):
     def setUp(self):
         """Set up test data and client"""
@@ -228,4 +289,2086 @@ class CoreAPITests(TestCase):
             driver_type="ambulance 1"
         )
 
+class GPSBatchIngestionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.driver = User.objects.create(
+            name="Batch Driver",
+            phone="9400000001",
+            password=make_password("driver123"),
+            registration_id="DRVBATCH001",
+            role="driver",
+            driver_type="bus"
+        )
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-BATCH-BUS-001",
+            gps_imei="batch-imei-bus-001",
+            vehicle_type="bus",
+            assigned_to=self.driver,
+            assigned_driver_name=self.driver.name,
+        )
+        self.ambulance = Vehicle.objects.create(
+            vehicle_number="OD-BATCH-AMB-001",
+            gps_imei="batch-imei-amb-001",
+            vehicle_type="ambulance",
+        )
+        self.booking = Booking.objects.create(
+            student_registration_id="STUBATCH001",
+            phone="9400000002",
+            place="Library",
+            user_location={"lat": 20.3000, "lng": 85.8300},
+            status="accepted",
+            vehicle=self.ambulance,
+        )
+
+    def _fix(self, imei, second, speed=30, lat=20.2961, lng=85.8245):
+        return {
+            "imei": imei,
+            "latitude": lat,
+            "longitude": lng,
+            "speed": speed,
+            "timestamp": f"2026-03-01T08:00:{second:02d}+05:30",
+        }
+
+    def test_batch_keeps_newest_fix_per_vehicle(self):
+        fixes = [
+            self._fix("batch-imei-bus-001", 10, lat=20.10),
+            self._fix("batch-imei-bus-001", 30, lat=20.30),
+            self._fix("batch-imei-bus-001", 20, lat=20.20),
+            self._fix("batch-imei-amb-001", 5, lat=20.29),
+            self._fix("unknown-imei", 5),
+            {"imei": "batch-imei-bus-001"},
+        ]
+        response = self.client.post('/api/gps/receive/batch/', {"fixes": fixes}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted'], 4)
+        self.assertEqual(response.data['unknown_imeis'], ["unknown-imei"])
+        self.assertEqual([r['index'] for r in response.data['rejected']], [5])
+
+        self.assertEqual(live_store.get(self.bus.id)['lat'], 20.30)
+        live_store.flush()
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.current_location['lat'], 20.30)
+        self.booking.refresh_from_db()
+        self.assertIsNotNone(self.booking.eta_minutes)
+
+    def test_batch_records_one_offence_per_episode(self):
+        fixes = [self._fix("batch-imei-bus-001", s, speed=55) for s in range(10)]
+        response = self.client.post('/api/gps/receive/batch/', fixes, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Offence.objects.filter(vehicle=self.bus).count(), 1)
+
+    def test_batch_query_count_does_not_grow_with_fixes(self):
+        fixes = [self._fix("batch-imei-bus-001", s) for s in range(50)]
+        fixes += [self._fix("batch-imei-amb-001", s) for s in range(50)]
+        geofences.index   # zones are loaded once per process
+        # vehicle lookup, savepoint pair, booking select + bulk update
+        # (locations are persisted write-behind by the live state store)
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/gps/receive/batch/', {"fixes": fixes}, format='json')
+        self.assertEqual(response.data['accepted'], 100)
+
+    def test_batch_rejects_empty_payload(self):
+        response = self.client.post('/api/gps/receive/batch/', {"fixes": []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_fixes_are_rejected_individually(self):
+        good = self._fix("batch-imei-bus-001", 10)
+        fixes = [
+            {**good, "timestamp": "2026-13-45T00:00:00"},
+            {**good, "timestamp": 1e20},
+            {**good, "latitude": "nan"},
+            {**good, "longitude": "inf"},
+            {**good, "latitude": 91},
+            {**good, "longitude": -180.5},
+            {**good, "timestamp": -1e18},
+            good,
+        ]
+        response = self.client.post('/api/gps/receive/batch/', {"fixes": fixes}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual([r['index'] for r in response.data['rejected']], list(range(7)))
+
+    def test_stationary_fix_is_accepted(self):
+        response = self.client.post(
+            '/api/gps/receive/', self._fix("batch-imei-bus-001", 10, speed=0), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(live_store.get(self.bus.id)['speed'], 0)
+
+
+class LiveVehicleStoreTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-LIVE-BUS-001",
+            gps_imei="live-imei-bus-001",
+            vehicle_type="bus",
+            current_location={"lat": 20.0, "lng": 85.0},
+        )
+
+    def _post_fix(self, lat):
+        return self.client.post('/api/gps/receive/', {
+            "imei": "live-imei-bus-001", "latitude": lat, "longitude": 85.8, "speed": 20
+        }, format='json')
+
+    def test_reads_are_served_from_live_state(self):
+        self._post_fix(20.5)
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.current_location['lat'], 20.0)  # not flushed yet
+        self.assertEqual(live_store.location_for(self.bus)['lat'], 20.5)
+        self.assertEqual(live_store.get_by_imei("live-imei-bus-001")['lat'], 20.5)
+
+        response = self.client.get(f'/api/public/bus/{self.bus.id}/eta/?user_lat=20.6&user_lng=85.8')
+        self.assertEqual(response.data['bus_location']['lat'], 20.5)
+
+    def test_flush_persists_dirty_locations(self):
+        self._post_fix(20.5)
+        self._post_fix(20.6)
+        self.assertEqual(live_store.pending(), 1)
+        self.assertEqual(live_store.flush(), 1)
+        self.assertEqual(live_store.pending(), 0)
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.current_location['lat'], 20.6)
+
+    @override_settings(GPS_LIVE_STATE_FLUSH_INTERVAL=0)
+    def test_zero_interval_is_write_through(self):
+        self._post_fix(20.7)
+        self.assertEqual(live_store.pending(), 0)
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.current_location['lat'], 20.7)
+
+    def test_newer_fix_persisted_elsewhere_wins(self):
+        self._post_fix(20.5)
+        Vehicle.objects.filter(id=self.bus.id).update(
+            current_location={"lat": 20.1, "lng": 85.8}, last_fix_at=timezone.now() - timedelta(hours=1)
+        )
+        self.bus.refresh_from_db()
+        self.assertEqual(live_store.location_for(self.bus)['lat'], 20.5)
+
+        # another worker (or the socket server) applied and flushed a later fix
+        Vehicle.objects.filter(id=self.bus.id).update(
+            current_location={"lat": 20.9, "lng": 85.8}, last_fix_at=timezone.now() + timedelta(seconds=5)
+        )
+        self.bus.refresh_from_db()
+        self.assertEqual(live_store.location_for(self.bus)['lat'], 20.9)
+        response = self.client.get(f'/api/public/bus/{self.bus.id}/eta/?user_lat=20.6&user_lng=85.8')
+        self.assertEqual(response.data['bus_location']['lat'], 20.9)
+
+    def test_discard_waits_for_a_running_flush(self):
+        self._post_fix(20.8)
+        writing, release, order = threading.Event(), threading.Event(), []
+        bulk_update = Vehicle.objects.bulk_update
+
+        def slow_bulk_update(*args, **kwargs):
+            writing.set()
+            release.wait(5)
+            order.append('flush')
+            return bulk_update(*args, **kwargs)
+
+        with mock.patch.object(Vehicle.objects, 'bulk_update', slow_bulk_update):
+            flusher = threading.Thread(target=live_store.flush)
+            flusher.start()
+            writing.wait(5)
+            ending = threading.Thread(target=lambda: (live_store.discard(self.bus.id), order.append('discard')))
+            ending.start()
+            ending.join(0.2)
+            self.assertTrue(ending.is_alive())
+            release.set()
+            flusher.join(5)
+            ending.join(5)
+        # the trip-end write that follows discard lands after the flushed location
+        self.assertEqual(order, ['flush', 'discard'])
+        self.assertIsNone(live_store.get(self.bus.id))
+
+
+class PositionHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.admin = User.objects.create(
+            name="History Admin", phone="9400000010",
+            password=make_password("admin123"), registration_id="ADMHIST001", role="admin"
+        )
+        self.driver = User.objects.create(
+            name="History Driver", phone="9400000011",
+            password=make_password("driver123"), registration_id="DRVHIST001", role="driver"
+        )
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-HIST-BUS-001", gps_imei="hist-imei-bus-001", vehicle_type="bus"
+        )
+        self.trip = Trip.objects.create(
+            vehicle=self.bus, driver=self.driver, vehicle_number=self.bus.vehicle_number,
+            driver_name=self.driver.name, vehicle_type="bus",
+            start_time=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_fixes_are_buffered_and_linked_to_trip(self):
+        fixes = [
+            {"imei": "hist-imei-bus-001", "latitude": 20.2961, "longitude": 85.8245, "speed": 12.3},
+            {"imei": "hist-imei-bus-001", "latitude": 20.3061, "longitude": 85.8245, "speed": 20},
+        ]
+        self.client.post('/api/gps/receive/batch/', {"fixes": fixes}, format='json')
+        self.assertEqual(PositionFix.objects.count(), 0)
+        self.assertEqual(history_buffer.pending(), 2)
+
+        with self.assertNumQueries(2):  # trip lookup + one bulk insert
+            self.assertEqual(history_buffer.flush(), 2)
+
+        rows = list(PositionFix.objects.order_by('timestamp'))
+        self.assertEqual(rows[0].lat_e7, 202961000)
+        self.assertEqual(rows[0].speed_dkmh, 123)
+        self.assertAlmostEqual(rows[0].speed, 12.3)
+        self.assertTrue(all(row.trip_id == self.trip.id for row in rows))
+
+    def test_trip_track_replays_points_and_distance(self):
+        start = timezone.now() - timedelta(minutes=30)
+        PositionFix.objects.bulk_create([
+            PositionFix(vehicle=self.bus, trip=self.trip, timestamp=start + timedelta(seconds=i),
+                        lat_e7=int((20.0 + i * 0.01) * 1e7), lng_e7=int(85.0 * 1e7), speed_dkmh=300)
+            for i in range(3)
+        ])
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(f'/api/admin/trips/{self.trip.id}/track/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['points']), 3)
+        self.assertAlmostEqual(response.data['distance_km'], 2.224, places=2)
+
+    def test_deleting_a_vehicle_drops_its_buffered_rows(self):
+        other = Vehicle.objects.create(
+            vehicle_number="OD-HIST-BUS-002", gps_imei="hist-imei-bus-002", vehicle_type="bus"
+        )
+        fixes = [
+            {"imei": "hist-imei-bus-001", "latitude": 20.2961, "longitude": 85.8245, "speed": 10},
+            {"imei": "hist-imei-bus-002", "latitude": 20.2961, "longitude": 85.8245, "speed": 10},
+        ]
+        self.client.post('/api/gps/receive/batch/', {"fixes": fixes}, format='json')
+        self.assertEqual(history_buffer.pending(), 2)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.delete(f'/api/admin/vehicles/{other.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(history_buffer.pending(), 1)
+
+        # a fix resolved before the delete and buffered after it is dropped too
+        history_buffer.add([PositionFix(
+            vehicle_id=other.id, timestamp=timezone.now(), lat_e7=0, lng_e7=0, speed_dkmh=0
+        )])
+        self.assertEqual(history_buffer.flush(), 1)
+        self.assertEqual(PositionFix.objects.get().vehicle_id, self.bus.id)
+
+    @override_settings(GPS_HISTORY_MAX_PENDING=3)
+    def test_buffer_is_capped_while_the_db_is_down(self):
+        metrics.reset()
+        with mock.patch.object(PositionFix.objects, 'bulk_create', side_effect=RuntimeError("db down")), \
+                mock.patch('core.history.logger'):
+            for i in range(5):
+                history_buffer.add([PositionFix(
+                    vehicle_id=self.bus.id, timestamp=timezone.now(), lat_e7=i, lng_e7=0, speed_dkmh=0
+                )])
+                self.assertEqual(history_buffer.flush(), 0)
+        self.assertEqual(history_buffer.pending(), 3)
+        self.assertEqual(metrics.get('history.dropped'), 2)
+        self.assertEqual(history_buffer.flush(), 3)
+        self.assertEqual(sorted(PositionFix.objects.values_list('lat_e7', flat=True)), [2, 3, 4])
+
+
+class PositionHistoryOrphanTests(TransactionTestCase):
+    """FK violations only surface on commit, so this runs outside a test transaction."""
+
+    def setUp(self):
+        reset_ingestion_state()
+        self.addCleanup(history_buffer.reset)
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-HIST-BUS-010", gps_imei="hist-imei-bus-010", vehicle_type="bus"
+        )
+        self.gone = Vehicle.objects.create(
+            vehicle_number="OD-HIST-BUS-011", gps_imei="hist-imei-bus-011", vehicle_type="bus"
+        )
+
+    def _row(self, vehicle_id):
+        return PositionFix(vehicle_id=vehicle_id, timestamp=timezone.now(), lat_e7=0, lng_e7=0, speed_dkmh=0)
+
+    def test_rows_of_a_vehicle_deleted_elsewhere_do_not_block_the_buffer(self):
+        with mock.patch('core.history.logger'):
+            history_buffer.add([self._row(self.bus.id), self._row(self.gone.id)])
+            # deleted by another process: this one's buffer never heard of it
+            Vehicle.objects.filter(id=self.gone.id).delete()
+            self.assertEqual(history_buffer.flush(), 1)
+        self.assertEqual(history_buffer.pending(), 0)
+        self.assertEqual(PositionFix.objects.get().vehicle_id, self.bus.id)
+
+        history_buffer.add([self._row(self.bus.id)])
+        self.assertEqual(history_buffer.flush(), 1)
+
+
+class GT06TCPIngestionTests(SimpleTestCase):
+    def test_crc_itu_check_value(self):
+        self.assertEqual(gt06.crc_itu(b"123456789"), 0x906E)
+
+    def test_decoder_handles_split_and_corrupt_frames(self):
+        login = gt06.encode_frame(gt06.PROTO_LOGIN, gt06.build_login("359710045678901"), 1)
+        corrupt = bytearray(login)
+        corrupt[5] ^= 0xFF
+        stream = bytearray(b"\x00" + bytes(corrupt) + login[:7])
+        frames, malformed = gt06.decode_frames(stream)
+        self.assertEqual((frames, malformed), ([], 1))
+
+        stream.extend(login[7:])
+        frames, malformed = gt06.decode_frames(stream)
+        self.assertEqual(len(frames), 1)
+        protocol, content, serial = frames[0]
+        self.assertEqual(gt06.parse_login(content), "359710045678901")
+        self.assertEqual(stream, bytearray())
+
+    def test_fake_device_fixes_reach_sink(self):
+        received = []
+
+        async def scenario():
+            server = GPSTCPServer(sink=received.extend, batch_size=2, flush_interval=60, idle_timeout=5)
+            await server.start('127.0.0.1', 0)
+            device = gt06.FakeGT06Device("359710045678901", port=server.port)
+            self.assertEqual(await device.connect(), (gt06.PROTO_LOGIN, 1))
+            await device.send_location(20.2961, 85.8245, 45)
+            ack = await device.send_location(-20.5, -85.25, 12)
+            self.assertEqual(ack, (gt06.PROTO_LOCATION, 3))
+            await device.close()
+            await server.close()
+            return server.stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(stats['fixes'], 2)
+        self.assertEqual([f['imei'] for f in received], ["359710045678901"] * 2)
+        self.assertAlmostEqual(received[0]['lat'], 20.2961, places=4)
+        self.assertEqual(received[0]['speed'], 45.0)
+        self.assertAlmostEqual(received[1]['lng'], -85.25, places=4)
+        # the frame serial restarts on every login, so it is not a fix sequence
+        self.assertEqual([f['seq'] for f in received], [None, None])
+
+    def test_location_before_login_is_not_acknowledged(self):
+        async def scenario():
+            server = GPSTCPServer(sink=lambda fixes: None, batch_size=1, flush_interval=60, idle_timeout=5)
+            await server.start('127.0.0.1', 0)
+            device = gt06.FakeGT06Device("359710045678901", port=server.port)
+            device.reader, device.writer = await asyncio.open_connection('127.0.0.1', server.port)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(device.send_location(20.2961, 85.8245, 45), 0.3)
+            await device.close()
+            await server.close()
+            return server.stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual((stats['unauthenticated'], stats['fixes']), (1, 0))
+
+    def test_reading_pauses_while_the_database_is_behind(self):
+        received, release = [], threading.Event()
+
+        def slow_sink(fixes):
+            release.wait(5)
+            received.extend(fixes)
+
+        async def scenario():
+            server = GPSTCPServer(sink=slow_sink, batch_size=1, flush_interval=60, idle_timeout=5, max_pending=1)
+            await server.start('127.0.0.1', 0)
+            device = gt06.FakeGT06Device("359710045678901", port=server.port)
+            await device.connect()
+            await device.send_location(20.2961, 85.8245, 45)
+
+            second = asyncio.create_task(device.send_location(20.2962, 85.8246, 46))
+            await asyncio.sleep(0.2)
+            self.assertFalse(second.done())
+            self.assertEqual(server.stats['fixes'], 1)
+            self.assertEqual(server.stats['paused'], 1)
+
+            release.set()
+            self.assertEqual(await asyncio.wait_for(second, 5), (gt06.PROTO_LOCATION, 3))
+            await device.close()
+            await server.close()
+            return server.stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(stats['fixes'], 2)
+        self.assertEqual(len(received), 2)
+
+
+class UDPIngestionTests(SimpleTestCase):
+    def test_datagrams_are_decoded_deduped_and_counted(self):
+        received = []
+        now = timezone.now().replace(microsecond=0)
+
+        async def scenario():
+            ingestor = GPSUDPIngestor(sink=received.extend, batch_size=100, flush_interval=60)
+            await ingestor.start('127.0.0.1', 0)
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=('127.0.0.1', ingestor.port)
+            )
+            packet = encode_datagram("359710045678901", 20.2961, 85.8245, 42.5, now, seq=7)
+            transport.sendto(packet)
+            transport.sendto(packet)  # retransmit
+            transport.sendto(encode_datagram("359710045678901", 20.3, 85.8, 10, now, seq=8))
+            transport.sendto(b"garbage")
+            await asyncio.sleep(0.2)
+            transport.close()
+            await ingestor.close()
+            return ingestor.stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(stats, {
+            'received': 4, 'accepted': 2, 'duplicates': 1, 'malformed': 1, 'dropped': 0,
+        })
+        self.assertEqual(len(received), 2)
+        self.assertEqual(received[0]['imei'], "359710045678901")
+        self.assertEqual(received[0]['speed'], 42.5)
+        self.assertEqual(received[0]['recorded_at'], now)
+
+    def test_full_buffer_drops_packets(self):
+        ingestor = GPSUDPIngestor(sink=list, max_pending=1)
+        ingestor.batcher._pending.append({})  # pretend the DB thread is behind
+        now = timezone.now()
+        packet = encode_datagram("359710045678901", 20.0, 85.0, 0, now)
+        ingestor.datagram_received(packet, None)
+        self.assertEqual(ingestor.stats['dropped'], 1)
+
+        ingestor.batcher._pending.clear()   # caught up; the device retransmits
+        ingestor.datagram_received(packet, None)
+        self.assertEqual(ingestor.stats['accepted'], 1)
+        self.assertEqual(ingestor.stats['duplicates'], 0)
+
+    @override_settings(GPS_INGEST_WORKERS=0, GPS_INGEST_RETRY_BACKOFF=0)
+    def test_failed_batch_is_retried_not_lost(self):
+        ingest_queue.reset()
+        self.addCleanup(ingest_queue.reset)
+        applied = []
+
+        def flaky_apply(fixes):
+            if not applied:
+                applied.append(None)
+                raise DatabaseError("locked")
+            applied.extend(fixes)
+
+        async def scenario():
+            ingestor = GPSUDPIngestor(batch_size=100, flush_interval=60)
+            packet = encode_datagram("359710045678901", 20.0, 85.0, 0, timezone.now())
+            ingestor.datagram_received(packet, None)
+            ingestor.datagram_received(packet, None)   # the retransmit is deduped here...
+            await ingestor.close()
+            return ingestor.stats
+
+        with mock.patch('core.ingest_queue.apply_fixes', flaky_apply), mock.patch('core.ingest_queue.logger'):
+            stats = asyncio.run(scenario())
+        # ...so the queue's retry is what gets the fix in
+        self.assertEqual((stats['accepted'], stats['duplicates']), (1, 1))
+        self.assertEqual([fix['imei'] for fix in applied[1:]], ["359710045678901"])
+        self.assertEqual(ingest_queue.dead_letters(), [])
+
+
+class OverspeedEpisodeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-SPEED-BUS-001", gps_imei="speed-imei-bus-001", vehicle_type="bus"
+        )
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+
+    def _send(self, speeds, offset=0, lat=20.0):
+        fixes = [{
+            "imei": "speed-imei-bus-001",
+            "latitude": lat + i * 0.001,
+            "longitude": 85.0,
+            "speed": speed,
+            "timestamp": (self.start + timedelta(seconds=offset + i)).isoformat(),
+        } for i, speed in enumerate(speeds)]
+        self.client.post('/api/gps/receive/batch/', {"fixes": fixes}, format='json')
+
+    def test_episode_is_updated_across_batches(self):
+        self._send([45, 50, 62, 55, 48, 47])
+        self.assertEqual(Offence.objects.count(), 1)
+        self._send([44, 52, 41], offset=6)  # stays within hysteresis → same episode
+
+        offence = Offence.objects.get()
+        self.assertEqual(offence.speed, 62)
+        self.assertEqual(offence.duration_seconds, 8)
+        self.assertEqual(offence.location['lat'], 20.0)
+        self.assertAlmostEqual(offence.end_location['lat'], 20.002)
+        self.assertEqual(offence.ended_at, self.start + timedelta(seconds=8))
+
+    def test_exit_below_hysteresis_starts_new_episode(self):
+        self._send([50] * 6 + [30] + [50] * 6)
+        self.assertEqual(Offence.objects.count(), 2)
+
+    def test_short_spikes_are_ignored(self):
+        self._send([60, 60, 20, 60, 20])
+        self.assertEqual(Offence.objects.count(), 0)
+
+    @override_settings(GPS_OVERSPEED_MIN_DURATION=0)
+    def test_quiet_device_closes_episode(self):
+        self._send([50])
+        self._send([50], offset=600)
+        self.assertEqual(Offence.objects.count(), 2)
+
+    @override_settings(GPS_OVERSPEED_MIN_DURATION=0)
+    def test_episode_of_silent_vehicle_is_swept(self):
+        self._send([50, 55])
+        self.assertEqual(len(overspeed_detector), 1)
+        later = time.monotonic() + 600
+        with mock.patch('core.overspeed.time.monotonic', return_value=later):
+            self.assertEqual(overspeed_detector.sweep(), 1)
+        self.assertEqual(len(overspeed_detector), 0)
+
+    def test_episode_seen_by_two_workers_is_one_offence(self):
+        self._send([50, 55, 60, 58, 56, 57])
+        # another worker that never saw this process's episode state
+        overspeed_detector.reset()
+        watermarks.reset()
+        self._send([50, 55, 60, 58, 56, 57, 70])
+
+        offence = Offence.objects.get()
+        self.assertEqual(offence.speed, 70)
+        self.assertEqual(offence.ended_at, self.start + timedelta(seconds=6))
+
+    def test_episode_survives_a_failed_batch(self):
+        fixes = [parse_fix({
+            "imei": "speed-imei-bus-001", "latitude": 20.0, "longitude": 85.0, "speed": speed,
+            "timestamp": (self.start + timedelta(seconds=i)).isoformat(),
+        }) for i, speed in enumerate([50, 55, 60, 58, 56, 57])]
+        # fails after the offence was inserted, inside the batch transaction
+        with mock.patch('core.ingestion._adopt_existing_offences', side_effect=DatabaseError("locked")):
+            with self.assertRaises(DatabaseError):
+                apply_fixes(fixes)
+        self.assertEqual(Offence.objects.count(), 0)
+
+        self.assertEqual(apply_fixes(fixes)['offences'], 1)   # the retry
+        offence = Offence.objects.get()
+        self.assertEqual(offence.speed, 60)
+        self.assertEqual(offence.duration_seconds, 5)
+
+
+class FixWatermarkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        metrics.reset()
+        self.admin = User.objects.create(
+            name="Metrics Admin", phone="9400000020",
+            password=make_password("admin123"), registration_id="ADMMET001", role="admin"
+        )
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-WM-BUS-001", gps_imei="wm-imei-bus-001", vehicle_type="bus"
+        )
+        self.start = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+
+    def _fix(self, second, seq=None, lat=20.0):
+        fix = {
+            "imei": "wm-imei-bus-001", "latitude": lat, "longitude": 85.0, "speed": 10,
+            "timestamp": (self.start + timedelta(seconds=second)).isoformat(),
+        }
+        if seq is not None:
+            fix["seq"] = seq
+        return fix
+
+    def _post(self, *fixes):
+        return self.client.post('/api/gps/receive/batch/', {"fixes": list(fixes)}, format='json')
+
+    def test_duplicates_are_dropped_before_db_work(self):
+        self._post(self._fix(10, seq=1), self._fix(11, seq=2))
+        with self.assertNumQueries(0):
+            response = self._post(self._fix(10, seq=1), self._fix(11, seq=2))
+        self.assertEqual(response.data['duplicates'], 2)
+        self.assertEqual(response.data['accepted'], 0)
+        self.assertEqual(history_buffer.pending(), 2)
+
+    def test_late_fix_goes_to_history_only(self):
+        self._post(self._fix(20, lat=20.2))
+        response = self._post(self._fix(5, lat=20.05))
+        self.assertEqual(response.data['late'], 1)
+        self.assertEqual(live_store.get(self.bus.id)['lat'], 20.2)
+        self.assertEqual(history_buffer.pending(), 2)
+
+    def test_watermark_is_persisted_and_reseeded(self):
+        self._post(self._fix(30, seq=9))
+        live_store.flush()
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.last_fix_at, self.start + timedelta(seconds=30))
+        self.assertEqual(self.bus.last_fix_seq, 9)
+
+        watermarks.reset()  # as after a restart
+        response = self._post(self._fix(30, seq=9), self._fix(25))
+        self.assertEqual(response.data['duplicates'], 1)
+        self.assertEqual(response.data['late'], 1)
+
+    def test_dedupe_rate_metric(self):
+        self._post(self._fix(1))
+        self._post(self._fix(1), self._fix(2))
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/admin/metrics/')
+        self.assertEqual(response.data['counters']['gps.fixes.received'], 3)
+        self.assertEqual(response.data['rates']['gps.dedupe_rate'], 0.3333)
+
+    def test_single_fix_retransmit_is_acknowledged(self):
+        fix = self._fix(40)
+        self.client.post('/api/gps/receive/', fix, format='json')
+        response = self.client.post('/api/gps/receive/', fix, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['vehicle_id'], str(self.bus.id))
+
+    def test_failed_batch_does_not_advance_the_watermark(self):
+        fix = parse_fix(self._fix(50, seq=3))
+        with mock.patch('core.ingestion._save_zone_events', side_effect=DatabaseError("locked")), \
+                mock.patch('core.ingestion.geofences.observe', return_value=(None, [('enter', mock.Mock())])), \
+                mock.patch('core.ingestion._zone_event'):
+            with self.assertRaises(DatabaseError):
+                apply_fixes([fix])
+        self.assertIsNone(watermarks.get("wm-imei-bus-001"))
+
+        response = self._post(self._fix(50, seq=3))   # the device retransmits
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['duplicates'], 0)
+        self.assertEqual(live_store.get(self.bus.id)['lat'], 20.0)
+
+    def test_future_timestamp_is_rejected(self):
+        future = {**self._fix(0), "timestamp": (timezone.now() + timedelta(days=365)).isoformat()}
+        response = self._post(future, self._fix(60, lat=20.6))
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['rejected'][0]['detail'], "timestamp is in the future")
+        self.assertEqual(live_store.get(self.bus.id)['lat'], 20.6)
+
+    def test_future_watermark_from_the_db_is_ignored(self):
+        Vehicle.objects.filter(id=self.bus.id).update(last_fix_at=timezone.now() + timedelta(days=365))
+        response = self._post(self._fix(70, lat=20.7))
+        self.assertEqual(response.data['late'], 0)
+        self.assertEqual(live_store.get(self.bus.id)['lat'], 20.7)
+
+
+@override_settings(GPS_INGEST_ASYNC=True, GPS_INGEST_WORKERS=0, GPS_INGEST_QUEUE_SIZE=2)
+class IngestQueueTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        ingest_queue.reset()
+        metrics.reset()
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-Q-BUS-001", gps_imei="q-imei-bus-001", vehicle_type="bus"
+        )
+        RFIDDevice.objects.create(rfid_id="RFID-Q-001", location_name="Main Gate")
+
+    def _post_fix(self, lat):
+        return self.client.post('/api/gps/receive/', {
+            "imei": "q-imei-bus-001", "latitude": lat, "longitude": 85.0, "speed": 10,
+        }, format='json')
+
+    def test_items_are_queued_then_drained_in_batches(self):
+        self.assertEqual(self._post_fix(20.1).status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post('/api/rfid/scan/', {
+            "rfid_device_id": "RFID-Q-001", "student_registration_id": "STUQ001",
+            "student_name": "Queue Student", "speed": 55,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(live_store.get(self.bus.id))
+
+        self.assertEqual(ingest_queue.drain(), 2)
+        self.assertEqual(live_store.get(self.bus.id)['lat'], 20.1)
+        self.assertEqual(Offence.objects.filter(offence_type='student_speed').count(), 1)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters']['ingest.processed'], 2)
+        self.assertEqual(snapshot['gauges']['ingest.queue_depth'], 0)
+        self.assertIn('ingest.lag_ms', snapshot['gauges'])
+
+    def test_full_queue_answers_429_with_retry_after(self):
+        self._post_fix(20.1)
+        self._post_fix(20.2)
+        response = self._post_fix(20.3)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(metrics.get('ingest.rejected'), 1)
+
+    @override_settings(GPS_INGEST_OVERFLOW='drop_oldest')
+    def test_drop_oldest_keeps_newest_items(self):
+        for lat in (20.1, 20.2, 20.3):
+            self.assertEqual(self._post_fix(lat).status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(metrics.get('ingest.dropped'), 1)
+        ingest_queue.drain()
+        self.assertEqual(history_buffer.pending(), 2)
+
+    def test_queue_is_bounded_by_fix_count(self):
+        fixes = [
+            {"imei": "q-imei-bus-001", "latitude": 20.1, "longitude": 85.0, "speed": 10, "seq": n}
+            for n in range(3)
+        ]
+        response = self.client.post('/api/gps/receive/batch/', {"fixes": fixes}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(metrics.get('ingest.rejected'), 3)
+        self.assertEqual(ingest_queue.depth(), 0)
+
+    @override_settings(GPS_INGEST_WORKERS=4, GPS_INGEST_QUEUE_SIZE=100)
+    def test_each_imei_stays_on_one_worker(self):
+        fixes = [
+            parse_fix({"imei": f"q-imei-{n % 5}", "latitude": 20.0, "longitude": 85.0, "speed": 0, "seq": n})
+            for n in range(40)
+        ]
+        with mock.patch.object(ingest_queue, '_ensure_workers'):
+            ingest_queue.submit(GPS, fixes[:20])
+            ingest_queue.submit(GPS, fixes[20:])
+        shards = {}
+        for index, entries in enumerate(ingest_queue._shards):
+            for _, items, _ in entries:
+                for fix in items:
+                    shards.setdefault(fix['imei'], set()).add(index)
+        self.assertTrue(all(len(indexes) == 1 for indexes in shards.values()))
+
+        applied = []
+        with mock.patch('core.ingest_queue.apply_fixes', side_effect=applied.extend):
+            self.assertEqual(ingest_queue.drain(), 40)
+        for imei in shards:
+            seqs = [fix['seq'] for fix in applied if fix['imei'] == imei]
+            self.assertEqual(seqs, sorted(seqs))
+
+    @override_settings(GPS_INGEST_MAX_RETRIES=2, GPS_INGEST_RETRY_BACKOFF=0)
+    def test_failed_batch_is_retried_then_dead_lettered(self):
+        self._post_fix(20.1)
+        with mock.patch('core.ingest_queue.apply_fixes', side_effect=[DatabaseError("locked"), None]), \
+                mock.patch('core.ingest_queue.logger'):
+            ingest_queue.drain()
+        self.assertEqual(metrics.get('ingest.retried'), 1)
+        self.assertEqual(metrics.get('ingest.processed'), 1)
+        self.assertEqual(ingest_queue.dead_letters(), [])
+
+        self._post_fix(20.2)
+        with mock.patch('core.ingest_queue.apply_fixes', side_effect=DatabaseError("locked")) as apply, \
+                mock.patch('core.ingest_queue.logger'):
+            ingest_queue.drain()
+        self.assertEqual(apply.call_count, 3)
+        self.assertEqual(metrics.get('ingest.failed'), 1)
+        [(kind, items)] = ingest_queue.dead_letters()
+        self.assertEqual((kind, items[0]['lat']), (GPS, 20.2))
+
+    @override_settings(GPS_INGEST_RETRY_BACKOFF=0)
+    def test_socket_batches_are_retried_through_the_queue(self):
+        fix = parse_fix({"imei": "q-imei-bus-001", "latitude": 20.1, "longitude": 85.0, "speed": 10})
+        attempts = []
+
+        def flaky_apply(fixes):
+            attempts.append(len(fixes))
+            if len(attempts) == 1:
+                raise DatabaseError("locked")
+            return apply_fixes(fixes)
+
+        with mock.patch('core.ingest_queue.apply_fixes', flaky_apply), mock.patch('core.ingest_queue.logger'):
+            enqueue_fix_batch([fix])   # what the TCP / UDP listeners call from their DB thread
+        self.assertEqual(attempts, [1, 1])
+        self.assertEqual(live_store.get(self.bus.id)['lat'], 20.1)
+        self.assertEqual(metrics.get('ingest.retried'), 1)
+
+    @override_settings(GPS_INGEST_QUEUE_SIZE=100, GPS_INGEST_RETRY_BACKOFF=0)
+    def test_retried_batch_keeps_offences_and_zone_events(self):
+        Geofence.objects.create(name="Queue Zone", polygon=square(20.30, 85.80, 0.002), speed_limit=20)
+        start = timezone.now() - timedelta(minutes=5)
+        # the batch ends still inside the zone and still speeding
+        fixes = [parse_fix({
+            "imei": "q-imei-bus-001", "latitude": 20.30, "longitude": 85.80, "speed": 50,
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+        }) for i in range(7)]
+
+        bulk_create, attempts = GeofenceEvent.objects.bulk_create, []
+
+        def flaky_bulk_create(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise DatabaseError("locked")
+            return bulk_create(*args, **kwargs)
+
+        ingest_queue.submit(GPS, fixes)
+        with mock.patch.object(GeofenceEvent.objects, 'bulk_create', flaky_bulk_create), \
+                mock.patch('core.ingest_queue.logger'):
+            self.assertEqual(ingest_queue.drain(), 7)
+        self.assertEqual(metrics.get('ingest.retried'), 7)
+        self.assertEqual(ingest_queue.dead_letters(), [])
+        self.assertEqual(Offence.objects.filter(vehicle=self.bus).count(), 1)
+        self.assertEqual(list(GeofenceEvent.objects.values_list('event', flat=True)), ['enter'])
+
+
+class RFIDScanTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        RFIDDevice.objects.create(rfid_id="RFID-S-001", location_name="Hostel Road")
+
+    def test_speeding_scan_records_offence(self):
+        response = self.client.post('/api/rfid/scan/', {
+            "rfid_device_id": "RFID-S-001", "student_registration_id": "STUS001",
+            "student_name": "Fast Student", "phone": "9400000030", "speed": 48,
+        }, format='json')
+        self.assertEqual(response.data['message'], "Speed violation recorded")
+        offence = Offence.objects.get(offence_type='student_speed')
+        self.assertEqual(offence.location, {"name": "Hostel Road"})
+
+    def test_unknown_device_is_404(self):
+        response = self.client.post('/api/rfid/scan/', {
+            "rfid_device_id": "RFID-NOPE", "student_registration_id": "STUS001", "speed": 48,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BusPositionStreamTests(TestCase):
+    def setUp(self):
+        reset_ingestion_state()
+        self.addCleanup(hub.reset)
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-SSE-BUS-001", gps_imei="sse-imei-bus-001", vehicle_type="bus",
+        )
+
+    async def _subscribe(self):
+        return hub.subscribe(BUS_POSITIONS)
+
+    def test_slow_subscriber_keeps_only_latest_position(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription = loop.run_until_complete(self._subscribe())
+
+        for second, lat in enumerate([20.1, 20.2, 20.3]):
+            apply_fixes([parse_fix({
+                "imei": "sse-imei-bus-001", "latitude": lat, "longitude": 85.8,
+                "speed": 20, "timestamp": f"2026-03-01T08:00:{second:02d}+05:30",
+            })])
+
+        payloads = loop.run_until_complete(subscription.get())
+        self.assertEqual(len(payloads), 1)
+        self.assertTrue(payloads[0].startswith(b"event: position\n"))
+        data = json.loads(payloads[0].split(b"data: ")[1])
+        self.assertEqual(data['vehicle_id'], str(self.bus.id))
+        self.assertEqual(data['location']['lat'], 20.3)
+
+    async def test_stream_endpoint_pushes_published_events(self):
+        response = await AsyncClient().get('/api/public/buses/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content
+        self.assertEqual(await chunks.__anext__(), b"retry: 3000\n\n")
+
+        next_chunk = asyncio.ensure_future(chunks.__anext__())
+        await asyncio.sleep(0)
+        self.assertEqual(hub.publish(BUS_POSITIONS, "bus-1", b"event: position\ndata: {}\n\n"), 1)
+        self.assertEqual(await asyncio.wait_for(next_chunk, 1), b"event: position\ndata: {}\n\n")
+        await chunks.aclose()
+
+    def test_failed_publish_does_not_break_ingestion(self):
+        metrics.reset()
+        backend = mock.Mock(local=False)
+        backend.publish.side_effect = ConnectionError("redis is down")
+        with mock.patch.object(hub, '_backend', backend), mock.patch('core.pubsub.logger'):
+            result = apply_fixes([parse_fix({
+                "imei": "sse-imei-bus-001", "latitude": 20.1, "longitude": 85.8, "speed": 20,
+            })])
+        self.assertEqual(result['applied'], 1)
+        self.assertEqual(history_buffer.pending(), 1)
+        self.assertEqual(metrics.get('pubsub.publish_failed'), 1)
+
+    def test_redis_listener_reconnects(self):
+        class Stop(BaseException):
+            pass
+
+        delivered = []
+        hub_ = mock.Mock(deliver=lambda *args: delivered.append(args))
+        connected = mock.Mock()
+        connected.listen.side_effect = [
+            ConnectionError("dropped"),
+            iter([{'data': json.dumps(["topic", "key", "payload"])}]),
+        ]
+        client = mock.Mock()
+        client.pubsub.side_effect = [ConnectionError("refused"), connected, connected, Stop()]
+        backend = RedisBackend.__new__(RedisBackend)
+        backend.hub, backend.client = hub_, client
+        with mock.patch('core.pubsub.time.sleep') as sleep, mock.patch('core.pubsub.logger'), \
+                self.assertRaises(Stop):
+            backend._listen()
+        self.assertEqual(delivered, [("topic", "key", b"payload")])
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 1])
+
+
+class BookingWebSocketTests(TestCase):
+    def setUp(self):
+        reset_ingestion_state()
+        self.addCleanup(hub.reset)
+        self.student = User.objects.create(
+            name="Socket Student", phone="9400000040", password=make_password("x"),
+            registration_id="STUWS001", role="student",
+        )
+        self.other = User.objects.create(
+            name="Other Student", phone="9400000041", password=make_password("x"),
+            registration_id="STUWS002", role="student",
+        )
+        self.ambulance = Vehicle.objects.create(
+            vehicle_number="OD-WS-AMB-001", gps_imei="ws-imei-amb-001", vehicle_type="ambulance",
+        )
+        self.booking = Booking.objects.create(
+            student_registration_id="STUWS001", phone="9400000040", place="Hostel",
+            user_location={"lat": 20.3000, "lng": 85.8300}, status="accepted", vehicle=self.ambulance,
+        )
+
+    def _connect(self, user):
+        return ApplicationCommunicator(websocket_application, {
+            'type': 'websocket',
+            'path': f'/ws/bookings/{self.booking.id}/',
+            'query_string': f'token={create_access_token(user)}'.encode(),
+        })
+
+    async def test_student_receives_eta_updates(self):
+        socket = self._connect(self.student)
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(1))['type'], 'websocket.accept')
+        initial = json.loads((await socket.receive_output(1))['text'])
+        self.assertEqual(initial['booking_id'], str(self.booking.id))
+        self.assertIsNone(initial['eta_minutes'])
+
+        await sync_to_async(apply_fixes)([parse_fix({
+            "imei": "ws-imei-amb-001", "latitude": 20.2961, "longitude": 85.8245, "speed": 30,
+        })])
+        update = json.loads((await socket.receive_output(1))['text'])
+        self.assertEqual(update['type'], 'eta_update')
+        self.assertGreater(update['eta_minutes'], 0)
+        self.assertEqual(update['vehicle_location']['lat'], 20.2961)
+
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(1)
+        self.assertFalse(hub.has_subscribers(f'booking:{self.booking.id}'))
+
+    async def test_other_users_booking_is_rejected(self):
+        socket = self._connect(self.other)
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual(await socket.receive_output(1), {'type': 'websocket.close', 'code': 4403})
+
+
+class ActiveBusesQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+
+    def _add_running_bus(self, n):
+        driver = User.objects.create(
+            name=f"Fleet Driver {n}", phone=f"94000001{n:02d}", password=make_password("x"),
+            registration_id=f"DRVFLEET{n:03d}", role="driver", driver_type="bus",
+        )
+        bus = Vehicle.objects.create(
+            vehicle_number=f"OD-FLEET-{n:03d}", gps_imei=f"fleet-imei-{n:03d}", vehicle_type="bus",
+            assigned_to=driver, is_out_of_station=True,
+        )
+        Trip.objects.create(
+            vehicle=bus, driver=driver, vehicle_number=bus.vehicle_number,
+            driver_name=driver.name, vehicle_type="bus",
+        )
+        return bus
+
+    def test_query_count_does_not_grow_with_fleet(self):
+        self._add_running_bus(1)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/public/buses/')
+        self.assertEqual(len(response.data['buses']), 1)
+
+        for n in range(2, 8):
+            self._add_running_bus(n)
+        bus_snapshot.bump()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/public/buses/')
+        self.assertEqual(len(response.data['buses']), 7)
+        # public GET no longer writes
+        self.assertEqual(Vehicle.objects.filter(is_out_of_station=True).count(), 7)
+
+    def test_no_active_trips_uses_one_aggregate(self):
+        Vehicle.objects.create(
+            vehicle_number="OD-FLEET-OUT", gps_imei="fleet-imei-out", vehicle_type="bus",
+            is_out_of_station=True,
+        )
+        # the (empty) trip query plus a single aggregate over the buses
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/public/buses/')
+        self.assertTrue(response.data['all_out_of_station'])
+
+    def test_start_trip_clears_out_of_station(self):
+        driver = User.objects.create(
+            name="Returning Driver", phone="9400000150", password=make_password("x"),
+            registration_id="DRVFLEET150", role="driver", driver_type="bus",
+        )
+        bus = Vehicle.objects.create(
+            vehicle_number="OD-FLEET-150", gps_imei="fleet-imei-150", vehicle_type="bus",
+            assigned_to=driver, is_out_of_station=True,
+        )
+        self.client.force_authenticate(user=driver)
+        response = self.client.post('/api/driver/start-trip/', {"vehicle_id": str(bus.id)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        bus.refresh_from_db()
+        self.assertFalse(bus.is_out_of_station)
+
+
+class BusSnapshotTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-SNAP-001", gps_imei="snap-imei-001", vehicle_type="bus",
+        )
+        self.driver = User.objects.create(
+            name="Snap Driver", phone="9400000160", password=make_password("x"),
+            registration_id="DRVSNAP001", role="driver", driver_type="bus",
+        )
+        self.bus.assigned_to = self.driver
+        self.bus.save(update_fields=['assigned_to'])
+
+    def test_cached_bytes_and_conditional_get(self):
+        first = self.client.get('/api/public/buses/')
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/public/buses/')
+            not_modified = self.client.get('/api/public/buses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified['ETag'], etag)
+
+    def test_trip_start_and_fixes_bump_version(self):
+        etag = self.client.get('/api/public/buses/')['ETag']
+        self.client.force_authenticate(user=self.driver)
+        self.client.post('/api/driver/start-trip/', {"vehicle_id": str(self.bus.id)}, format='json')
+        response = self.client.get('/api/public/buses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['buses']), 1)
+
+        version = bus_snapshot.version
+        apply_fixes([parse_fix({"imei": "snap-imei-001", "latitude": 20.3, "longitude": 85.8, "speed": 10})])
+        self.assertGreater(bus_snapshot.version, version)
+        response = self.client.get('/api/public/buses/')
+        self.assertEqual(response.data['buses'][0]['location']['lat'], 20.3)
+
+    def test_ttl_rebuild_picks_up_fixes_persisted_elsewhere(self):
+        self.client.force_authenticate(user=self.driver)
+        self.client.post('/api/driver/start-trip/', {"vehicle_id": str(self.bus.id)}, format='json')
+        apply_fixes([parse_fix({"imei": "snap-imei-001", "latitude": 20.3, "longitude": 85.8, "speed": 10})])
+        self.assertEqual(self.client.get('/api/public/buses/').data['buses'][0]['location']['lat'], 20.3)
+
+        # another worker applies and flushes a later fix: no bump reaches this process
+        Vehicle.objects.filter(id=self.bus.id).update(
+            current_location={"lat": 20.4, "lng": 85.8}, last_fix_at=timezone.now() + timedelta(seconds=5)
+        )
+        with override_settings(PUBLIC_SNAPSHOT_TTL=0):
+            response = self.client.get('/api/public/buses/')
+        self.assertEqual(response.data['buses'][0]['location']['lat'], 20.4)
+
+    def test_single_flight_rebuild(self):
+        builds = []
+        release = threading.Event()
+
+        def slow_build():
+            builds.append(1)
+            release.wait(1)
+            return {"buses": []}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(bus_snapshot.get(slow_build))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(len({r.etag for r in results}), 1)
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.driver = User.objects.create(
+            name="Delta Driver", phone="9400000170", password=make_password("x"),
+            registration_id="DRVDELTA001", role="driver", driver_type="bus",
+        )
+        self.buses = [
+            Vehicle.objects.create(
+                vehicle_number=f"OD-DELTA-{n}", gps_imei=f"delta-imei-{n}", vehicle_type="bus",
+                assigned_to=self.driver,
+            )
+            for n in range(3)
+        ]
+        for bus in self.buses:
+            Trip.objects.create(
+                vehicle=bus, driver=self.driver, vehicle_number=bus.vehicle_number,
+                driver_name=self.driver.name, vehicle_type="bus",
+            )
+        self.ambulance = Vehicle.objects.create(
+            vehicle_number="OD-DELTA-AMB", gps_imei="delta-imei-amb", vehicle_type="ambulance",
+        )
+
+    def _fix(self, imei, lat=20.3):
+        return parse_fix({"imei": imei, "latitude": lat, "longitude": 85.8, "speed": 10})
+
+    def test_only_moved_and_removed_buses_are_sent(self):
+        full = self.client.get('/api/public/buses/').data
+        self.assertEqual(len(full['buses']), 3)
+
+        apply_fixes([self._fix("delta-imei-0")])
+        Trip.objects.filter(vehicle=self.buses[1]).update(is_active=False)
+        bus_snapshot.bump(self.buses[1].id)
+
+        delta = self.client.get('/api/public/buses/', {"since": full['version']}).data
+        self.assertTrue(delta['delta'])
+        self.assertEqual([b['vehicle_id'] for b in delta['buses']], [str(self.buses[0].id)])
+        self.assertEqual(delta['buses'][0]['location']['lat'], 20.3)
+        self.assertEqual(delta['removed'], [str(self.buses[1].id)])
+
+        unchanged = self.client.get('/api/public/buses/', {"since": delta['version']}).data
+        self.assertEqual((unchanged['buses'], unchanged['removed']), ([], []))
+
+    @override_settings(PUBLIC_DELTA_RETENTION=2)
+    def test_client_too_far_behind_gets_full_resync(self):
+        version = self.client.get('/api/public/buses/').data['version']
+        for n in range(3):
+            apply_fixes([self._fix(f"delta-imei-{n}")])
+        response = self.client.get('/api/public/buses/', {"since": version})
+        self.assertNotIn('delta', response.data)
+        self.assertEqual(len(response.data['buses']), 3)
+
+        foreign = self.client.get('/api/public/buses/', {"since": "deadbeef.1"})
+        self.assertNotIn('delta', foreign.data)
+
+    def test_ambulance_delta(self):
+        version = self.client.get('/api/public/ambulances/').data['version']
+        self.client.force_authenticate(user=self.driver)
+        self.client.post(f'/api/driver/assign-vehicle/{self.ambulance.id}/')
+        delta = self.client.get('/api/public/ambulances/', {"since": version}).data
+        self.assertEqual(delta['removed'], [str(self.ambulance.id)])
+
+
+class SpatialIndexTests(SimpleTestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        index = SpatialIndex()
+        points = {}
+        for n in range(300):
+            lat, lng = 20.25 + rng.random() * 0.1, 85.78 + rng.random() * 0.1
+            points[str(n)] = (lat, lng)
+            index.update(n, 'bus', f"B{n}", lat, lng)
+        # move a few vehicles across cells
+        for n in range(0, 300, 7):
+            lat, lng = 20.25 + rng.random() * 0.1, 85.78 + rng.random() * 0.1
+            points[str(n)] = (lat, lng)
+            index.update(n, 'bus', f"B{n}", lat, lng)
+
+        for _ in range(20):
+            lat, lng = 20.24 + rng.random() * 0.12, 85.77 + rng.random() * 0.12
+            brute = sorted(points, key=lambda key: calculate_distance(lat, lng, *points[key]))
+            self.assertEqual([h['vehicle_id'] for h in index.nearest(lat, lng, k=5)], brute[:5])
+            within = [k for k in brute if calculate_distance(lat, lng, *points[k]) <= 1.5]
+            self.assertEqual([h['vehicle_id'] for h in index.within(lat, lng, 1.5)], within)
+
+    def test_far_away_query_falls_back_to_scan(self):
+        index = SpatialIndex()
+        index.update("a", 'ambulance', "A1", 20.30, 85.82)
+        self.assertEqual(index.nearest(0, 0, k=1)[0]['vehicle_id'], "a")
+        index.remove("a")
+        self.assertEqual(index.nearest(20.30, 85.82), [])
+
+
+class NearbyVehiclesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.driver = User.objects.create(
+            name="Nearby Driver", phone="9400000180", password=make_password("x"),
+            registration_id="DRVNEAR001", role="driver", driver_type="ambulance",
+        )
+        self.near = Vehicle.objects.create(vehicle_number="OD-NEAR-1", gps_imei="near-imei-1", vehicle_type="ambulance")
+        self.far = Vehicle.objects.create(vehicle_number="OD-NEAR-2", gps_imei="near-imei-2", vehicle_type="ambulance")
+        Vehicle.objects.create(vehicle_number="OD-NEAR-3", gps_imei="near-imei-3", vehicle_type="ambulance")
+        apply_fixes([
+            parse_fix({"imei": "near-imei-1", "latitude": 20.3001, "longitude": 85.8301, "speed": 0}),
+            parse_fix({"imei": "near-imei-2", "latitude": 20.3500, "longitude": 85.9000, "speed": 0}),
+        ])
+
+    def test_ambulances_sorted_by_distance(self):
+        response = self.client.get('/api/public/ambulances/', {"lat": 20.30, "lng": 85.83})
+        ids = [a['id'] for a in response.data['ambulances']]
+        self.assertEqual(ids[:2], [str(self.near.id), str(self.far.id)])
+        self.assertLess(response.data['ambulances'][0]['distance_km'], 0.1)
+        self.assertIsNone(response.data['ambulances'][2]['distance_km'])
+
+    def test_nearest_and_radius_endpoints(self):
+        nearest = self.client.get('/api/public/vehicles/nearest/', {
+            "lat": 20.30, "lng": 85.83, "vehicle_type": "ambulance", "k": 1,
+        })
+        self.assertEqual([v['vehicle_id'] for v in nearest.data['vehicles']], [str(self.near.id)])
+        nearby = self.client.get('/api/public/vehicles/nearby/', {
+            "lat": 20.30, "lng": 85.83, "vehicle_type": "ambulance", "radius_km": 1,
+        })
+        self.assertEqual(len(nearby.data['vehicles']), 1)
+        bad = self.client.get('/api/public/vehicles/nearby/', {"lat": "x", "lng": 85.83})
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_non_finite_or_negative_inputs_are_rejected(self):
+        for params in (
+            {"lat": 20.30, "lng": 85.83, "radius_km": "nan"},
+            {"lat": 20.30, "lng": 85.83, "radius_km": "-inf"},
+            {"lat": 20.30, "lng": 85.83, "radius_km": "-1"},
+            {"lat": 20.30, "lng": 85.83, "radius_km": "0"},
+            {"lat": "nan", "lng": 85.83},
+            {"lat": 20.30, "lng": "inf"},
+        ):
+            response = self.client.get('/api/public/vehicles/nearby/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_positions_persisted_by_other_processes_are_picked_up(self):
+        params = {"lat": 20.40, "lng": 85.95, "vehicle_type": "ambulance", "radius_km": 1}
+        self.assertEqual(self.client.get('/api/public/vehicles/nearby/', params).data['vehicles'], [])
+        # the socket server applies a newer fix for OD-NEAR-2 and flushes it
+        Vehicle.objects.filter(id=self.far.id).update(
+            current_location={"lat": 20.4001, "lng": 85.9501}, last_fix_at=timezone.now() + timedelta(seconds=1)
+        )
+        with override_settings(GPS_SPATIAL_RESEED_SECONDS=0):
+            vehicles = self.client.get('/api/public/vehicles/nearby/', params).data['vehicles']
+            self.assertEqual([v['vehicle_id'] for v in vehicles], [str(self.far.id)])
+
+            # an older persisted row does not beat the fix this process applied
+            Vehicle.objects.filter(id=self.near.id).update(
+                current_location={"lat": 20.4002, "lng": 85.9502}, last_fix_at=timezone.now() - timedelta(hours=1)
+            )
+            vehicles = self.client.get('/api/public/vehicles/nearby/', params).data['vehicles']
+            self.assertEqual([v['vehicle_id'] for v in vehicles], [str(self.far.id)])
+
+    def test_accept_booking_uses_nearest_assigned_ambulance(self):
+        Vehicle.objects.filter(id__in=[self.near.id, self.far.id]).update(assigned_to=self.driver)
+        booking = Booking.objects.create(
+            student_registration_id="STUNEAR001", phone="9400000181", place="Gate",
+            user_location={"lat": 20.3502, "lng": 85.9001},
+        )
+        self.client.force_authenticate(user=self.driver)
+        response = self.client.post(f'/api/driver/accept-booking/{booking.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        booking.refresh_from_db()
+        self.assertEqual(booking.vehicle_id, self.far.id)
+
+
+class BatchedDistanceTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.lats = [20.2 + rng.random() for _ in range(200)]
+        self.lngs = [85.7 + rng.random() for _ in range(200)]
+
+    def _check_against_scalar(self):
+        distances = utils.calculate_distances(20.3, 85.8, self.lats, self.lngs)
+        for d, la, ln in zip(distances, self.lats, self.lngs):
+            self.assertAlmostEqual(d, calculate_distance(20.3, 85.8, la, ln), places=9)
+
+        matrix = utils.distance_matrix(self.lats[:3], self.lngs[:3], self.lats, self.lngs)
+        self.assertEqual(len(matrix), 3)
+        self.assertAlmostEqual(
+            matrix[2][5], calculate_distance(self.lats[2], self.lngs[2], self.lats[5], self.lngs[5]), places=9
+        )
+
+        expected = sum(
+            calculate_distance(self.lats[i - 1], self.lngs[i - 1], self.lats[i], self.lngs[i])
+            for i in range(1, 200)
+        )
+        self.assertAlmostEqual(utils.path_length(self.lats, self.lngs), expected, places=6)
+
+        self.assertAlmostEqual(utils.calculate_etas([10.0], 40)[0], 15.0)
+        self.assertEqual(list(utils.calculate_etas([10.0], 0)), [0])
+
+    @skipIf(utils.np is None, "NumPy not installed")
+    def test_numpy_matches_scalar(self):
+        self._check_against_scalar()
+
+    def test_pure_python_fallback(self):
+        with mock.patch.object(utils, 'np', None):
+            self._check_against_scalar()
+
+
+class BusETAListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.driver = User.objects.create(
+            name="ETA Driver", phone="9400000190", password=make_password("x"),
+            registration_id="DRVETA001", role="driver", driver_type="bus",
+        )
+        self.buses = []
+        for n, lat in enumerate([20.40, 20.31, None]):
+            bus = Vehicle.objects.create(
+                vehicle_number=f"OD-ETA-{n}", gps_imei=f"eta-imei-{n}", vehicle_type="bus",
+            )
+            Trip.objects.create(
+                vehicle=bus, driver=self.driver, vehicle_number=bus.vehicle_number,
+                driver_name=self.driver.name, vehicle_type="bus",
+            )
+            if lat is not None:
+                apply_fixes([parse_fix({"imei": f"eta-imei-{n}", "latitude": lat, "longitude": 85.83, "speed": 20})])
+            self.buses.append(bus)
+
+    def test_ranked_etas_in_one_response(self):
+        self.client.get('/api/public/buses/')  # warm the snapshot
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/public/buses/eta/', {"user_lat": 20.30, "user_lng": 85.83})
+        ranked = response.data['buses']
+        self.assertEqual(
+            [b['vehicle_id'] for b in ranked], [str(self.buses[i].id) for i in (1, 0, 2)]
+        )
+        self.assertAlmostEqual(ranked[0]['distance_km'], 1.11, places=2)
+        self.assertEqual(ranked[0]['eta_minutes'], 1.7)
+        self.assertIsNone(ranked[2]['eta_minutes'])
+
+    def test_user_location_required(self):
+        response = self.client.get('/api/public/buses/eta/', {"user_lat": 20.30})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def write_geojson(features):
+    fd, path = tempfile.mkstemp(suffix='.geojson')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump({"type": "FeatureCollection", "features": features}, fh)
+    return path
+
+
+def road(coords, **properties):
+    return {
+        "type": "Feature",
+        "properties": properties,
+        "geometry": {"type": "LineString", "coordinates": [[lng, lat] for lat, lng in coords]},
+    }
+
+
+class RoadNetworkETATests(SimpleTestCase):
+    def setUp(self):
+        # a U-shaped road: the ends are 2.2 km apart but 6.4 km by road
+        self.path = write_geojson([
+            road([(20.30, 85.80), (20.30, 85.82), (20.32, 85.82), (20.32, 85.80)]),
+        ])
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(eta_engine.reset)
+        eta_engine.reset()
+
+    def test_eta_follows_the_road(self):
+        with override_settings(ROAD_GRAPH_PATH=self.path):
+            road_eta = eta_engine.estimate(20.3001, 85.8001, 20.3199, 85.8001, 40)
+        straight = calculate_distance(20.3001, 85.8001, 20.3199, 85.8001) / 40 * 60
+        by_road = (
+            calculate_distance(20.30, 85.80, 20.30, 85.82) * 2
+            + calculate_distance(20.30, 85.82, 20.32, 85.82)
+        ) / 40 * 60
+        self.assertGreater(road_eta, 2.5 * straight)
+        self.assertAlmostEqual(road_eta, by_road, delta=0.1)
+
+    def test_falls_back_to_straight_line(self):
+        straight = calculate_distance(20.30, 85.80, 20.40, 85.90) / 40 * 60
+        with override_settings(ROAD_GRAPH_PATH=''):
+            self.assertAlmostEqual(eta_engine.estimate(20.30, 85.80, 20.40, 85.90, 40), straight)
+        eta_engine.reset()
+        with override_settings(ROAD_GRAPH_PATH=self.path):
+            # too far from any road to snap
+            self.assertAlmostEqual(eta_engine.estimate(20.30, 85.80, 20.40, 85.90, 40), straight)
+
+    def test_oneway_and_maxspeed(self):
+        path = write_geojson([
+            road([(20.30, 85.80), (20.30, 85.81)], oneway="yes", maxspeed="20 km/h"),
+            road([(20.30, 85.80), (20.31, 85.80), (20.31, 85.81), (20.30, 85.81)]),
+        ])
+        self.addCleanup(os.remove, path)
+        network = RoadNetwork.from_geojson(path)
+        with override_settings(ROAD_SNAP_MAX_KM=0.3):
+            along = network.travel_minutes(20.30, 85.80, 20.30, 85.81, 40)
+            against = network.travel_minutes(20.30, 85.81, 20.30, 85.80, 40)
+        self.assertAlmostEqual(along, calculate_distance(20.30, 85.80, 20.30, 85.81) / 20 * 60, places=3)
+        self.assertGreater(against, along)
+
+    def test_landmarks_agree_with_all_pairs(self):
+        rng = random.Random(11)
+        features = []
+        for i in range(6):
+            features.append(road([(20.30 + i * 0.002, 85.80 + j * 0.002) for j in range(6)],
+                                 oneway="yes" if i % 2 else "no"))
+            features.append(road([(20.30 + j * 0.002, 85.80 + i * 0.002) for j in range(6)],
+                                 maxspeed=20 if i == 3 else None))
+        path = write_geojson(features)
+        self.addCleanup(os.remove, path)
+        queries = [
+            (20.30 + rng.random() * 0.01, 85.80 + rng.random() * 0.01,
+             20.30 + rng.random() * 0.01, 85.80 + rng.random() * 0.01)
+            for _ in range(30)
+        ]
+        results = []
+        for max_nodes in (10_000, 0):   # all pairs, then landmarks
+            with override_settings(ROAD_GRAPH_APSP_MAX_NODES=max_nodes, ROAD_GRAPH_LANDMARKS=4):
+                network = RoadNetwork.from_geojson(path)
+                network.table(40, wait=True)
+                results.append([network.travel_minutes(*q, 40) for q in queries])
+        # and the per-query search used while a table is being built
+        network = RoadNetwork.from_geojson(path)
+        with mock.patch.object(network, '_build_later'):
+            results.append([network.travel_minutes(*q, 40) for q in queries])
+        for apsp, alt, search in zip(*results):
+            self.assertAlmostEqual(apsp, alt, places=3)
+            self.assertAlmostEqual(apsp, search, places=3)
+
+    def test_missing_table_is_built_off_the_request_path(self):
+        path = write_geojson([road([(20.30, 85.80 + i * 0.002) for i in range(20)])])
+        self.addCleanup(os.remove, path)
+        network = RoadNetwork.from_geojson(path)
+        release = threading.Event()
+        build = network._build
+
+        def slow_build(key, generation):
+            release.wait(5)
+            return build(key, generation)
+
+        with mock.patch.object(network, '_build', side_effect=slow_build):
+            expected = calculate_distance(20.30, 85.80, 20.30, 85.82) / 40 * 60
+            # answered while the table is still being built
+            self.assertAlmostEqual(network.travel_minutes(20.30, 85.80, 20.30, 85.82, 40), expected, delta=0.05)
+            self.assertIsNone(network.table(40))
+            release.set()
+            network.wait_for_tables()
+        self.assertIsNotNone(network.table(40))
+
+
+class SpeedProfileTests(TestCase):
+    def setUp(self):
+        # straight 2.2 km road
+        self.path = write_geojson([road([(20.30, 85.80), (20.30, 85.81), (20.30, 85.82)])])
+        fd, self.profile_path = tempfile.mkstemp(suffix='.bin')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(os.remove, self.profile_path)
+        self.addCleanup(eta_engine.reset)
+        eta_engine.reset()
+        self.rush = timezone.make_aware(timezone.datetime(2024, 5, 6, 9, 15))   # Monday 09:xx
+        self.night = self.rush + timedelta(hours=14)
+
+    def _slow_profile(self, network):
+        builder = SpeedProfileBuilder(network)
+        for i in range(5):
+            builder.add(20.30, 85.801 + i * 0.004, 10, self.rush)
+        builder.add(20.30, 85.805, 0, self.rush)        # parked
+        builder.add(20.40, 85.805, 10, self.rush)       # off the road
+        self.assertEqual((builder.snapped, builder.skipped), (5, 2))
+        return builder.build(min_samples=2)
+
+    def test_round_trip(self):
+        network = RoadNetwork.from_geojson(self.path)
+        profile = self._slow_profile(network)
+        profile.save(self.profile_path)
+        loaded = SpeedProfile.load(self.profile_path, min_samples=2)
+        self.assertEqual(loaded.fingerprint, profile.fingerprint)
+        self.assertEqual(list(loaded.counts), list(profile.counts))
+        hour = hour_of_week(self.rush)
+        speeds = [loaded.speed(seg, hour) for seg in range(len(network.segments))]
+        self.assertTrue(all(speed == 10 for speed in speeds))
+        self.assertIsNone(loaded.speed(0, hour_of_week(self.night)))
+
+    def test_recorded_speed_slows_eta_only_at_that_hour(self):
+        self._slow_profile(RoadNetwork.from_geojson(self.path)).save(self.profile_path)
+        with override_settings(ROAD_GRAPH_PATH=self.path, ROAD_SPEED_PROFILE_PATH=self.profile_path,
+                               ROAD_PROFILE_MIN_SAMPLES=2):
+            rush = eta_engine.estimate(20.30, 85.80, 20.30, 85.82, 40, at=self.rush)
+            night = eta_engine.estimate(20.30, 85.80, 20.30, 85.82, 40, at=self.night)
+        km = calculate_distance(20.30, 85.80, 20.30, 85.82)
+        self.assertAlmostEqual(rush, km / 10 * 60, delta=0.1)
+        self.assertAlmostEqual(night, km / 40 * 60, delta=0.1)
+
+    def test_profile_for_another_graph_is_ignored(self):
+        other = write_geojson([road([(20.30, 85.80), (20.31, 85.80)])])
+        self.addCleanup(os.remove, other)
+        profile = self._slow_profile(RoadNetwork.from_geojson(self.path))
+        with self.assertRaises(ValueError):
+            RoadNetwork.from_geojson(other).use_profile(profile)
+
+        profile.save(self.profile_path)
+        with override_settings(ROAD_GRAPH_PATH=other, ROAD_SPEED_PROFILE_PATH=self.profile_path):
+            self.assertIsNone(eta_engine.network.profile)
+
+    def test_build_command_uses_recorded_fixes(self):
+        bus = Vehicle.objects.create(vehicle_number="OD-PROF-BUS-001", gps_imei="prof-imei-001", vehicle_type="bus")
+        recent = timezone.now() - timedelta(days=1)
+        PositionFix.objects.bulk_create([
+            PositionFix(vehicle=bus, timestamp=recent, lat_e7=203000000, lng_e7=858050000 + i, speed_dkmh=120)
+            for i in range(3)
+        ] + [
+            # too old for --days 7
+            PositionFix(vehicle=bus, timestamp=recent - timedelta(days=30),
+                        lat_e7=203000000, lng_e7=858050000, speed_dkmh=300),
+        ])
+        with override_settings(ROAD_GRAPH_PATH=self.path):
+            call_command('build_speed_profiles', days=7, output=self.profile_path, min_samples=3, stdout=io.StringIO())
+            network = eta_engine.network
+        profile = SpeedProfile.load(self.profile_path, min_samples=3)
+        segment = network.snap(20.30, 85.805)[0]
+        self.assertAlmostEqual(profile.speed(segment, hour_of_week(recent)), 12, places=3)
+
+
+@override_settings(ROAD_GRAPH_PATH='', BUS_STOP_DWELL_SECONDS=30)
+class StopArrivalsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        eta_engine.reset()
+        self.addCleanup(eta_engine.reset)
+        # three stops ~1 km apart along one street
+        self.stops = [
+            BusStop.objects.create(name=f"Stop {i}", lat=20.30, lng=85.80 + i * 0.01) for i in range(3)
+        ]
+        self.route = BusRoute.objects.create(name="Campus Line")
+        RouteStop.objects.bulk_create([
+            RouteStop(route=self.route, stop=stop, sequence=i) for i, stop in enumerate(self.stops)
+        ])
+        self.bus = Vehicle.objects.create(
+            vehicle_number="OD-STOP-BUS-001", gps_imei="stop-imei-001", vehicle_type="bus", route=self.route
+        )
+
+    def _fix(self, lng, when=None):
+        apply_fixes([parse_fix({
+            "imei": "stop-imei-001", "latitude": 20.30, "longitude": lng, "speed": 30,
+            "timestamp": (when or timezone.now()).isoformat(),
+        })])
+
+    def _arrivals(self, stop):
+        response = self.client.get(f'/api/public/stops/{stop.id}/arrivals/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['arrivals']
+
+    def test_predicts_every_stop_ahead(self):
+        self._fix(85.805)
+        self.assertEqual(self._arrivals(self.stops[0]), [])   # already passed
+        to_next = calculate_distance(20.30, 85.805, 20.30, 85.81) / 40 * 60
+        leg = calculate_distance(20.30, 85.81, 20.30, 85.82) / 40 * 60
+        [next_stop] = self._arrivals(self.stops[1])
+        [last_stop] = self._arrivals(self.stops[2])
+        self.assertEqual((next_stop['stops_away'], last_stop['stops_away']), (0, 1))
+        self.assertAlmostEqual(next_stop['eta_minutes'], to_next, delta=0.1)
+        self.assertAlmostEqual(last_stop['eta_minutes'], to_next + 0.5 + leg, delta=0.1)
+        self.assertEqual(next_stop['route_name'], "Campus Line")
+
+    def test_bus_moves_along_the_route(self):
+        self._fix(85.805)
+        self._fix(85.8099)   # at stop 1
+        self.assertEqual(self._arrivals(self.stops[1]), [])
+        self.assertEqual(self._arrivals(self.stops[2])[0]['stops_away'], 0)
+        self._fix(85.8201)   # end of the line
+        self.assertEqual(self._arrivals(self.stops[2]), [])
+
+    def test_loop_route_wraps_around(self):
+        BusRoute.objects.filter(id=self.route.id).update(is_loop=True)
+        self._fix(85.8199)
+        self.assertEqual(self._arrivals(self.stops[0])[0]['stops_away'], 0)
+        self.assertEqual(self._arrivals(self.stops[1])[0]['stops_away'], 1)
+        self.assertEqual(self._arrivals(self.stops[2])[0]['stops_away'], 2)
+
+    def test_arrivals_are_read_from_memory(self):
+        self._fix(85.805)
+        with self.assertNumQueries(0):
+            self._arrivals(self.stops[2])
+
+    def test_silent_bus_drops_out(self):
+        self._fix(85.805, when=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(self._arrivals(self.stops[1]), [])
+
+    def test_unknown_stop(self):
+        response = self.client.get(f'/api/public/stops/{self.route.id}/arrivals/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_creates_route_and_assigns_bus(self):
+        admin = User.objects.create(
+            name="Stops Admin", phone="9400000200", password=make_password("x"), role="admin"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_access_token(admin)}')
+        reverse_ids = [str(stop.id) for stop in reversed(self.stops)]
+        response = self.client.post('/api/admin/routes/', {
+            "name": "Campus Line Reverse", "stop_ids": reverse_ids
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([stop['id'] for stop in response.data['stops']], reverse_ids)
+
+        response = self.client.post(f'/api/admin/vehicles/{self.bus.id}/route/', {
+            "route_id": response.data['id']
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials()
+        self._fix(85.815)
+        # heading back towards stop 0 now
+        self.assertEqual(self._arrivals(self.stops[1])[0]['stops_away'], 0)
+        self.assertEqual(self._arrivals(self.stops[2]), [])
+
+
+def square(lat, lng, half):
+    return [[lat - half, lng - half], [lat - half, lng + half], [lat + half, lng + half], [lat + half, lng - half]]
+
+
+class GeofenceIndexTests(SimpleTestCase):
+    def test_concave_polygon(self):
+        # L-shape: the top-right quarter is outside
+        zone = Zone(1, "L", 20, 0, [[0, 0], [0, 2], [1, 2], [1, 1], [2, 1], [2, 0]])
+        self.assertTrue(zone.contains(0.5, 1.5))
+        self.assertTrue(zone.contains(1.5, 0.5))
+        self.assertFalse(zone.contains(1.5, 1.5))
+        self.assertFalse(zone.contains(-0.1, 0.5))
+
+    def test_precedence(self):
+        campus = Zone("campus", "Campus", 30, 0, square(20.30, 85.80, 0.01))
+        hostel = Zone("hostel", "Hostel", 15, 0, square(20.30, 85.80, 0.001))
+        gate = Zone("gate", "Gate", 10, 1, square(20.305, 85.80, 0.003))
+        index = GeofenceIndex([campus, hostel, gate], cell_deg=0.002)
+        self.assertIs(index.zone_at(20.30, 85.80), hostel)      # smaller zone wins
+        self.assertIs(index.zone_at(20.304, 85.80), gate)       # priority wins
+        self.assertIs(index.zone_at(20.295, 85.805), campus)
+        self.assertIsNone(index.zone_at(20.32, 85.80))
+
+    def test_matches_full_scan(self):
+        rng = random.Random(5)
+        zones = [
+            Zone(i, f"z{i}", 20, rng.randint(0, 1), square(20.30 + rng.uniform(-0.02, 0.02),
+                                                           85.80 + rng.uniform(-0.02, 0.02), rng.uniform(0.0005, 0.005)))
+            for i in range(100)
+        ]
+        # one zone too big for the grid
+        zones.append(Zone("big", "Big", 50, -1, square(20.30, 85.80, 1)))
+        ordered = sorted(zones, key=lambda z: (-z.priority, z.area))
+        index = GeofenceIndex(zones, cell_deg=0.002)
+        for _ in range(2000):
+            lat, lng = 20.30 + rng.uniform(-0.03, 0.03), 85.80 + rng.uniform(-0.03, 0.03)
+            expected = next((z for z in ordered if z.contains(lat, lng)), None)
+            self.assertIs(index.zone_at(lat, lng), expected)
+
+
+@override_settings(GPS_OVERSPEED_MIN_DURATION=0)
+class GeofenceIngestionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.hostel = Geofence.objects.create(name="Hostel Road", polygon=square(20.30, 85.80, 0.002), speed_limit=20)
+        self.bus = Vehicle.objects.create(vehicle_number="OD-ZONE-BUS-001", gps_imei="zone-imei-001", vehicle_type="bus")
+        self.start = timezone.now() - timedelta(minutes=5)
+
+    def _fixes(self, points, speed):
+        return apply_fixes([parse_fix({
+            "imei": "zone-imei-001", "latitude": lat, "longitude": lng, "speed": speed,
+            "timestamp": (self.start + timedelta(seconds=10 * i)).isoformat(),
+        }) for i, (lat, lng) in enumerate(points)])
+
+    def test_zone_limit_applies(self):
+        self._fixes([(20.30, 85.80), (20.3005, 85.80)], speed=30)
+        offence = Offence.objects.get(vehicle=self.bus)
+        self.assertEqual(offence.speed_limit, 20)
+
+    def test_campus_limit_outside_zones(self):
+        self._fixes([(20.31, 85.80), (20.3105, 85.80)], speed=30)
+        self.assertFalse(Offence.objects.filter(vehicle=self.bus).exists())
+
+    def test_entry_and_exit_events(self):
+        result = self._fixes([(20.31, 85.80), (20.30, 85.80), (20.3001, 85.80), (20.31, 85.80)], speed=10)
+        self.assertEqual(result['zone_events'], 2)
+        events = list(GeofenceEvent.objects.order_by('timestamp').values_list('event', 'geofence_id'))
+        self.assertEqual(events, [('enter', self.hostel.id), ('exit', self.hostel.id)])
+
+    def test_events_of_a_failed_batch_are_reported_on_retry(self):
+        points = [(20.31, 85.80), (20.30, 85.80), (20.31, 85.80)]
+        with mock.patch.object(GeofenceEvent.objects, 'bulk_create', side_effect=DatabaseError("locked")):
+            with self.assertRaises(DatabaseError):
+                self._fixes(points, speed=10)
+        self.assertEqual(self._fixes(points, speed=10)['zone_events'], 2)
+        self.assertEqual(GeofenceEvent.objects.count(), 2)
+
+    def test_event_for_deleted_zone_keeps_name(self):
+        self._fixes([(20.30, 85.80)], speed=10)
+        self.hostel.delete()
+        self.start += timedelta(minutes=1)
+        self._fixes([(20.31, 85.80)], speed=10)
+        exit_event = GeofenceEvent.objects.get(event='exit')
+        self.assertIsNone(exit_event.geofence_id)
+        self.assertEqual(exit_event.geofence_name, "Hostel Road")
+
+    def test_admin_changes_reload_the_index(self):
+        admin = User.objects.create(name="Zone Admin", phone="9400000210", password=make_password("x"), role="admin")
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_access_token(admin)}')
+        self.assertIsNone(geofences.zone_at(20.32, 85.80))
+        response = self.client.post('/api/admin/geofences/', {
+            "name": "Gate", "polygon": square(20.32, 85.80, 0.001), "speed_limit": 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(geofences.zone_at(20.32, 85.80).name, "Gate")
+
+        response = self.client.patch(f'/api/admin/geofences/{response.data["id"]}/', {"is_active": False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(geofences.zone_at(20.32, 85.80))
+
+        response = self.client.post('/api/admin/geofences/', {
+            "name": "Broken", "polygon": [[20.3, 85.8], [20.4, 85.8]], "speed_limit": 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rfid_gate_uses_its_zone_limit(self):
+        RFIDDevice.objects.create(rfid_id="RFID-Z-001", location_name="Hostel Gate", geofence=self.hostel)
+        response = self.client.post('/api/rfid/scan/', {
+            "rfid_device_id": "RFID-Z-001", "student_registration_id": "STUZ001", "speed": 25,
+        }, format='json')
+        self.assertEqual(response.data['message'], "Speed violation recorded")
+        self.assertEqual(Offence.objects.get(offence_type='student_speed').speed_limit, 20)
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        metrics.reset()
+        self.driver = User.objects.create(
+            name="Cache Driver", phone="9400000220", password=make_password("x"),
+            role="driver", driver_type="bus"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_access_token(self.driver)}')
+
+    def test_second_request_skips_the_user_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/auth/me/').status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/me/')
+        self.assertEqual(response.data['name'], "Cache Driver")
+        self.assertEqual(metrics.get('auth.user_cache.hit'), 1)
+        self.assertEqual(metrics.get('auth.user_cache.miss'), 1)
+        self.assertEqual(metrics.snapshot()['rates']['auth.user_cache.hit_rate'], 0.5)
+
+    def test_role_change_and_delete_invalidate(self):
+        self.assertEqual(self.client.get('/api/driver/my-trips/').status_code, 200)
+        self.driver.role = 'student'
+        self.driver.save()
+        self.assertEqual(self.client.get('/api/driver/my-trips/').status_code, 403)
+        self.driver.delete()
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 401)
+
+    def test_cached_user_is_a_copy(self):
+        self.client.get('/api/auth/me/')
+        cached = user_cache.get(self.driver.id)
+        cached.name = "Changed"
+        self.assertEqual(user_cache.get(self.driver.id).name, "Cache Driver")
+
+    @override_settings(AUTH_USER_CACHE_SIZE=2)
+    def test_lru_bound(self):
+        users = [
+            User.objects.create(name=f"LRU {i}", phone=f"940000023{i}", password="x") for i in range(3)
+        ]
+        for user in users:
+            user_cache.put(user)
+        self.assertEqual(len(user_cache), 2)
+        self.assertIsNone(user_cache.get(users[0].id))
+        self.assertIsNotNone(user_cache.get(users[2].id))
+
+    def test_invalidation_during_load_wins(self):
+        generation = user_cache.generation()
+        user_cache.invalidate(self.driver.id)     # e.g. a save racing the DB read
+        user_cache.put(self.driver, generation)
+        self.assertIsNone(user_cache.get(self.driver.id))
+
+    @override_settings(AUTH_TRUST_ROLE_CLAIM=True)
+    def test_role_check_needs_no_user_query(self):
+        with self.assertNumQueries(1):   # the bookings themselves
+            response = self.client.get('/api/driver/pending-bookings/')
+        self.assertEqual(response.status_code, 200)
+        student = User.objects.create(name="Cache Student", phone="9400000221", password="x", role="student")
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_access_token(student)}')
+        self.assertEqual(self.client.get('/api/driver/pending-bookings/').status_code, 403)
+
+
+@override_settings(AUTH_TRUST_ROLE_CLAIM=True)
+class LazyUserTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        self.driver = User.objects.create(
+            name="Lazy Driver", phone="9400000240", password=make_password("x"),
+            role="driver", driver_type="bus"
+        )
+        self.bus = Vehicle.objects.create(vehicle_number="OD-LAZY-BUS-001", gps_imei="lazy-imei-001", vehicle_type="bus")
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_access_token(self.driver)}')
+
+    def test_active_trip_is_one_query(self):
+        Trip.objects.create(vehicle=self.bus, driver=self.driver, vehicle_number=self.bus.vehicle_number,
+                            driver_name=self.driver.name, vehicle_type="bus")
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/driver/active-trip/')
+        self.assertEqual(response.data['trip']['vehicle'], str(self.bus.id))
+
+    @override_settings(AUTH_TRUST_ROLE_CLAIM=False, AUTH_USER_CACHE_TTL=0)
+    def test_role_claim_can_be_ignored(self):
+        with self.assertNumQueries(2):
+            self.client.get('/api/driver/pending-bookings/')
+
+    def test_row_is_loaded_when_a_view_needs_it(self):
+        response = self.client.post(f'/api/driver/assign-vehicle/{self.bus.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.bus.refresh_from_db()
+        self.assertEqual((self.bus.assigned_to_id, self.bus.assigned_driver_name), (self.driver.id, "Lazy Driver"))
+
+    def test_user_deleted_elsewhere(self):
+        User.objects.filter(id=self.driver.id).delete()
+        user_cache.reset()   # as if another worker had deleted it
+        # the role check still passes on the claims, loading the row does not
+        self.assertEqual(self.client.get('/api/driver/active-trip/').status_code, 200)
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 401)
+
+    @override_settings(AUTH_TRUST_ROLE_CLAIM=False)
+    def test_claim_is_not_trusted_unless_enabled(self):
+        User.objects.filter(id=self.driver.id).delete()
+        user_cache.reset()
+        self.assertEqual(self.client.get('/api/driver/active-trip/').status_code, 401)
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        metrics.reset()
+        self.driver = User.objects.create(
+            name="Token Driver", phone="9400000250", password=make_password("x"), role="driver"
+        )
+        self.token = create_access_token(self.driver)
+
+    def _get(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.client.get('/api/driver/pending-bookings/')
+
+    def test_repeat_token_is_verified_once(self):
+        for _ in range(3):
+            self.assertEqual(self._get(self.token).status_code, 200)
+        self.assertEqual(metrics.get('auth.token_cache.miss'), 1)
+        self.assertEqual(metrics.get('auth.token_cache.hit'), 2)
+        self.assertGreater(metrics.get('auth.token_cache.saved_us'), 0)
+        self.assertEqual(metrics.snapshot()['rates']['auth.token_cache.hit_rate'], 0.6667)
+
+    def test_tampered_token_is_not_served_from_cache(self):
+        self._get(self.token)
+        header, payload, signature = self.token.split('.')
+        forged = f"{header}.{payload}.{signature[:-2]}AA"
+        self.assertEqual(self._get(forged).status_code, 401)
+
+    def test_entry_expires_with_the_token(self):
+        token = AccessToken.for_user(self.driver)
+        token['user_id'] = str(self.driver.id)
+        token['role'] = 'driver'
+        token.set_exp(lifetime=timedelta(seconds=1))
+        self.assertEqual(self._get(str(token)).status_code, 200)
+        time.sleep(1.1)
+        self.assertEqual(self._get(str(token)).status_code, 401)
+
+    @override_settings(AUTH_TOKEN_CACHE_SIZE=2)
+    def test_size_bound(self):
+        for _ in range(3):   # every token gets its own jti
+            self._get(create_access_token(self.driver))
+        self.assertEqual(len(token_cache), 2)
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_ingestion_state()
+        metrics.reset()
+        hashing_pool.reset()
+        self.addCleanup(hashing_pool.reset)
+        self.user = User.objects.create(
+            name="Hash Student", phone="9400000260", password=make_password("secret123"),
+            registration_id="STUHASH01", role="student",
+        )
+
+    def _block_pool(self):
+        """Occupy every hashing slot until the returned event is set."""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        for _ in range(settings.AUTH_HASH_WORKERS + settings.AUTH_HASH_QUEUE_SIZE):
+            hashing_pool.submit(release.wait)
+        return release
+
+    def test_login_hashes_on_the_pool(self):
+        response = self.client.post('/api/auth/login/', {"phone": "9400000260", "password": "secret123"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.get('auth.hash.completed'), 1)
+        self.assertEqual(hashing_pool.pending(), 0)
+        response = self.client.post('/api/auth/login/', {"phone": "9400000260", "password": "wrong"})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(AUTH_HASH_WORKERS=1, AUTH_HASH_QUEUE_SIZE=1)
+    def test_full_pool_answers_503(self):
+        release = self._block_pool()
+        self.assertEqual(metrics.snapshot()['gauges']['auth.hash.queue_depth'], 1)
+        with self.assertRaises(HashingBusy):
+            hashing_pool.submit(time.sleep, 0)
+
+        response = self.client.post('/api/auth/login/', {"phone": "9400000260", "password": "secret123"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        response = self.client.post('/api/auth/signup/', {
+            "name": "Busy", "phone": "9400000261", "password": "secret123",
+            "registration_id": "STUHASH02", "role": "student",
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(phone="9400000261").exists())
+
+        # a wrong OTP is turned away before it can cost a hash
+        utils.send_otp_mock("9400000260", "123456")
+        rejected = metrics.get('auth.hash.rejected')
+        response = self.client.post('/api/auth/reset-password/', {
+            "phone": "9400000260", "otp": "000000", "new_password": "newpass123",
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(metrics.get('auth.hash.rejected'), rejected)
+
+        response = self.client.post('/api/auth/reset-password/', {
+            "phone": "9400000260", "otp": "123456", "new_password": "newpass123",
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(metrics.get('auth.hash.rejected'), rejected + 1)
+
+        release.set()
+        hashing_pool.reset()
+        utils.send_otp_mock("9400000260", "654321")
+        response = self.client.post('/api/auth/reset-password/', {
+            "phone": "9400000260", "otp": "654321", "new_password": "newpass123",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hashing_pool.pending(), 0)
+
+    @override_settings(AUTH_HASH_WORKERS=0)
+    def test_zero_workers_hash_inline(self):
+        response = self.client.post('/api/auth/login/', {"phone": "9400000260", "password": "secret123"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.get('auth.hash.completed'), 0)
+
+    async def test_async_signup_login_and_reset(self):
+        client = AsyncClient()
+        response = await client.post('/api/auth/async/signup/', {
+            "name": "Async Student", "phone": "9400000262", "password": "secret123",
+            "registration_id": "STUHASH03", "role": "student",
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['user']['phone'], "9400000262")
+
+        response = await client.post('/api/auth/async/login/', {
+            "phone": "9400000262", "password": "secret123",
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        token = AccessToken(response.json()['access_token'])
+        self.assertEqual(token['role'], 'student')
+
+        response = await client.post('/api/auth/async/login/', {
+            "phone": "9400000262", "password": "wrong",
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+        await sync_to_async(utils.send_otp_mock)("9400000262", "654321")
+        response = await client.post('/api/auth/async/reset-password/', {
+            "phone": "9400000262", "otp": "654321", "new_password": "newpass123",
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = await client.post('/api/auth/async/login/', {
+            "phone": "9400000262", "password": "newpass123",
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.get('auth.hash.completed'), 5)
+
+    async def test_async_rejects_bad_body(self):
+        response = await AsyncClient().post(
+            '/api/auth/async/login/', 'not json', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = await AsyncClient().post('/api/auth/async/login/', {
+            "password": "secret123",
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_event_loop_keeps_running_while_hashing(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.ensure_future(ticker())
+        response = await AsyncClient().post('/api/auth/async/login/', {
+            "phone": "9400000260", "password": "secret123",
+        }, content_type='application/json')
+        task.cancel()
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(ticks, 5)
+
+
+def _consume_otps(path, codes):
+    """Run in a child process: try every (phone, code); return the ones that verified."""
+    store = SQLiteOTPStore(path)
+    return [phone for phone, code in codes if store.consume(phone, code)]
+
+
+class OTPStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'otp.sqlite3')
+
+    def _stores(self):
+        return [InMemoryOTPStore(), SQLiteOTPStore(self.path)]
+
+    def test_incomplete_backend_fails_on_instantiation(self):
+        class PutOnlyStore(OTPStore):
+            def put(self, key, code, ttl=None):
+                pass
+
+        with self.assertRaises(TypeError):
+            PutOnlyStore()
+
+    def test_code_verifies_once(self):
+        for store in self._stores():
+            store.put("9400000270", "111111")
+            self.assertFalse(store.consume("9400000270", "222222"))
+            self.assertTrue(store.consume("9400000270", "111111"))
+            self.assertFalse(store.consume("9400000270", "111111"))
+
+    def test_new_code_replaces_old(self):
+        for store in self._stores():
+            store.put("9400000270", "111111")
+            store.put("9400000270", "333333")
+            self.assertFalse(store.consume("9400000270", "111111"))
+            self.assertTrue(store.consume("9400000270", "333333"))
+
+    def test_expired_code_is_refused_and_swept(self):
+        for store in self._stores():
+            store.put("9400000270", "111111", ttl=0.05)
+            store.put("9400000271", "111111", ttl=0.05)
+            store.put("9400000272", "111111")
+            time.sleep(0.1)
+            self.assertFalse(store.consume("9400000270", "111111"))
+
+            with override_settings(OTP_SWEEP_SECONDS=0):
+                store.put("9400000273", "111111")
+            self.assertEqual(len(store), 2)   # both expired codes gone, 9400000272/3 left
+
+    def test_shared_between_store_instances(self):
+        SQLiteOTPStore(self.path).put("9400000270", "111111")
+        self.assertTrue(SQLiteOTPStore(self.path).consume("9400000270", "111111"))
+
+    @override_settings(OTP_STORE_BACKEND='core.otp_store.SQLiteOTPStore')
+    def test_utils_use_configured_backend(self):
+        with override_settings(OTP_STORE_PATH=self.path):
+            otp_store.reset()
+            self.addCleanup(otp_store.reset)
+            with mock.patch('builtins.print'):
+                utils.send_otp_mock("9400000270", "111111")
+            self.assertIsInstance(otp_store.backend, SQLiteOTPStore)
+            self.assertTrue(SQLiteOTPStore(self.path).consume("9400000270", "111111"))
+            self.assertFalse(utils.verify_otp_mock("9400000270", "111111"))
+
+    @skipIf('fork' not in multiprocessing.get_all_start_methods(), "needs fork")
+    def test_each_code_verifies_once_across_processes(self):
+        store = SQLiteOTPStore(self.path)
+        codes = [(f"94000003{i:02d}", f"{100000 + i}") for i in range(50)]
+        for phone, code in codes:
+            store.put(phone, code)
+
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            results = pool.starmap(_consume_otps, [(self.path, codes)] * 4)
+
+        verified = [phone for result in results for phone in result]
+        self.assertEqual(sorted(verified), sorted(phone for phone, _ in codes))
+        self.assertEqual(len(store), 0)
+
+
 # Run with: python manage.py test core
\ No newline at end of file
@@ -0,0 +1,81 @@
+# core/token_cache.py
+"""
+Per-process LRU of verified access tokens.
+
+Clients send the same bearer token on every request for its whole
+lifetime, so ``UUIDJWTAuthentication`` keeps the validated token keyed by
+the SHA-256 of the raw token and skips the base64 / JSON / HMAC work on a
+repeat. An entry is never used past the token's own ``exp``, and at most
+``AUTH_TOKEN_CACHE_SIZE`` tokens are kept (``0`` turns the cache off).
+Tokens that fail verification are not cached.
+
+admin/metrics/ shows ``auth.token_cache.hit_rate`` and
+``auth.token_cache.saved_us``: hits times the mean measured verification
+time.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .metrics import metrics
+
+metrics.register_rate('auth.token_cache.hit_rate', 'auth.token_cache.hit', 'auth.token_cache.lookups')
+
+
+class VerifiedTokenCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()   # sha256(raw token) -> (validated token, exp)
+        self._verify_us = 0.0
+        self._verified = 0
+
+    def get_or_verify(self, raw_token, verify):
+        """The cached validated token for ``raw_token``, else ``verify(raw_token)``."""
+        size = settings.AUTH_TOKEN_CACHE_SIZE
+        if size <= 0:
+            return verify(raw_token)
+
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        digest = hashlib.sha256(raw_token).digest()
+        metrics.incr('auth.token_cache.lookups')
+        with self._lock:
+            entry = self._tokens.get(digest)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._tokens.move_to_end(digest)
+                    metrics.incr('auth.token_cache.hit')
+                    if self._verified:
+                        metrics.incr('auth.token_cache.saved_us', round(self._verify_us / self._verified))
+                    return entry[0]
+                del self._tokens[digest]
+
+        metrics.incr('auth.token_cache.miss')
+        start = time.perf_counter()
+        token = verify(raw_token)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+
+        exp = token.get('exp')
+        with self._lock:
+            self._verify_us += elapsed_us
+            self._verified += 1
+            if exp is not None:
+                self._tokens[digest] = (token, exp)
+                while len(self._tokens) > size:
+                    self._tokens.popitem(last=False)
+        return token
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def reset(self):
+        with self._lock:
+            self._tokens.clear()
+            self._verify_us = 0.0
+            self._verified = 0
+
+
+token_cache = VerifiedTokenCache()
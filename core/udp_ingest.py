@@ -0,0 +1,147 @@
+# core/udp_ingest.py
+"""
+UDP datagram ingestion for fire-and-forget trackers.
+
+Each datagram carries exactly one fix in a fixed 26 byte big-endian layout::
+
+    magic 0xA5 (1) | version 1 (1) | IMEI as BCD (8) | unix time (4, uint)
+    | lat * 1e7 (4, int) | lng * 1e7 (4, int) | speed km/h * 10 (2, uint)
+    | sequence (2, uint)
+
+Devices retransmit when they get no link-layer confirmation, so the
+(imei, timestamp, sequence) key of recent datagrams is remembered and
+repeats are dropped before they reach the pipeline. Accepted fixes are
+batched and queued on ``core.ingest_queue`` like the TCP listener's. Since
+a remembered key turns the device's retransmit into a duplicate, the queue's
+retries and dead letters are the only way back for a batch the DB rejected.
+"""
+import asyncio
+import logging
+import struct
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .batching import AsyncFixBatcher, enqueue_fix_batch
+from .ingestion import InvalidFix, parse_fix
+
+logger = logging.getLogger(__name__)
+
+DATAGRAM = struct.Struct('>BB8sIiiHH')
+MAGIC = 0xA5
+VERSION = 1
+COORD_SCALE = 10_000_000
+SPEED_SCALE = 10
+
+
+class MalformedDatagram(ValueError):
+    pass
+
+
+def encode_datagram(imei, lat, lng, speed, timestamp, seq=0):
+    return DATAGRAM.pack(
+        MAGIC, VERSION,
+        bytes.fromhex(str(imei).rjust(16, '0')),
+        int(timestamp.timestamp()),
+        round(lat * COORD_SCALE),
+        round(lng * COORD_SCALE),
+        max(0, round(speed * SPEED_SCALE)),
+        seq & 0xFFFF,
+    )
+
+
+def decode_datagram(data):
+    """Return ``(dedupe_key, raw_fix)`` for one datagram."""
+    if len(data) != DATAGRAM.size:
+        raise MalformedDatagram(f"Expected {DATAGRAM.size} bytes, got {len(data)}")
+    magic, version, imei_bcd, ts, lat_e7, lng_e7, speed, seq = DATAGRAM.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise MalformedDatagram("Unknown magic/version")
+
+    digits = imei_bcd.hex()
+    if not digits.isdigit():
+        raise MalformedDatagram("IMEI is not BCD")
+    imei = digits[1:] if digits.startswith('0') else digits
+
+    lat, lng = lat_e7 / COORD_SCALE, lng_e7 / COORD_SCALE
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise MalformedDatagram("Coordinates out of range")
+
+    raw_fix = {
+        'imei': imei,
+        'latitude': lat,
+        'longitude': lng,
+        'speed': speed / SPEED_SCALE,
+        'timestamp': datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+        'seq': seq,
+    }
+    return (imei, ts, seq), raw_fix
+
+
+class GPSUDPIngestor(asyncio.DatagramProtocol):
+    def __init__(self, sink=enqueue_fix_batch, batch_size=None, flush_interval=None,
+                 max_pending=None, dedupe_window=None):
+        self.batcher = AsyncFixBatcher(
+            sink,
+            batch_size or settings.GPS_SOCKET_BATCH_SIZE,
+            flush_interval or settings.GPS_SOCKET_FLUSH_INTERVAL,
+            thread_name="gps-udp-db",
+        )
+        self.max_pending = max_pending or settings.GPS_UDP_MAX_PENDING
+        self.dedupe_window = dedupe_window or settings.GPS_UDP_DEDUPE_WINDOW
+        self.stats = {
+            'received': 0,
+            'accepted': 0,
+            'duplicates': 0,
+            'malformed': 0,
+            'dropped': 0,
+        }
+        self._recent = OrderedDict()
+        self.transport = None
+
+    async def start(self, host, port):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: self, local_addr=(host, port)
+        )
+        self.batcher.start()
+        return self.transport
+
+    @property
+    def port(self):
+        return self.transport.get_extra_info('sockname')[1]
+
+    async def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        await self.batcher.close()
+
+    def datagram_received(self, data, addr):
+        self.stats['received'] += 1
+        try:
+            key, raw_fix = decode_datagram(data)
+            fix = parse_fix(raw_fix)
+        except (MalformedDatagram, InvalidFix):
+            self.stats['malformed'] += 1
+            return
+
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            self.stats['duplicates'] += 1
+            return
+
+        if len(self.batcher) >= self.max_pending:
+            # the DB thread is behind; shed load instead of growing without bound.
+            # Not remembered, so the device's retransmit still gets in.
+            self.stats['dropped'] += 1
+            return
+
+        self._recent[key] = None
+        if len(self._recent) > self.dedupe_window:
+            self._recent.popitem(last=False)
+        self.stats['accepted'] += 1
+        self.batcher.add(fix)
+
+    def error_received(self, exc):
+        logger.warning("UDP ingestion socket error: %s", exc)
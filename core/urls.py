@@ -6,12 +6,20 @@ from .views import (
     MeView,
     ForgotPasswordView,
     ResetPasswordView,
+    AsyncSignupView,
+    AsyncLoginView,
+    AsyncResetPasswordView,
 
     # Public / Student
     BookAmbulanceView,
     ActiveBusesView,
+    BusPositionStreamView,
     BusETAView,
+    BusETAListView,
     AvailableAmbulancesView,
+    NearbyVehiclesView,
+    BusStopListView,
+    StopArrivalsView,
     MyBookingsView,
     CheckUserView,
 
@@ -32,6 +40,7 @@ from .views import (
 
     # Admin
     AdminStatsView,
+    MetricsView,
     AddVehicleView,
     VehicleListView,
     DeleteVehicleView,
@@ -46,10 +55,21 @@ from .views import (
     RFIDDeviceListView,
     DeleteRFIDDeviceView,
     TripListView,
+    TripTrackView,
     BookingListView,
+    AddBusStopView,
+    AddBusRouteView,
+    BusRouteListView,
+    DeleteBusRouteView,
+    SetVehicleRouteView,
+    AddGeofenceView,
+    GeofenceListView,
+    GeofenceDetailView,
+    GeofenceEventListView,
 
     # GPS & RFID
     ReceiveGPSView,
+    ReceiveGPSBatchView,
     ReceiveRFIDScanView,
 )
 
@@ -60,6 +80,9 @@ urlpatterns = [
     path('auth/me/', MeView.as_view(), name='me'),
     path('auth/forgot-password/', ForgotPasswordView.as_view(), name='forgot-password'),
     path('auth/reset-password/', ResetPasswordView.as_view(), name='reset-password'),
+    path('auth/async/signup/', AsyncSignupView.as_view(), name='async-signup'),
+    path('auth/async/login/', AsyncLoginView.as_view(), name='async-login'),
+    path('auth/async/reset-password/', AsyncResetPasswordView.as_view(), name='async-reset-password'),
 
     # Public / Student
     path('public/ambulance/book/', BookAmbulanceView.as_view(), name='book-ambulance'),
@@ -81,9 +104,11 @@ urlpatterns = [
 
     # Admin routes
     path('admin/stats/', AdminStatsView.as_view(), name='admin-stats'),
+    path('admin/metrics/', MetricsView.as_view(), name='admin-metrics'),
     path('admin/vehicles/', AddVehicleView.as_view(), name='add-vehicle'),
     path('admin/vehicles/list/', VehicleListView.as_view(), name='vehicle-list'),
     path('admin/vehicles/<uuid:vehicle_id>/', DeleteVehicleView.as_view(), name='delete-vehicle'),
+    path('admin/vehicles/<uuid:vehicle_id>/route/', SetVehicleRouteView.as_view(), name='set-vehicle-route'),
     
     path('admin/students/', StudentListView.as_view(), name='student-list'),
     path('admin/students/<uuid:student_id>/', DeleteStudentView.as_view(), name='delete-student'),
@@ -100,16 +125,34 @@ urlpatterns = [
     path('admin/rfid-devices/<uuid:device_id>/', DeleteRFIDDeviceView.as_view(), name='delete-rfid-device'),
     
     path('admin/trips/', TripListView.as_view(), name='trip-list'),
+    path('admin/trips/<uuid:trip_id>/track/', TripTrackView.as_view(), name='trip-track'),
     path('admin/bookings/', BookingListView.as_view(), name='booking-list'),
 
+    path('admin/stops/', AddBusStopView.as_view(), name='add-bus-stop'),
+    path('admin/routes/', AddBusRouteView.as_view(), name='add-bus-route'),
+    path('admin/routes/list/', BusRouteListView.as_view(), name='bus-route-list'),
+    path('admin/routes/<uuid:route_id>/', DeleteBusRouteView.as_view(), name='delete-bus-route'),
+
+    path('admin/geofences/', AddGeofenceView.as_view(), name='add-geofence'),
+    path('admin/geofences/list/', GeofenceListView.as_view(), name='geofence-list'),
+    path('admin/geofences/events/', GeofenceEventListView.as_view(), name='geofence-events'),
+    path('admin/geofences/<uuid:geofence_id>/', GeofenceDetailView.as_view(), name='geofence-detail'),
+
     # Public
     path('public/buses/', ActiveBusesView.as_view(), name='active-buses'),
+    path('public/buses/stream/', BusPositionStreamView.as_view(), name='bus-position-stream'),
     path('public/bus/<uuid:bus_id>/eta/', BusETAView.as_view(), name='bus-eta'),
+    path('public/buses/eta/', BusETAListView.as_view(), name='buses-eta'),
     path('public/ambulances/', AvailableAmbulancesView.as_view(), name='available-ambulances'),
+    path('public/vehicles/nearest/', NearbyVehiclesView.as_view(mode='nearest'), name='nearest-vehicles'),
+    path('public/vehicles/nearby/', NearbyVehiclesView.as_view(mode='radius'), name='nearby-vehicles'),
+    path('public/stops/', BusStopListView.as_view(), name='bus-stops'),
+    path('public/stops/<uuid:stop_id>/arrivals/', StopArrivalsView.as_view(), name='stop-arrivals'),
     path('public/my-bookings/', MyBookingsView.as_view(), name='my-bookings'),
     path('public/check-user/', CheckUserView.as_view(), name='check-user'),
 
     # GPS & RFID (from devices)
     path('gps/receive/', ReceiveGPSView.as_view(), name='receive-gps'),
+    path('gps/receive/batch/', ReceiveGPSBatchView.as_view(), name='receive-gps-batch'),
     path('rfid/scan/', ReceiveRFIDScanView.as_view(), name='receive-rfid'),
 ]
\ No newline at end of file
@@ -0,0 +1,106 @@
+# core/user_cache.py
+"""
+Per-process LRU/TTL cache of authenticated users, keyed by user id.
+
+``UUIDJWTAuthentication`` resolves ``request.user`` through this cache
+instead of querying ``User`` on every request. Entries are dropped by the
+``post_save`` / ``post_delete`` signals below (role change, deactivation,
+deletion) and otherwise expire after ``AUTH_USER_CACHE_TTL`` seconds, which
+also bounds how long a change made through another worker can go unseen.
+At most ``AUTH_USER_CACHE_SIZE`` users are kept. ``AUTH_USER_CACHE_TTL = 0``
+turns the cache off.
+
+The same signals record when each user last changed, so a token issued
+before that is no longer trusted for its ``role`` claim (see
+``core.authentication.LazyUser``). Like the cache, this only sees changes
+made in this process.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .metrics import metrics
+from .models import User
+
+metrics.register_rate('auth.user_cache.hit_rate', 'auth.user_cache.hit', 'auth.user_cache.lookups')
+
+
+class UserCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()   # user id (str) -> (User, expires at)
+        self._invalidations = 0
+        self._changed = {}            # user id (str) -> wall time of its last change
+
+    def get(self, user_id):
+        """A private copy of the cached user, or None."""
+        key = str(user_id)
+        metrics.incr('auth.user_cache.lookups')
+        with self._lock:
+            entry = self._users.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._users.move_to_end(key)
+                    metrics.incr('auth.user_cache.hit')
+                    # views may change request.user; never hand out the shared instance
+                    return copy.copy(entry[0])
+                del self._users[key]
+        metrics.incr('auth.user_cache.miss')
+        return None
+
+    def generation(self):
+        """Take before loading a user; pass to ``put`` so a racing invalidation wins."""
+        return self._invalidations
+
+    def put(self, user, generation=None):
+        ttl = settings.AUTH_USER_CACHE_TTL
+        if ttl <= 0:
+            return
+        key = str(user.pk)
+        with self._lock:
+            if generation is not None and generation != self._invalidations:
+                return   # a user changed while this one was being loaded
+            self._users[key] = (copy.copy(user), time.monotonic() + ttl)
+            self._users.move_to_end(key)
+            while len(self._users) > settings.AUTH_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id, changed=True):
+        key = str(user_id)
+        now = time.time()
+        with self._lock:
+            self._invalidations += 1
+            self._users.pop(key, None)
+            if changed:
+                # older markers can only match tokens that have expired anyway
+                lifetime = settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds()
+                self._changed = {k: t for k, t in self._changed.items() if now - t < lifetime}
+                self._changed[key] = now
+
+    def changed_since(self, user_id, issued_at):
+        """Whether the user was saved/deleted at or after ``issued_at`` (token ``iat``)."""
+        changed_at = self._changed.get(str(user_id))
+        return changed_at is not None and (issued_at is None or issued_at <= changed_at)
+
+    def __len__(self):
+        return len(self._users)
+
+    def reset(self):
+        with self._lock:
+            self._users.clear()
+            self._changed.clear()
+
+
+user_cache = UserCache()
+
+
+@receiver(post_save, sender=User, dispatch_uid='user_cache_saved')
+@receiver(post_delete, sender=User, dispatch_uid='user_cache_deleted')
+def _drop_cached_user(sender, instance, created=False, **kwargs):
+    # a brand new user has no older tokens to distrust
+    user_cache.invalidate(instance.pk, changed=not created)
@@ -1,31 +1,28 @@
 # core/utils.py
 import random
 import math
-from datetime import datetime, timezone, timedelta
 from rest_framework_simplejwt.tokens import AccessToken
 from .models import User
+from .otp_store import otp_store
+
+try:
+    import numpy as np
+except ImportError:  # optional; the batched helpers below fall back to plain Python
+    np = None
+
+EARTH_RADIUS_KM = 6371
 
 def generate_otp(length=6):
     return str(random.randint(10**(length-1), 10**length - 1))
 
-# In-memory OTP store (use Redis in production)
-otp_storage = {}
-
+# OTPs live in OTP_STORE_BACKEND (core/otp_store.py), shared across workers when SQLite-backed
 def send_otp_mock(phone: str, otp: str):
-    otp_storage[phone] = {
-        'otp': otp,
-        'expires': datetime.now(timezone.utc) + timedelta(minutes=10)
-    }
+    otp_store.put(phone, otp)
     print(f"[MOCK OTP] Sent {otp} to {phone}")  # replace with real SMS later
     return True
 
 def verify_otp_mock(phone: str, otp: str) -> bool:
-    if phone in otp_storage:
-        stored = otp_storage[phone]
-        if stored['otp'] == otp and stored['expires'] > datetime.now(timezone.utc):
-            del otp_storage[phone]
-            return True
-    return False
+    return otp_store.consume(phone, otp)
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     R = 6371  # Earth radius in km
@@ -40,6 +37,51 @@ def calculate_eta(distance_km: float, speed_kmh: float) -> float:
         return 0
     return (distance_km / speed_kmh) * 60
 
+# ── Batched versions (NumPy when installed) ─────────────
+# Same haversine as calculate_distance, over arrays of coordinates. With
+# NumPy they return float64 arrays, otherwise lists; either way index or
+# iterate them, don't rely on the type.
+
+def _haversine(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def calculate_distances(lat: float, lng: float, lats, lngs):
+    """One-to-many: km from (lat, lng) to every (lats[i], lngs[i])."""
+    if np is None:
+        return [calculate_distance(lat, lng, la, ln) for la, ln in zip(lats, lngs)]
+    return _haversine(lat, lng, np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float))
+
+def distance_matrix(lats1, lngs1, lats2, lngs2):
+    """Many-to-many: ``result[i][j]`` is km from point i of set 1 to point j of set 2."""
+    if np is None:
+        return [calculate_distances(la, ln, lats2, lngs2) for la, ln in zip(lats1, lngs1)]
+    lats1 = np.asarray(lats1, dtype=float)[:, None]
+    lngs1 = np.asarray(lngs1, dtype=float)[:, None]
+    return _haversine(lats1, lngs1, np.asarray(lats2, dtype=float), np.asarray(lngs2, dtype=float))
+
+def path_length(lats, lngs) -> float:
+    """Total km along a track of consecutive points."""
+    if len(lats) < 2:
+        return 0.0
+    if np is None:
+        return sum(
+            calculate_distance(lats[i - 1], lngs[i - 1], lats[i], lngs[i])
+            for i in range(1, len(lats))
+        )
+    lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+    return float(_haversine(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).sum())
+
+def calculate_etas(distances_km, speed_kmh: float):
+    """Minutes for each distance at a constant speed (0 if the speed is not positive)."""
+    if np is None:
+        return [calculate_eta(d, speed_kmh) for d in distances_km]
+    distances_km = np.asarray(distances_km, dtype=float)
+    if speed_kmh <= 0:
+        return np.zeros_like(distances_km)
+    return distances_km / speed_kmh * 60
+
 # Custom JWT creation (if you want to match exactly the old format)
 def create_access_token(user: User):
     token = AccessToken.for_user(user)
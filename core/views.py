@@ -2,12 +2,26 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.contrib.auth.hashers import check_password, make_password
-from django.db.models import Q 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q 
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import classonlymethod
 from django.utils import timezone
+from django.utils.http import parse_etags
+from django.views import View
+import asyncio
+import json
 import logging
+import math
+import time
 
-from .models import User, Vehicle, Booking, Offence, RFIDDevice, Trip
+from asgiref.sync import sync_to_async
+
+from .models import (
+    User, Vehicle, Booking, Offence, RFIDDevice, Trip, PositionFix, BusStop, BusRoute,
+    Geofence, GeofenceEvent,
+)
 from .serializers import (
     UserCreateSerializer, UserLoginSerializer, UserSerializer,
     TokenResponseSerializer, BookingCreateSerializer, BookingSerializer,
@@ -15,24 +29,48 @@ from .serializers import (
     TripSerializer,
     OffenceSerializer,
     RFIDDeviceSerializer,
+    BusStopSerializer, BusRouteSerializer, BusRouteCreateSerializer,
+    GeofenceSerializer, GeofenceEventSerializer,
 )
 from .utils import (
     create_access_token, send_otp_mock, verify_otp_mock, generate_otp,
-    calculate_distance, calculate_eta
+    calculate_distance, path_length, calculate_distances
 )
 from .permissions import IsAdmin, IsDriver
+from .ingestion import InvalidFix, parse_fix, apply_fixes, parse_rfid_scan, apply_rfid_scans
+from .ingest_queue import GPS, RFID, QueueFull, ingest_queue
+from .arrivals import arrival_predictor
+from .geofences import geofences
+from .history import history_buffer
+from .hashing import HashingBusy, ahash_password, averify_password, hash_password, verify_password
+from .live_state import live_store
+from .metrics import metrics
+from .pubsub import BUS_POSITIONS, hub
+from .snapshots import ambulance_snapshot, bus_snapshot, vehicle_changed
+from .roads import eta_engine
+from .spatial import spatial_index
+from .watermarks import watermarks
 from rest_framework_simplejwt.tokens import RefreshToken
 
 logger = logging.getLogger(__name__)
 
 
+def _hashing_busy(response_class):
+    response = response_class({"detail": "Server busy, retry shortly"}, status=503)
+    response['Retry-After'] = str(settings.AUTH_HASH_RETRY_AFTER)
+    return response
+
+
 class SignupView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
         serializer = UserCreateSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            try:
+                user = serializer.save()
+            except HashingBusy:
+                return _hashing_busy(Response)
             token = create_access_token(user)
             user_data = UserSerializer(user).data
             return Response({
@@ -65,8 +103,11 @@ class LoginView(APIView):
         except User.DoesNotExist:
             return Response({"detail": "Invalid credentials"}, status=401)
 
-        if not check_password(password, user.password):
-            return Response({"detail": "Invalid credentials"}, status=401)
+        try:
+            if not verify_password(password, user.password):
+                return Response({"detail": "Invalid credentials"}, status=401)
+        except HashingBusy:
+            return _hashing_busy(Response)
 
         token = create_access_token(user)
         user_data = UserSerializer(user).data
@@ -120,16 +161,129 @@ class ResetPasswordView(APIView):
         if not all([phone, otp, new_password]):
             return Response({"detail": "All fields required"}, status=400)
 
+        # OTP first, so requests with a wrong one never cost a hash
         if not verify_otp_mock(phone, otp):
             return Response({"detail": "Invalid or expired OTP"}, status=400)
 
         try:
             user = User.objects.get(phone=phone)
-            user.password = make_password(new_password)
+            user.password = hash_password(new_password)
             user.save()
             return Response({"message": "Password reset successfully"})
         except User.DoesNotExist:
             return Response({"detail": "User not found"}, status=404)
+        except HashingBusy:
+            return _hashing_busy(Response)
+
+
+# ────────────────────────────────────────────────
+# Async auth (ASGI) - same contract as the views above
+# ────────────────────────────────────────────────
+# Password hashing is awaited on core/hashing.py's pool and the ORM is
+# reached through its async API, so the event loop keeps serving other
+# requests (bus stream, ingestion) while a hash runs.
+
+class AsyncAuthView(View):
+    """JSON in / JSON out, no session or CSRF - like the DRF auth views."""
+    http_method_names = ['post', 'options']
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    @staticmethod
+    def json_body(request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    @staticmethod
+    def bad_body():
+        return JsonResponse({"detail": "Expected a JSON object"}, status=400)
+
+    @staticmethod
+    def token_response(user, status_code=200):
+        return JsonResponse({
+            "access_token": create_access_token(user),
+            "token_type": "bearer",
+            "user": UserSerializer(user).data
+        }, status=status_code)
+
+
+class AsyncSignupView(AsyncAuthView):
+    async def post(self, request):
+        data = self.json_body(request)
+        if data is None:
+            return self.bad_body()
+
+        serializer = UserCreateSerializer(data=data)
+        # unique phone / email / registration_id checks query the DB
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=400)
+        try:
+            password_hash = await ahash_password(serializer.validated_data['password'])
+        except HashingBusy:
+            return _hashing_busy(JsonResponse)
+
+        user = await sync_to_async(serializer.save)(password_hash=password_hash)
+        return self.token_response(user, status_code=201)
+
+
+class AsyncLoginView(AsyncAuthView):
+    async def post(self, request):
+        data = self.json_body(request)
+        if data is None:
+            return self.bad_body()
+
+        serializer = UserLoginSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        phone = serializer.validated_data.get('phone')
+        email = serializer.validated_data.get('email')
+        lookup = {'phone': phone} if phone else {'email': email}
+        user = await User.objects.filter(**lookup).afirst()
+        if user is None:
+            return JsonResponse({"detail": "Invalid credentials"}, status=401)
+
+        try:
+            if not await averify_password(serializer.validated_data['password'], user.password):
+                return JsonResponse({"detail": "Invalid credentials"}, status=401)
+        except HashingBusy:
+            return _hashing_busy(JsonResponse)
+
+        return self.token_response(user)
+
+
+class AsyncResetPasswordView(AsyncAuthView):
+    async def post(self, request):
+        data = self.json_body(request)
+        if data is None:
+            return self.bad_body()
+
+        phone = data.get('phone')
+        otp = data.get('otp')
+        new_password = data.get('new_password')
+
+        if not all([phone, otp, new_password]):
+            return JsonResponse({"detail": "All fields required"}, status=400)
+
+        if not await sync_to_async(verify_otp_mock)(phone, otp):
+            return JsonResponse({"detail": "Invalid or expired OTP"}, status=400)
+
+        user = await User.objects.filter(phone=phone).afirst()
+        if user is None:
+            return JsonResponse({"detail": "User not found"}, status=404)
+        try:
+            user.password = await ahash_password(new_password)
+        except HashingBusy:
+            return _hashing_busy(JsonResponse)
+        await user.asave()
+        return JsonResponse({"message": "Password reset successfully"})
 
 
 # ────────────────────────────────────────────────
@@ -202,7 +356,8 @@ class AssignVehicleView(APIView):
 
         vehicle.assigned_to = request.user
         vehicle.assigned_driver_name = request.user.name
-        vehicle.save()
+        vehicle.save(update_fields=['assigned_to', 'assigned_driver_name'])
+        vehicle_changed(vehicle)
 
         return Response({"message": "Vehicle assigned successfully"})
 
@@ -221,7 +376,8 @@ class ReleaseVehicleView(APIView):
 
         vehicle.assigned_to = None
         vehicle.assigned_driver_name = None
-        vehicle.save()
+        vehicle.save(update_fields=['assigned_to', 'assigned_driver_name'])
+        vehicle_changed(vehicle)
 
         return Response({"message": "Vehicle released successfully"})
 
@@ -252,6 +408,12 @@ class StartTripView(APIView):
             is_active=True
         )
 
+        # A bus on an active trip is back in station
+        if vehicle.is_out_of_station:
+            vehicle.is_out_of_station = False
+            vehicle.save(update_fields=['is_out_of_station'])
+        vehicle_changed(vehicle)
+
         return Response(TripSerializer(trip).data, status=201)
 
 
@@ -269,8 +431,12 @@ class EndTripView(APIView):
         trip.save()
 
         # Optional: clear current location
+        live_store.discard(trip.vehicle_id)
+        spatial_index.remove(trip.vehicle_id)
+        arrival_predictor.remove(trip.vehicle_id)
         trip.vehicle.current_location = {}
-        trip.vehicle.save()
+        trip.vehicle.save(update_fields=['current_location'])
+        vehicle_changed(trip.vehicle)
 
         return Response({"message": "Trip ended successfully"})
 
@@ -289,7 +455,8 @@ class MarkOutOfStationView(APIView):
             return Response({"detail": "Vehicle not found or not yours"}, status=404)
 
         vehicle.is_out_of_station = bool(is_out)
-        vehicle.save()
+        vehicle.save(update_fields=['is_out_of_station'])
+        vehicle_changed(vehicle)
 
         status_str = "out of" if is_out else "in"
         return Response({"message": f"Vehicle marked as {status_str} station"})
@@ -313,27 +480,37 @@ class AcceptBookingView(APIView):
         except Booking.DoesNotExist:
             return Response({"detail": "Booking not found or not pending"}, status=404)
 
-        # Get driver's ambulance
-        ambulance = Vehicle.objects.filter(
+        # Get driver's ambulance (the nearest one if they have several)
+        ambulances = list(Vehicle.objects.filter(
             assigned_to=request.user,
             vehicle_type='ambulance'
-        ).first()
+        ).order_by('pk'))
 
-        if not ambulance:
+        if not ambulances:
             return Response({"detail": "No ambulance assigned to you"}, status=400)
 
+        ambulance = ambulances[0]
+        point = _point(booking.user_location)
+        if len(ambulances) > 1 and point:
+            spatial_index.ensure_seeded()
+            by_id = {str(a.id): a for a in ambulances}
+            nearest = spatial_index.nearest(*point, k=1, include=set(by_id))
+            if nearest:
+                ambulance = by_id[nearest[0]['vehicle_id']]
+
         otp = generate_otp()
         send_otp_mock(booking.phone, otp)
 
         eta = None
-        if ambulance.current_location and booking.user_location:
-            loc_v = ambulance.current_location
+        ambulance_location = live_store.location_for(ambulance)
+        if ambulance_location and booking.user_location:
+            loc_v = ambulance_location
             loc_u = booking.user_location
-            dist = calculate_distance(
+            eta = eta_engine.estimate(
                 loc_v.get('lat', 0), loc_v.get('lng', 0),
-                loc_u.get('lat', 0), loc_u.get('lng', 0)
+                loc_u.get('lat', 0), loc_u.get('lng', 0),
+                60  # ambulance speed
             )
-            eta = calculate_eta(dist, 60)  # ambulance speed
 
         booking.status = 'accepted'
         booking.driver = request.user
@@ -402,7 +579,7 @@ class MyTripsView(APIView):
     permission_classes = [IsDriver]
 
     def get(self, request):
-        trips = Trip.objects.filter(driver=request.user).order_by('-start_time')
+        trips = Trip.objects.filter(driver_id=request.user.id).select_related('vehicle', 'driver').order_by('-start_time')
         serializer = TripSerializer(trips, many=True)
         return Response({"trips": serializer.data})
 
@@ -411,7 +588,8 @@ class ActiveTripView(APIView):
     permission_classes = [IsDriver]
 
     def get(self, request):
-        trip = Trip.objects.filter(driver=request.user, is_active=True).first()
+        # driver_id: filtering on the instance would load the whole user
+        trip = Trip.objects.filter(driver_id=request.user.id, is_active=True).select_related('vehicle', 'driver').first()
         if trip:
             return Response({"trip": TripSerializer(trip).data})
         return Response({"trip": None})
@@ -445,6 +623,14 @@ class AdminStatsView(APIView):
         })
 
 
+class MetricsView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        # counters are per worker process
+        return Response(metrics.snapshot())
+
+
 class AddVehicleView(APIView):
     permission_classes = [IsAdmin]
 
@@ -452,6 +638,7 @@ class AddVehicleView(APIView):
         serializer = VehicleCreateSerializer(data=request.data)
         if serializer.is_valid():
             vehicle = serializer.save()
+            vehicle_changed(vehicle)
             return Response(VehicleSerializer(vehicle).data, status=201)
         return Response(serializer.errors, status=400)
 
@@ -482,6 +669,11 @@ class DeleteVehicleView(APIView):
     def delete(self, request, vehicle_id):
         try:
             vehicle = Vehicle.objects.get(id=vehicle_id)
+            vehicle_changed(vehicle)
+            spatial_index.remove(vehicle.id)
+            arrival_predictor.remove(vehicle.id)
+            geofences.forget(vehicle.id)
+            history_buffer.discard_vehicle(vehicle.id)
             vehicle.delete()
             return Response({"message": "Vehicle deleted"})
         except Vehicle.DoesNotExist:
@@ -540,9 +732,9 @@ class DeleteDriverView(APIView):
 
     def delete(self, request, driver_id):
         # Release vehicles first
-        Vehicle.objects.filter(assigned_to__id=driver_id).update(
-            assigned_to=None, assigned_driver_name=None
-        )
+        vehicles = Vehicle.objects.filter(assigned_to__id=driver_id)
+        vehicle_changed(*vehicles.only('id', 'vehicle_type'))
+        vehicles.update(assigned_to=None, assigned_driver_name=None)
 
         deleted = User.objects.filter(id=driver_id, role='driver').delete()
         if deleted[0] == 0:
@@ -642,6 +834,35 @@ class TripListView(APIView):
         return Response({"trips": serializer.data})
 
 
+class TripTrackView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request, trip_id):
+        try:
+            trip = Trip.objects.get(id=trip_id)
+        except Trip.DoesNotExist:
+            return Response({"detail": "Trip not found"}, status=404)
+
+        fixes = PositionFix.objects.filter(trip=trip).order_by('timestamp')
+        points = [
+            {
+                "lat": fix.lat,
+                "lng": fix.lng,
+                "speed": fix.speed,
+                "timestamp": fix.timestamp,
+            }
+            for fix in fixes.iterator()
+        ]
+        distance = path_length([p["lat"] for p in points], [p["lng"] for p in points])
+
+        return Response({
+            "trip_id": str(trip.id),
+            "vehicle_number": trip.vehicle_number,
+            "distance_km": round(distance, 3),
+            "points": points,
+        })
+
+
 class BookingListView(APIView):
     permission_classes = [IsAdmin]
 
@@ -652,47 +873,303 @@ class BookingListView(APIView):
             queryset = queryset.filter(status=status_filter)
         serializer = BookingSerializer(queryset, many=True)
         return Response({"bookings": serializer.data})
+
+
+class AddBusStopView(APIView):
+    permission_classes = [IsAdmin]
+
+    def post(self, request):
+        serializer = BusStopSerializer(data=request.data)
+        if serializer.is_valid():
+            stop = serializer.save()
+            return Response(BusStopSerializer(stop).data, status=201)
+        return Response(serializer.errors, status=400)
+
+
+class AddBusRouteView(APIView):
+    permission_classes = [IsAdmin]
+
+    def post(self, request):
+        serializer = BusRouteCreateSerializer(data=request.data)
+        if serializer.is_valid():
+            with transaction.atomic():
+                route = serializer.save()
+            return Response(BusRouteSerializer(route).data, status=201)
+        return Response(serializer.errors, status=400)
+
+
+class BusRouteListView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        routes = BusRoute.objects.prefetch_related('route_stops__stop').order_by('name')
+        return Response({"routes": BusRouteSerializer(routes, many=True).data})
+
+
+class DeleteBusRouteView(APIView):
+    permission_classes = [IsAdmin]
+
+    def delete(self, request, route_id):
+        bus_ids = list(Vehicle.objects.filter(route_id=route_id).values_list('id', flat=True))
+        deleted = BusRoute.objects.filter(id=route_id).delete()
+        if deleted[0] == 0:
+            return Response({"detail": "Route not found"}, status=404)
+        arrival_predictor.route_changed(route_id)
+        for bus_id in bus_ids:
+            arrival_predictor.remove(bus_id)
+        return Response({"message": "Route deleted"})
+
+
+class SetVehicleRouteView(APIView):
+    permission_classes = [IsAdmin]
+
+    def post(self, request, vehicle_id):
+        route_id = request.data.get('route_id')
+        try:
+            vehicle = Vehicle.objects.get(id=vehicle_id, vehicle_type='bus')
+        except Vehicle.DoesNotExist:
+            return Response({"detail": "Bus not found"}, status=404)
+        if route_id and not BusRoute.objects.filter(id=route_id).exists():
+            return Response({"detail": "Route not found"}, status=404)
+
+        vehicle.route_id = route_id or None
+        vehicle.save(update_fields=['route'])
+        # predictions restart from the next fix on the new route
+        arrival_predictor.remove(vehicle.id)
+        return Response(VehicleSerializer(vehicle).data)
+
+
+class AddGeofenceView(APIView):
+    permission_classes = [IsAdmin]
+
+    def post(self, request):
+        serializer = GeofenceSerializer(data=request.data)
+        if serializer.is_valid():
+            zone = serializer.save()
+            geofences.reload()
+            return Response(GeofenceSerializer(zone).data, status=201)
+        return Response(serializer.errors, status=400)
+
+
+class GeofenceListView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        zones = Geofence.objects.all().order_by('-priority', 'name')
+        return Response({"geofences": GeofenceSerializer(zones, many=True).data})
+
+
+class GeofenceDetailView(APIView):
+    permission_classes = [IsAdmin]
+
+    def patch(self, request, geofence_id):
+        try:
+            zone = Geofence.objects.get(id=geofence_id)
+        except Geofence.DoesNotExist:
+            return Response({"detail": "Geofence not found"}, status=404)
+        serializer = GeofenceSerializer(zone, data=request.data, partial=True)
+        if serializer.is_valid():
+            zone = serializer.save()
+            geofences.reload()
+            return Response(GeofenceSerializer(zone).data)
+        return Response(serializer.errors, status=400)
+
+    def delete(self, request, geofence_id):
+        deleted = Geofence.objects.filter(id=geofence_id).delete()
+        if deleted[0] == 0:
+            return Response({"detail": "Geofence not found"}, status=404)
+        geofences.reload()
+        return Response({"message": "Geofence deleted"})
+
+
+class GeofenceEventListView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        vehicle_id = request.query_params.get('vehicle_id')
+        geofence_id = request.query_params.get('geofence_id')
+
+        queryset = GeofenceEvent.objects.all().order_by('-timestamp')
+        if vehicle_id:
+            queryset = queryset.filter(vehicle_id=vehicle_id)
+        if geofence_id:
+            queryset = queryset.filter(geofence_id=geofence_id)
+
+        serializer = GeofenceEventSerializer(queryset[:500], many=True)
+        return Response({"events": serializer.data})
     
 
 # ────────────────────────────────────────────────
 # Public / Misc Endpoints
 # ────────────────────────────────────────────────
 
+class SnapshotResponse(HttpResponse):
+    """Pre-encoded JSON body; keeps ``.data`` around like a DRF Response."""
+
+    def __init__(self, snapshot, **kwargs):
+        super().__init__(snapshot.body, content_type='application/json', **kwargs)
+        self.data = snapshot.data
+        self['ETag'] = snapshot.etag
+        self['Cache-Control'] = 'no-cache'
+
+
+def snapshot_response(request, cache, build, collection, key):
+    """
+    Serve a ``SnapshotCache``: 304 for a matching ``If-None-Match``, only the
+    changed/removed items for ``?since=<version>``, otherwise the full bytes.
+    """
+    snapshot = cache.get(build)
+    since = request.query_params.get('since')
+    if since:
+        changed = cache.changed_since(since, until=snapshot.version)
+        if changed is not None:
+            items = [item for item in snapshot.data[collection] if str(item[key]) in changed]
+            present = {str(item[key]) for item in items}
+            return Response({
+                "version": snapshot.data["version"],
+                "delta": True,
+                collection: items,
+                "removed": sorted(changed - present),
+            })
+        # too far behind (or another worker's token): fall through to a full resync
+
+    if snapshot.etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = snapshot.etag
+        return response
+    return SnapshotResponse(snapshot)
+
+
 class ActiveBusesView(APIView):
     permission_classes = [AllowAny]
+    # public and identical for everyone; skip JWT lookups entirely
+    authentication_classes = []
 
     def get(self, request):
-        # Use vehicle_type from Trip (denormalized field) to avoid JOIN
-        active_trips = Trip.objects.filter(is_active=True, vehicle_type="bus")
-
-        if active_trips.exists():
-            buses = []
-            for trip in active_trips:
-                vehicle = trip.vehicle
-                # Reset out-of-station flag if active trip exists
-                if vehicle.is_out_of_station:
-                    vehicle.is_out_of_station = False
-                    vehicle.save()
-                buses.append({
-                    "trip_id": str(trip.id),
-                    "vehicle_id": str(vehicle.id),
-                    "vehicle_number": vehicle.vehicle_number,
-                    "driver_name": trip.driver_name,
-                    "location": vehicle.current_location,
-                    "is_out_of_station": False
-                })
-            return Response({"buses": buses, "all_out_of_station": False})
+        return snapshot_response(request, bus_snapshot, self.build, "buses", "vehicle_id")
+
+    @staticmethod
+    def build():
+        # One joined, projected query however many buses are running; the
+        # out-of-station flag is cleared by StartTripView, not here
+        active_trips = Trip.objects.filter(is_active=True, vehicle_type="bus").values_list(
+            'id', 'vehicle_id', 'vehicle__vehicle_number', 'driver_name',
+            'vehicle__current_location', 'vehicle__last_fix_at',
+        )
+
+        buses = []
+        for trip_id, vehicle_id, vehicle_number, driver_name, persisted_location, persisted_at in active_trips:
+            buses.append({
+                "trip_id": str(trip_id),
+                "vehicle_id": str(vehicle_id),
+                "vehicle_number": vehicle_number,
+                "driver_name": driver_name,
+                "location": live_store.newest(vehicle_id, persisted_location, persisted_at),
+                "is_out_of_station": False
+            })
+        if buses:
+            return {"buses": buses, "all_out_of_station": False}
 
         # No active trips → check all buses
-        all_buses = Vehicle.objects.filter(vehicle_type="bus")
-        if not all_buses.exists():
-            return Response({"message": "No buses registered", "buses": [], "all_out_of_station": False})
+        counts = Vehicle.objects.filter(vehicle_type="bus").aggregate(
+            total=Count('id'),
+            out_of_station=Count('id', filter=Q(is_out_of_station=True)),
+        )
+        if not counts['total']:
+            return {"message": "No buses registered", "buses": [], "all_out_of_station": False}
+
+        if counts['out_of_station'] == counts['total']:
+            return {"message": "All buses are out of station", "buses": [], "all_out_of_station": True}
+
+        return {"message": "No active bus trips at the moment", "buses": [], "all_out_of_station": False}
 
-        all_out = all(v.is_out_of_station for v in all_buses)
-        if all_out:
-            return Response({"message": "All buses are out of station", "buses": [], "all_out_of_station": True})
+class BusPositionStreamView(View):
+    """
+    Server-Sent Events feed of bus positions as they are ingested (ASGI only).
+    Clients load ``public/buses/`` once, then apply ``position`` events.
+    """
+
+    async def get(self, request):
+        subscription = hub.subscribe(BUS_POSITIONS)
+
+        async def stream():
+            deadline = time.monotonic() + settings.GPS_STREAM_MAX_SECONDS
+            try:
+                yield b"retry: 3000\n\n"
+                while time.monotonic() < deadline:
+                    try:
+                        payloads = await asyncio.wait_for(
+                            subscription.get(), timeout=settings.GPS_STREAM_KEEPALIVE
+                        )
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                        continue
+                    yield b"".join(payloads)
+            finally:
+                hub.unsubscribe(BUS_POSITIONS, subscription)
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class BusETAListView(APIView):
+    """ETAs from every running bus to one user location, soonest first."""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        point = _point(request.query_params, 'user_lat', 'user_lng')
+        if point is None:
+            return Response({"detail": "user_lat and user_lng required"}, status=400)
+
+        # the public bus snapshot already has the live location of every running bus
+        buses = bus_snapshot.get(ActiveBusesView.build).data['buses']
+        located, unlocated = [], []
+        for bus in buses:
+            location = bus['location']
+            (located if location and 'lat' in location and 'lng' in location else unlocated).append(bus)
+        lats = [b['location']['lat'] for b in located]
+        lngs = [b['location']['lng'] for b in located]
+        distances = calculate_distances(point[0], point[1], lats, lngs)
+        etas = eta_engine.estimate_many(lats, lngs, point[0], point[1], 40)  # BUS_SPEED_LIMIT
+
+        ranked = sorted(
+            (
+                {
+                    "trip_id": bus['trip_id'],
+                    "vehicle_id": bus['vehicle_id'],
+                    "vehicle_number": bus['vehicle_number'],
+                    "driver_name": bus['driver_name'],
+                    "bus_location": bus['location'],
+                    "distance_km": round(float(distance), 2),
+                    "eta_minutes": round(float(eta), 1),
+                }
+                for bus, distance, eta in zip(located, distances, etas)
+            ),
+            key=lambda bus: bus['eta_minutes'],
+        )
+        # running but no fix yet
+        ranked += [
+            {
+                "trip_id": bus['trip_id'],
+                "vehicle_id": bus['vehicle_id'],
+                "vehicle_number": bus['vehicle_number'],
+                "driver_name": bus['driver_name'],
+                "bus_location": None,
+                "distance_km": None,
+                "eta_minutes": None,
+            }
+            for bus in unlocated
+        ]
+
+        return Response({
+            "user_location": {"lat": point[0], "lng": point[1]},
+            "speed_assumed_kmh": 40,
+            "buses": ranked,
+        })
 
-        return Response({"message": "No active bus trips at the moment", "buses": [], "all_out_of_station": False})
 
 class BusETAView(APIView):
     permission_classes = [AllowAny]
@@ -709,15 +1186,19 @@ class BusETAView(APIView):
         except Vehicle.DoesNotExist:
             return Response({"detail": "Bus not found"}, status=404)
         
-        if not vehicle.current_location:
+        loc = live_store.location_for(vehicle)
+        if not loc:
             return Response({"eta_minutes": None, "message": "Bus location not available"})
-        
-        loc = vehicle.current_location
+
         distance = calculate_distance(
             float(loc.get('lat', 0)), float(loc.get('lng', 0)),
             float(user_lat), float(user_lng)
         )
-        eta = calculate_eta(distance, 40)  # BUS_SPEED_LIMIT
+        eta = eta_engine.estimate(
+            float(loc.get('lat', 0)), float(loc.get('lng', 0)),
+            float(user_lat), float(user_lng),
+            40  # BUS_SPEED_LIMIT
+        )
         
         return Response({
             "bus_location": loc,
@@ -730,11 +1211,130 @@ class BusETAView(APIView):
 
 class AvailableAmbulancesView(APIView):
     permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        lat, lng = request.query_params.get('lat'), request.query_params.get('lng')
+        if lat is None and lng is None:
+            return snapshot_response(request, ambulance_snapshot, self.build, "ambulances", "id")
+
+        # ?lat=&lng= → closest first, with distance_km (not cacheable as bytes)
+        point = _point(request.query_params)
+        if point is None:
+            return Response({"detail": "lat and lng must be numbers"}, status=400)
+        snapshot = ambulance_snapshot.get(self.build)
+        ambulances = {a['id']: a for a in snapshot.data['ambulances']}
+        spatial_index.ensure_seeded()
+        ranked = spatial_index.nearest(*point, k=len(ambulances), include=set(ambulances))
+        distances = {hit['vehicle_id']: round(hit['distance_km'], 3) for hit in ranked}
+        ordered = [{**ambulances[key], "distance_km": distances[key]} for key in distances]
+        # ambulances with no known position go last
+        ordered += [{**a, "distance_km": None} for key, a in ambulances.items() if key not in distances]
+        return Response({"ambulances": ordered, "version": snapshot.data["version"]})
+
+    @staticmethod
+    def build():
+        ambulances = list(Vehicle.objects.filter(vehicle_type='ambulance', assigned_to__isnull=True))
+        data = VehicleSerializer(ambulances, many=True).data
+        # current_location is persisted write-behind; prefer the live one if newer
+        for vehicle, ambulance in zip(ambulances, data):
+            ambulance['current_location'] = live_store.location_for(vehicle)
+        return {"ambulances": data}
+
+
+def _point(params, lat_key='lat', lng_key='lng'):
+    """(lat, lng) floats from a query dict / location JSON, or None."""
+    try:
+        lat, lng = float(params.get(lat_key)), float(params.get(lng_key))
+    except (TypeError, ValueError):
+        return None
+    # also rules out nan / inf
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def _eligible_vehicle_ids(vehicle_type):
+    """Buses on an active trip / unassigned ambulances, from the public snapshots."""
+    if vehicle_type == 'bus':
+        return {b['vehicle_id'] for b in bus_snapshot.get(ActiveBusesView.build).data['buses']}
+    return {a['id'] for a in ambulance_snapshot.get(AvailableAmbulancesView.build).data['ambulances']}
+
+
+class NearbyVehiclesView(APIView):
+    """
+    GET public/vehicles/nearest/?lat=&lng=&vehicle_type=&k=        (k closest)
+    GET public/vehicles/nearby/?lat=&lng=&vehicle_type=&radius_km=  (within radius)
+
+    Only running buses / free ambulances are returned, closest first.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    mode = 'nearest'
+
+    def get(self, request):
+        point = _point(request.query_params)
+        if point is None:
+            return Response({"detail": "lat and lng required"}, status=400)
+        vehicle_type = request.query_params.get('vehicle_type', 'bus')
+        if vehicle_type not in ('bus', 'ambulance'):
+            return Response({"detail": "vehicle_type must be bus or ambulance"}, status=400)
+
+        try:
+            if self.mode == 'nearest':
+                k = min(max(int(request.query_params.get('k', 5)), 1), 50)
+            else:
+                radius_km = float(request.query_params.get('radius_km', 1))
+                # nan / inf / negative would reach the grid maths in spatial_index.within
+                if not (math.isfinite(radius_km) and radius_km > 0):
+                    raise ValueError(radius_km)
+                radius_km = min(radius_km, 50)
+        except ValueError:
+            return Response({"detail": "Invalid k or radius_km"}, status=400)
+
+        spatial_index.ensure_seeded()
+        include = _eligible_vehicle_ids(vehicle_type)
+        if self.mode == 'nearest':
+            hits = spatial_index.nearest(*point, k=k, vehicle_type=vehicle_type, include=include)
+        else:
+            hits = spatial_index.within(*point, radius_km, vehicle_type=vehicle_type, include=include)
+
+        return Response({"vehicles": [
+            {
+                "vehicle_id": hit['vehicle_id'],
+                "vehicle_number": hit['vehicle_number'],
+                "vehicle_type": hit['vehicle_type'],
+                "location": {"lat": hit['lat'], "lng": hit['lng']},
+                "distance_km": round(hit['distance_km'], 3),
+            }
+            for hit in hits
+        ]})
+
+
+class BusStopListView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
 
     def get(self, request):
-        ambulances = Vehicle.objects.filter(vehicle_type='ambulance', assigned_to__isnull=True)
-        serializer = VehicleSerializer(ambulances, many=True)
-        return Response({"ambulances": serializer.data})
+        stops = BusStop.objects.all().order_by('name')
+        route_id = request.query_params.get('route_id')
+        if route_id:
+            stops = stops.filter(route_stops__route_id=route_id).order_by('route_stops__sequence')
+        return Response({"stops": BusStopSerializer(stops, many=True).data})
+
+
+class StopArrivalsView(APIView):
+    """Upcoming buses at a stop, from the predictions kept up to date by ingestion."""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, stop_id):
+        stop = arrival_predictor.stop(stop_id)
+        if stop is None:
+            stop = BusStop.objects.filter(id=stop_id).values('id', 'name', 'lat', 'lng').first()
+            if stop is None:
+                return Response({"detail": "Stop not found"}, status=404)
+        return Response({"stop": stop, "arrivals": arrival_predictor.arrivals(stop_id)})
 
 
 class MyBookingsView(APIView):
@@ -775,108 +1375,107 @@ class CheckUserView(APIView):
 # GPS & RFID Receiver (device → server)
 # ────────────────────────────────────────────────
 
+def _queue_response(kind, items, message):
+    """Hand validated items to the ingestion queue (GPS_INGEST_ASYNC mode)."""
+    try:
+        ingest_queue.submit(kind, items)
+    except QueueFull:
+        response = Response({"detail": "Ingestion queue full, retry later"}, status=429)
+        response['Retry-After'] = str(settings.GPS_INGEST_RETRY_AFTER)
+        return response
+    return Response({"message": message, "queued": len(items)}, status=202)
+
+
 class ReceiveGPSView(APIView):
     permission_classes = [AllowAny]  # in production → API key or auth
 
     def post(self, request):
-        imei = request.data.get('imei')
-        latitude = request.data.get('latitude')
-        longitude = request.data.get('longitude')
-        speed = request.data.get('speed')
-        timestamp = request.data.get('timestamp')
+        # parse_fix checks required fields (a stationary bus reports speed 0)
+        try:
+            fix = parse_fix(request.data)
+        except InvalidFix as exc:
+            return Response({"detail": str(exc)}, status=400)
 
-        if not all([imei, latitude, longitude, speed]):
-            return Response({"detail": "Missing required fields"}, status=400)
+        if settings.GPS_INGEST_ASYNC:
+            return _queue_response(GPS, [fix], "GPS data queued")
 
-        try:
-            vehicle = Vehicle.objects.get(gps_imei=imei)
-        except Vehicle.DoesNotExist:
-            return Response({"detail": "Vehicle not found for this IMEI"}, status=404)
+        result = apply_fixes([fix])
+        if result['duplicates']:
+            return Response({
+                "message": "Duplicate GPS data ignored",
+                "vehicle_id": str(watermarks.vehicle_id(fix['imei'])),
+            })
 
-        location = {
-            "lat": float(latitude),
-            "lng": float(longitude),
-            "speed": float(speed),
-            "timestamp": timestamp or timezone.now().isoformat()
-        }
-
-        vehicle.current_location = location
-        vehicle.save()
-
-        # Overspeed check (bus only)
-        if vehicle.vehicle_type == 'bus' and float(speed) > 40:  # CAMPUS_SPEED_LIMIT
-            driver_name = vehicle.assigned_driver_name
-            offence = Offence.objects.create(
-                offence_type='bus_overspeed',
-                driver=vehicle.assigned_to,
-                driver_name=driver_name,
-                vehicle=vehicle,
-                vehicle_number=vehicle.vehicle_number,
-                speed=float(speed),
-                speed_limit=40,
-                location=location,
-                is_paid=False
-            )
-            logger.warning(f"Overspeed: {vehicle.vehicle_number} @ {speed} km/h")
-
-        # If ambulance → update active booking ETA
-        if vehicle.vehicle_type == 'ambulance':
-            active_booking = Booking.objects.filter(
-                vehicle=vehicle,
-                status__in=['accepted', 'in_progress']
-            ).first()
-            if active_booking and active_booking.user_location:
-                u_loc = active_booking.user_location
-                dist = calculate_distance(
-                    location['lat'], location['lng'],
-                    u_loc.get('lat', 0), u_loc.get('lng', 0)
-                )
-                eta = calculate_eta(dist, 60)
-                active_booking.eta_minutes = round(eta, 1)
-                active_booking.save()
-                # In real app → socket emit 'eta_update'
+        vehicle = result['vehicles'].get(fix['imei'])
+        if vehicle is None:
+            return Response({"detail": "Vehicle not found for this IMEI"}, status=404)
 
         return Response({"message": "GPS data received", "vehicle_id": str(vehicle.id)})
 
 
+class ReceiveGPSBatchView(APIView):
+    """
+    Buffered trackers flush many fixes (possibly for many IMEIs) at once:
+    {"fixes": [{"imei", "latitude", "longitude", "speed", "timestamp"}, ...]}
+    """
+    permission_classes = [AllowAny]  # in production → API key or auth
+
+    def post(self, request):
+        payload = request.data
+        raw_fixes = payload.get('fixes') if isinstance(payload, dict) else payload
+
+        if not isinstance(raw_fixes, list) or not raw_fixes:
+            return Response({"detail": "fixes (non-empty list) required"}, status=400)
+
+        max_fixes = settings.GPS_BATCH_MAX_FIXES
+        if len(raw_fixes) > max_fixes:
+            return Response({"detail": f"At most {max_fixes} fixes per batch"}, status=400)
+
+        fixes = []
+        rejected = []
+        for index, item in enumerate(raw_fixes):
+            if not isinstance(item, dict):
+                rejected.append({"index": index, "detail": "Fix must be an object"})
+                continue
+            try:
+                fixes.append(parse_fix(item))
+            except InvalidFix as exc:
+                rejected.append({"index": index, "detail": str(exc)})
+
+        if settings.GPS_INGEST_ASYNC and fixes:
+            response = _queue_response(GPS, fixes, "GPS batch queued")
+            response.data["rejected"] = rejected
+            return response
+
+        result = apply_fixes(fixes)
+
+        return Response({
+            "message": "GPS batch received",
+            "accepted": result['applied'],
+            "duplicates": result['duplicates'],
+            "late": result['late'],
+            "rejected": rejected,
+            "unknown_imeis": result['unknown_imeis'],
+        })
+
+
 class ReceiveRFIDScanView(APIView):
     permission_classes = [AllowAny]  # → secure in production
 
     def post(self, request):
-        rfid_device_id = request.data.get('rfid_device_id')
-        student_registration_id = request.data.get('student_registration_id')
-        student_name = request.data.get('student_name')
-        phone = request.data.get('phone')
-        speed = request.data.get('speed')
-        timestamp = request.data.get('timestamp')
+        try:
+            scan = parse_rfid_scan(request.data)
+        except InvalidFix as exc:
+            return Response({"detail": str(exc)}, status=400)
 
-        if not all([rfid_device_id, student_registration_id, speed]):
-            return Response({"detail": "Missing required fields"}, status=400)
+        if settings.GPS_INGEST_ASYNC:
+            return _queue_response(RFID, [scan], "Scan queued")
 
-        try:
-            device = RFIDDevice.objects.get(rfid_id=rfid_device_id)
-        except RFIDDevice.DoesNotExist:
+        result = apply_rfid_scans([scan])
+        if result['unknown_devices']:
             return Response({"detail": "RFID device not registered"}, status=404)
 
-        if float(speed) > 40:  # CAMPUS_SPEED_LIMIT
-            try:
-                student = User.objects.get(registration_id=student_registration_id)
-            except User.DoesNotExist:
-                student = None
-
-            Offence.objects.create(
-                offence_type='student_speed',
-                student=student,
-                student_name=student_name,
-                student_registration_id=student_registration_id,
-                phone=phone,
-                speed=float(speed),
-                speed_limit=40,
-                location={"name": device.location_name},
-                rfid_number=rfid_device_id,
-                is_paid=False
-            )
-            logger.warning(f"Student speed violation: {student_name} @ {speed} km/h")
+        if result['violations']:
             return Response({"message": "Speed violation recorded"})
 
-        return Response({"message": "Scan recorded, no violation"})
\ No newline at end of file
+        return Response({"message": "Scan recorded, no violation"})
@@ -0,0 +1,138 @@
+# core/watermarks.py
+"""
+Per-IMEI high watermark of the newest applied fix.
+
+The watermark is the (device timestamp, sequence) of the newest fix that
+reached live state. Incoming fixes are classified against it:
+
+* duplicate - already seen (equal to the watermark or among the recently
+  applied keys); dropped before any DB work.
+* late      - older than the watermark; kept in the position history only
+  so live state never moves backwards.
+* new       - advances the watermark and updates live state.
+
+``classify`` only reads the table; ``apply_fixes`` calls ``advance`` once
+the batch's transaction has committed, so fixes of a failed batch are not
+mistaken for duplicates when the device retransmits them.
+
+Watermarks are kept in memory and persisted with the live location
+(``Vehicle.last_fix_at`` / ``last_fix_seq``); an IMEI this process has not
+seen yet is seeded from its vehicle row. Fixes stamped more than
+``GPS_MAX_FUTURE_SKEW`` seconds ahead of the server clock are rejected by
+``parse_fix``, and a stored watermark that far ahead is ignored, so one bad
+device clock reading cannot freeze a vehicle's live position.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import metrics
+
+NEW, LATE, DUPLICATE = 'new', 'late', 'duplicate'
+
+metrics.register_rate('gps.dedupe_rate', 'gps.fixes.duplicate', 'gps.fixes.received')
+metrics.register_rate('gps.late_rate', 'gps.fixes.late', 'gps.fixes.received')
+
+
+def fix_key(fix):
+    return (fix['imei'], fix['recorded_at'], fix.get('seq'))
+
+
+def _order(recorded_at, seq):
+    return (recorded_at, -1 if seq is None else seq)
+
+
+class WatermarkTable:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._marks = {}           # imei -> (recorded_at, seq)
+        self._vehicle_ids = {}     # imei -> vehicle id
+        self._recent = OrderedDict()
+
+    def drop_duplicates(self, fixes):
+        """Cheap pre-DB pass: drop repeats of recently applied fixes and of each other."""
+        metrics.incr('gps.fixes.received', len(fixes))
+        kept = []
+        seen = set()
+        with self._lock:
+            for fix in fixes:
+                key = fix_key(fix)
+                mark = self._marks.get(fix['imei'])
+                if key in seen or key in self._recent or (
+                    mark is not None and _order(*mark) == _order(fix['recorded_at'], fix.get('seq'))
+                ):
+                    continue
+                seen.add(key)
+                kept.append(fix)
+        duplicates = len(fixes) - len(kept)
+        if duplicates:
+            metrics.incr('gps.fixes.duplicate', duplicates)
+        return kept, duplicates
+
+    def classify(self, vehicle, fixes):
+        """
+        Split one vehicle's fixes (sorted oldest first) into ``(new, late,
+        duplicates)``. Nothing is recorded until ``advance``.
+        """
+        imei = vehicle.gps_imei
+        new, late, duplicates = [], [], 0
+        with self._lock:
+            if imei not in self._marks and vehicle.last_fix_at is not None:
+                self._marks[imei] = (vehicle.last_fix_at, vehicle.last_fix_seq)
+            self._vehicle_ids[imei] = vehicle.id
+            mark = self._marks.get(imei)
+            if mark is not None and mark[0] > timezone.now() + timedelta(seconds=settings.GPS_MAX_FUTURE_SKEW):
+                # left by a device clock glitch (e.g. before GPS lock); don't let it freeze live state
+                del self._marks[imei]
+                mark = None
+
+            for fix in fixes:
+                order = _order(fix['recorded_at'], fix.get('seq'))
+                if mark is None or order > _order(*mark):
+                    new.append(fix)
+                    mark = (fix['recorded_at'], fix.get('seq'))
+                elif order == _order(*mark):
+                    duplicates += 1
+                else:
+                    late.append(fix)
+
+        if late:
+            metrics.incr('gps.fixes.late', len(late))
+        if duplicates:
+            metrics.incr('gps.fixes.duplicate', duplicates)
+        return new, late, duplicates
+
+    def advance(self, imei, new, late):
+        """Record a vehicle's classified fixes as applied (after their batch committed)."""
+        with self._lock:
+            if new:
+                last = new[-1]
+                mark = self._marks.get(imei)
+                order = _order(last['recorded_at'], last.get('seq'))
+                if mark is None or order > _order(*mark):
+                    self._marks[imei] = (last['recorded_at'], last.get('seq'))
+            for fix in late + new:
+                self._remember(fix_key(fix))
+
+    def _remember(self, key):
+        self._recent[key] = None
+        if len(self._recent) > settings.GPS_DEDUPE_WINDOW:
+            self._recent.popitem(last=False)
+
+    def get(self, imei):
+        return self._marks.get(imei)
+
+    def vehicle_id(self, imei):
+        return self._vehicle_ids.get(imei)
+
+    def reset(self):
+        with self._lock:
+            self._marks.clear()
+            self._vehicle_ids.clear()
+            self._recent.clear()
+
+
+watermarks = WatermarkTable()
@@ -0,0 +1,113 @@
+# core/websockets.py
+"""
+Raw ASGI WebSocket endpoints (routed from ITS_backend/asgi.py).
+
+``/ws/bookings/<booking_id>/?token=<access token>`` pushes ``eta_update``
+messages (ETA and ambulance position) for one booking as ambulance fixes are
+ingested, replacing polling of ``public/my-bookings/``. The student who made
+the booking, its driver and admins may subscribe. Updates come through
+``core.pubsub``, latest-value-wins, so a slow socket never queues up more
+than the newest update.
+
+Close codes: 4401 bad/missing token, 4403 not your booking, 4404 unknown
+path or booking.
+"""
+import asyncio
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import UUIDJWTAuthentication
+from .live_state import live_store
+from .models import Booking
+from .pubsub import booking_topic, hub, ws_message
+
+BOOKING_PATH = re.compile(r'^/ws/bookings/(?P<booking_id>[0-9a-fA-F-]{36})/?$')
+
+
+class SocketRejected(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def _authorize_booking(token, booking_id):
+    """Return the booking's first ``eta_update`` message or raise ``SocketRejected``."""
+    close_old_connections()
+    try:
+        auth = UUIDJWTAuthentication()
+        try:
+            user = auth.get_user(auth.get_validated_token(token))
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            raise SocketRejected(4401)
+
+        booking = Booking.objects.select_related('vehicle').filter(id=booking_id).first()
+        if booking is None:
+            raise SocketRejected(4404)
+        if user.role != 'admin' and booking.phone != user.phone and booking.driver_id != user.id:
+            raise SocketRejected(4403)
+
+        return ws_message('eta_update', {
+            'booking_id': str(booking.id),
+            'status': booking.status,
+            'eta_minutes': booking.eta_minutes,
+            'vehicle_location': live_store.location_for(booking.vehicle) if booking.vehicle else None,
+        })
+    finally:
+        close_old_connections()
+
+
+async def websocket_application(scope, receive, send):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+
+    match = BOOKING_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    token = query.get('token', [''])[0]
+    if not token:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+
+    try:
+        initial = await sync_to_async(_authorize_booking)(token, match['booking_id'])
+    except SocketRejected as exc:
+        await send({'type': 'websocket.close', 'code': exc.code})
+        return
+
+    await send({'type': 'websocket.accept'})
+    await send({'type': 'websocket.send', 'text': initial.decode()})
+    await _pump(booking_topic(match['booking_id']), receive, send)
+
+
+async def _pump(topic, receive, send):
+    """Forward published updates until the client disconnects."""
+    subscription = hub.subscribe(topic)
+    receiver = asyncio.ensure_future(receive())
+    getter = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                for payload in getter.result():
+                    await send({'type': 'websocket.send', 'text': payload.decode()})
+            if receiver in done:
+                if receiver.result()['type'] == 'websocket.disconnect':
+                    return
+                # clients have nothing to say on this channel; ignore it
+                receiver = asyncio.ensure_future(receive())
+            if not getter.done():
+                getter.cancel()
+    finally:
+        hub.unsubscribe(topic, subscription)
+        for task in (receiver, getter):
+            if task is not None and not task.done():
+                task.cancel()